@@ -4,15 +4,25 @@ Flask API for Nexus - AI-powered text-based RPG engine.
 Provides RESTful endpoints for game interaction and session management.
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import logging
+import math
 import os
 from typing import Dict, Any, Optional
 import unicodedata
+import queue
 
 from game_system_api import GameSystem
 from llm_stats_tracker import get_global_stats_tracker
+import output_channel
+from chat_jobs import ChatJobManager
+from request_coalescer import RequestCoalescer, OUTCOME_EXECUTED
+from llm_scheduler import get_llm_scheduler, LaneSaturatedError, LANE_TURNS
+from llm_rate_limiter import get_rate_limiter
+from llm_client import get_llm_client
+from content_cache import get_content_cache
+from prompt_templates import get_prompt_template_cache
 import json
 from datetime import datetime
 
@@ -42,6 +52,17 @@ logger = logging.getLogger(__name__)
 # Global game system instance
 game_system: Optional[GameSystem] = None
 
+# Background pool for /api/chat submit-and-poll turns
+chat_job_manager = ChatJobManager()
+
+# Duplicate /api/chat and /sense requests (LSL retries) share one execution and replay its result.
+# Explicit request ids are honoured for NEXUS_IDEMPOTENCY_TTL seconds; without one, an identical
+# (player, npc, area, message) request within NEXUS_DUPLICATE_WINDOW seconds counts as a retry.
+IDEMPOTENCY_TTL = float(os.getenv('NEXUS_IDEMPOTENCY_TTL', '120'))
+DUPLICATE_WINDOW = float(os.getenv('NEXUS_DUPLICATE_WINDOW', '10'))
+request_coalescer = RequestCoalescer(default_ttl=DUPLICATE_WINDOW,
+                                     cacheable=lambda result: result[1] < 500)
+
 # Version management
 # Format: MAJOR.MINOR.PATCH
 # - MAJOR: Breaking changes
@@ -388,6 +409,8 @@ def index():
             'health': '/health',
             'version': '/version',
             'chat': '/api/chat',
+            'chat_stream': '/api/chat/stream',
+            'chat_job': '/api/chat/job/<job_id>',
             'commands': '/api/commands',
             'player': '/api/player/<player_id>/*',
             'game': '/api/game/*',
@@ -409,6 +432,7 @@ def health_check():
     # Current server time
     current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
+    llm_client = get_llm_client()
     return jsonify({
         'status': 'healthy',
         'service': 'nexus-api',
@@ -417,6 +441,19 @@ def health_check():
         'app_last_modified': app_modified,
         'process_id': os.getpid(),
         'uptime': 'n/a',  # Could be implemented with start time tracking
+        'chat_jobs': chat_job_manager.stats(),
+        'idempotency': request_coalescer.stats(),
+        'llm_lanes': get_llm_scheduler().stats(),
+        'llm_client': llm_client.stats() if llm_client else 'disabled',
+        'llm_breakers': get_global_stats_tracker().get_breaker_states(),
+        'llm_hedging': {'issued': get_global_stats_tracker().hedge_count, 'won': get_global_stats_tracker().hedge_wins},
+        'llm_cache': {'hits': get_global_stats_tracker().cache_hits, 'misses': get_global_stats_tracker().cache_misses},
+        'llm_prompt_cache': get_global_stats_tracker().get_prompt_cache_stats(),
+        'llm_rate_limits': get_rate_limiter().stats(),
+        'llm_cancellations': get_global_stats_tracker().get_cancellation_stats(),
+        'speculation': get_global_stats_tracker().get_speculation_stats(),
+        'content_cache': get_content_cache().stats(),
+        'prompt_templates': get_prompt_template_cache().stats(),
         'last_change': VERSION_CHANGELOG.get(VERSION, 'Unknown')
     })
 
@@ -792,7 +829,8 @@ Provide specific examples from the conversations to support your analysis. Keep
             messages=messages,
             model_name=analysis_model,
             stream=False,
-            collect_stats=True
+            collect_stats=True,
+            usage_type="analysis"
         )
         
         if not analysis_result or analysis_result.startswith("[Errore"):
@@ -844,38 +882,78 @@ def get_conversation_analysis(player_id: str):
         logger.error(f"Error getting conversation analysis for {player_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/chat', methods=['POST'])
-def chat_with_npc():
-    """Direct chat endpoint for NPC interaction."""
-    try:
-        if not game_system:
-            return jsonify({'error': GAME_SYSTEM_NOT_INITIALIZED}), 500
-        
-        data = request.get_json()
-        if not data or 'message' not in data:
-            return jsonify({'error': 'Missing message field'}), 400
-        
-        # Accept both player_id (UUID) and display_name, fallback for legacy clients
-        player_id = data.get('player_id') or data.get('player_name') or data.get('name')
-        display_name = data.get('display_name', player_id)
-        message = data['message']
-        npc_name = data.get('npc_name')  # Optional NPC name parameter
-        area = data.get('area')  # Optional area parameter
+def _idempotency_key(data: Optional[Dict[str, Any]], endpoint: str, *turn_fields):
+    """
+    Returns (key, ttl) identifying a retried request: the client's Idempotency-Key header
+    or `request_id` field when present, otherwise the turn content itself.
+    """
+    request_id = request.headers.get('Idempotency-Key') or (data or {}).get('request_id')
+    if request_id:
+        return (endpoint, 'id', str(request_id)), IDEMPOTENCY_TTL
+    return (endpoint, 'auto') + tuple(turn_fields), DUPLICATE_WINDOW
 
-        # Validate player_id
-        if not player_id or not isinstance(player_id, str) or len(player_id.strip()) == 0:
-            return jsonify({'error': 'Invalid player_id: must be a non-empty string'}), 400
-        player_id = player_id.strip()
-        
-        # Get player system
-        player_system = game_system.get_player_system(player_id)
-        
+
+def _idempotent_response(payload: Dict[str, Any], status: int, outcome: str):
+    response = jsonify(payload)
+    if outcome != OUTCOME_EXECUTED:
+        response.headers['X-Idempotent-Replay'] = outcome
+    if status == 503 and 'retry_after' in payload:
+        response.headers['Retry-After'] = str(payload['retry_after'])
+    return response, status
+
+
+def _run_on_turn_lane(turn_func, **kwargs):
+    """Runs a chat turn on the bounded turns lane (raises LaneSaturatedError when full).
+    The turn's own LLM calls go to the interactive/nlp lanes, so they never queue behind it."""
+    return get_llm_scheduler().run(LANE_TURNS, output_channel.bind_current_context(turn_func), **kwargs)
+
+
+def _saturated_response(error: LaneSaturatedError):
+    logger.warning(f"[BACKPRESSURE] {error}")
+    response = jsonify({'error': 'Server busy, please retry', 'retry_after': error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
+def _parse_chat_request(data: Optional[Dict[str, Any]]):
+    """Validates an /api/chat style payload. Returns (fields, error_response)."""
+    if not data or 'message' not in data:
+        return None, (jsonify({'error': 'Missing message field'}), 400)
+
+    # Accept both player_id (UUID) and display_name, fallback for legacy clients
+    player_id = data.get('player_id') or data.get('player_name') or data.get('name')
+
+    # Validate player_id
+    if not player_id or not isinstance(player_id, str) or len(player_id.strip()) == 0:
+        return None, (jsonify({'error': 'Invalid player_id: must be a non-empty string'}), 400)
+
+    return {
+        'player_id': player_id.strip(),
+        'display_name': data.get('display_name', player_id),
+        'message': data['message'],
+        'npc_name': data.get('npc_name'),  # Optional NPC name parameter
+        'area': data.get('area'),  # Optional area parameter
+    }, None
+
+
+def _run_chat_turn(player_id: str, display_name: str, message: str,
+                   npc_name: Optional[str] = None, area: Optional[str] = None,
+                   stream_tokens: bool = False):
+    """
+    Runs one chat turn for a player (optional /go and /talk first, then the message)
+    and builds the LSL-ready payload. Returns (payload, http_status).
+    With stream_tokens=True the dialogue is generated in streaming mode so a bound
+    output_channel token listener receives tokens as they arrive.
+    """
+    # Turns for the same player are serialized
+    player_system, queue_wait = game_system.acquire_player_turn(player_id)
+    try:
         # Ensure player_system is valid
         if not player_system:
-            return jsonify({
+            return {
                 'error': f'Could not create or retrieve player system for: {player_id}'
-            }), 500
-        
+            }, 500
+    
         # If area is specified, go to that area first
         if area:
             go_command = f"/go {area}"
@@ -885,15 +963,15 @@ def chat_with_npc():
                 area_response = player_system.process_player_input(go_command, skip_profile_update=True)
                 logger.info(f"[DEBUG] player_system.game_state after /go: {type(player_system.game_state)}, is None: {player_system.game_state is None}")
                 if not area_response:
-                    return jsonify({
+                    return {
                         'error': f'Invalid response when trying to go to area: {area}'
-                    }), 500
+                    }, 500
             except Exception as e:
                 logger.error(f"[DEBUG] Exception in /go command for area {area}: {str(e)}", exc_info=True)
-                return jsonify({
+                return {
                     'error': f'Error going to area {area}: {str(e)}'
-                }), 500
-        
+                }, 500
+    
         # If NPC name is specified, check if we need to switch to that NPC
         if npc_name:
             # Check if we're already talking to this NPC
@@ -910,15 +988,15 @@ def chat_with_npc():
                 try:
                     switch_response = player_system.process_player_input(talk_command, skip_profile_update=True)
                 except Exception as e:
-                    return jsonify({
+                    return {
                         'error': f'Error switching to NPC {npc_name}: {str(e)}'
-                    }), 500
+                    }, 500
 
                 # Ensure switch_response is not None
                 if not switch_response:
-                    return jsonify({
+                    return {
                         'error': f'Invalid response when trying to switch to NPC: {npc_name}'
-                    }), 500
+                    }, 500
 
                 # Check if the switch was successful
                 switched_npc_name = switch_response.get('current_npc_name') or ''
@@ -932,26 +1010,38 @@ def chat_with_npc():
                     any(word.startswith(npc_name_lower) for word in switched_lower.split())
                 )
                 if not npc_match and switched_npc_name == '':
-                    return jsonify({
+                    return {
                         'error': f'Could not find or switch to NPC: {npc_name}',
                         'available_npcs': switch_response.get('system_messages', [])
-                    }), 400
+                    }, 400
             else:
                 logger.info(f"Already talking to {npc_name}, continuing conversation")
-        
+    
         # Process the actual chat message
         try:
-            response = player_system.process_player_input(message)
+            if stream_tokens:
+                player_system.game_state['use_stream'] = True
+            try:
+                response = player_system.process_player_input(message)
+            finally:
+                if stream_tokens and player_system.game_state:
+                    player_system.game_state['use_stream'] = False
         except Exception as e:
-            return jsonify({
+            return {
                 'error': f'Error processing message: {str(e)}'
-            }), 500
+            }, 500
 
         # Ensure response is not None
         if not response:
-            return jsonify({
+            return {
                 'error': 'Invalid response from game system'
-            }), 500
+            }, 500
+
+        if response.get('retry_after') is not None:
+            # Every model of the chain was rate-limited: nothing was said, the client should resend later
+            retry_after = max(1, math.ceil(response['retry_after']))
+            logger.warning(f"[RATE-LIMIT] No model capacity for {player_id}'s turn, retry after {retry_after}s")
+            return {'error': 'All models are rate limited, please retry', 'retry_after': retry_after}, 503
 
         # Handle case where command was processed but no NPC response was generated
         # In this case, make the NPC present the system messages naturally
@@ -979,7 +1069,7 @@ def chat_with_npc():
                         # Join multiple messages in a natural way
                         messages_text = ". ".join(formatted_messages)
                         npc_response = f"*{npc_name} ti informa* {messages_text}"
-        
+    
         # Generate Second Life commands if there's a current NPC
         sl_commands = ""
         try:
@@ -1004,7 +1094,7 @@ def chat_with_npc():
                 # Check if teleport is to another NPC (not current NPC)
                 teleport_target_npc_name = player_system.game_state.get('teleport_target_npc') if player_system.game_state else None
                 npc_for_teleport = current_npc
-                
+            
                 if teleport_offered and teleport_target_npc_name:
                     npc_for_teleport = get_teleport_npc_data(game_system, current_npc, teleport_target_npc_name)
                     # Clear the teleport_target_npc after use
@@ -1026,12 +1116,12 @@ def chat_with_npc():
         except Exception as sl_error:
             logger.warning(f"Error generating SL commands: {str(sl_error)}")
             sl_commands = ""
-        
+    
         # Get LLM statistics with better formatting
         stats_tracker = get_global_stats_tracker()
         llm_stats = {}
         total_llm_time = 0
-        
+    
         # Get stats for each model type with clearer metrics (excluding async profile analysis)
         for model_type in ['dialogue', 'guide_selection', 'command_interpretation']:
             type_stats = stats_tracker.type_stats.get(model_type)
@@ -1039,31 +1129,34 @@ def chat_with_npc():
                 last_call = type_stats.last_call_stats
                 call_time = round(last_call.total_time, 3) if last_call else 0
                 total_llm_time += call_time
-                
+            
                 llm_stats[model_type] = {
                     'model': type_stats.current_model,
                     'last_call_time_ms': int(call_time * 1000),
                     'last_tokens_in': last_call.input_tokens if last_call else 0,
                     'last_tokens_out': last_call.output_tokens if last_call else 0,
                     'tokens_per_sec': round(last_call.output_tokens / last_call.total_time, 1) if last_call and last_call.total_time > 0 else 0,
+                    'last_history_tokens_trimmed': last_call.history_tokens_trimmed if last_call else 0,
+                    'last_cached_tokens': last_call.cached_tokens if last_call else 0,
                     'session_calls': type_stats.total_calls,
                     'session_time_ms': int(type_stats.total_time * 1000)
                 }
-        
+    
         # Add performance summary (without async profile analysis)
         llm_stats['summary'] = {
             'total_llm_time_ms': int(total_llm_time * 1000),
             'active_calls': len([k for k in llm_stats.keys() if k != 'summary']),
+            'queue_wait_ms': int(queue_wait * 1000),
             'performance_note': 'Response time optimized with async profile analysis'
         }
-        
+    
         # Defensive None checks before normalizing
         if npc_response is None:
             npc_response = "[No response generated]"
         if sl_commands is None:
             sl_commands = ""
 
-        return jsonify({
+        return {
             'player_id': player_id,
             'display_name': display_name,
             'player_message': message,
@@ -1074,15 +1167,122 @@ def chat_with_npc():
             'current_npc': response.get('current_npc_name'),
             'current_area': response.get('current_area'),
             'llm_stats': llm_stats
-        })
+        }, 200
+    finally:
+        game_system.release_player_turn(player_id)
+
+
+@app.route('/api/chat', methods=['POST'])
+def chat_with_npc():
+    """Direct chat endpoint for NPC interaction."""
+    try:
+        if not game_system:
+            return jsonify({'error': GAME_SYSTEM_NOT_INITIALIZED}), 500
+        
+        data = request.get_json()
+        fields, error_response = _parse_chat_request(data)
+        if error_response:
+            return error_response
+
+        idempotency_key, idempotency_ttl = _idempotency_key(
+            data, 'chat', fields['player_id'], fields['npc_name'], fields['area'], fields['message']
+        )
+
+        # Submit-and-poll mode for clients that cannot wait for the whole turn (LSL HttpTimeout)
+        if str(data.get('async', '')).lower() in ('1', 'true', 'yes'):
+            job, created = chat_job_manager.submit(lambda: _run_on_turn_lane(_run_chat_turn, **fields),
+                                                   dedupe_key=idempotency_key)
+            if not created:
+                logger.info(f"[CHAT-JOB] Resubmitted turn for {fields['player_id']} attached to job {job.job_id}")
+            return jsonify({
+                'job_id': job.job_id,
+                'status': job.status,
+                'poll_url': f"/api/chat/job/{job.job_id}",
+                'player_id': fields['player_id']
+            }), 202
+
+        (payload, status), outcome = request_coalescer.run(
+            idempotency_key, lambda: _run_on_turn_lane(_run_chat_turn, **fields), ttl=idempotency_ttl
+        )
+        if outcome != OUTCOME_EXECUTED:
+            logger.info(f"[IDEMPOTENCY] Duplicate chat request for {fields['player_id']} served ({outcome})")
+        return _idempotent_response(payload, status, outcome)
     
+    except LaneSaturatedError as e:
+        return _saturated_response(e)
     except Exception as e:
-        player_name_for_log = locals().get('player_name', 'unknown_player')
+        player_name_for_log = locals().get('fields') or 'unknown_player'
         import traceback
         logger.error(f"Error in chat for {player_name_for_log}: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({'error': str(e)}), 500
 
+
+@app.route('/api/chat/job/<job_id>', methods=['GET'])
+def get_chat_job(job_id: str):
+    """Poll endpoint for /api/chat async jobs. The finished payload is under `result`."""
+    job = chat_job_manager.get(job_id)
+    if not job:
+        return jsonify({'job_id': job_id, 'status': 'expired',
+                        'error': 'Unknown or expired job'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_with_npc_stream():
+    """
+    Streaming variant of /api/chat (Server-Sent Events).
+    Emits `token` events ({"text": ...}) while the NPC reply is generated, then one
+    `done` event carrying the same payload /api/chat returns (post-processed text,
+    sl_commands, llm_stats). Raw tokens may still contain tags such as [GIVEN_ITEMS:]:
+    clients should replace the streamed text with `done.npc_response`.
+    """
+    if not game_system:
+        return jsonify({'error': GAME_SYSTEM_NOT_INITIALIZED}), 500
+
+    fields, error_response = _parse_chat_request(request.get_json())
+    if error_response:
+        return error_response
+
+    events: "queue.Queue" = queue.Queue()
+
+    def relay_token(text):
+        events.put(('token', {'text': text}))
+
+    def run_turn_with_tokens():
+        with output_channel.token_listener(relay_token):
+            return _run_chat_turn(stream_tokens=True, **fields)
+
+    # Admission happens before the stream opens so a saturated server can still answer 503
+    try:
+        turn_future = get_llm_scheduler().submit(LANE_TURNS, run_turn_with_tokens)
+    except LaneSaturatedError as e:
+        return _saturated_response(e)
+
+    def finish_stream(future):
+        try:
+            payload, status = future.result()
+            events.put(('done' if status == 200 else 'error', payload))
+        except Exception as e:
+            logger.error(f"Error in streaming chat for {fields['player_id']}: {str(e)}", exc_info=True)
+            events.put(('error', {'error': str(e)}))
+        finally:
+            events.put(None)
+
+    turn_future.add_done_callback(finish_stream)
+
+    def generate():
+        while True:
+            item = events.get()
+            if item is None:
+                break
+            event, data = item
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/api', methods=['GET'])
 def api_info():
     """API information endpoint."""
@@ -1185,27 +1385,11 @@ def get_available_commands():
         logger.error(f"Error getting commands: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/sense', methods=['POST'])
-def sense_player():
-    """Handle player arrival - NPC notices and greets the player."""
+def _run_sense_turn(player_id: str, display_name: str, npc_name: str, area: str):
+    """Runs a /sense arrival for a player and builds the greeting payload. Returns (payload, http_status)."""
+    # Turns for the same player are serialized
+    player_system, queue_wait = game_system.acquire_player_turn(player_id)
     try:
-        if not game_system:
-            return jsonify({'error': GAME_SYSTEM_NOT_INITIALIZED}), 500
-        
-        data = request.get_json()
-        # Accept both player_id (UUID) and display_name, fallback for legacy clients
-        player_id = data.get('player_id') or data.get('player_name') or data.get('name')
-        display_name = data.get('display_name', player_id)
-        if not player_id or not isinstance(player_id, str) or len(player_id.strip()) == 0:
-            return jsonify({'error': 'Invalid player_id: must be a non-empty string'}), 400
-        player_id = player_id.strip()
-        
-        npc_name = data.get('npcname', '').strip()
-        area = data.get('area', '').strip()
-        
-        # Get player system
-        player_system = game_system.get_player_system(player_id)
-        
         # Check if player has a current area, if not, set default starting area
         current_area = player_system.game_state.get('current_area') if player_system.game_state else None
         if not current_area:
@@ -1271,23 +1455,24 @@ def sense_player():
 
                     logger.info(f"Directly set NPC {npc_name} for player {player_id} in area {current_area}")
                 else:
-                    return jsonify({
+                    return {
                         'error': f'Could not find NPC {npc_name} in area {current_area}'
-                    }), 400
+                    }, 400
                     
             except Exception as e:
-                return jsonify({
+                return {
                     'error': f'Error setting NPC {npc_name}: {str(e)}'
-                }), 500
+                }, 500
         
         # Get current NPC info
         current_npc = player_system.game_state.get('current_npc') if player_system.game_state else None
         if not current_npc:
-            return jsonify({
+            return {
                 'npc_response': normalize_text_for_lsl(f"No NPC is currently present to notice {display_name}'s arrival."),
                 'player_id': player_id,
-                'display_name': display_name
-            })
+                'display_name': display_name,
+                'queue_wait_ms': int(queue_wait * 1000)
+            }, 200
         
         current_npc_name = current_npc.get('name', 'Unknown NPC')
         
@@ -1352,15 +1537,44 @@ def sense_player():
             logger.warning(f"Error generating SL commands in sense: {str(sl_error)}")
             sl_commands = ""
         
-        return jsonify({
+        return {
             'npc_response': normalize_text_for_lsl(npc_response),
             'npc_name': current_npc_name,
             'player_id': player_id,
             'display_name': display_name,
             'current_area': response.get('current_area'),
             'sl_commands': normalize_text_for_lsl(sl_commands),
-            'system_messages': response.get('system_messages', [])
-        })
+            'system_messages': response.get('system_messages', []),
+            'queue_wait_ms': int(queue_wait * 1000)
+        }, 200
+    finally:
+        game_system.release_player_turn(player_id)
+
+
+@app.route('/sense', methods=['POST'])
+def sense_player():
+    """Handle player arrival - NPC notices and greets the player."""
+    try:
+        if not game_system:
+            return jsonify({'error': GAME_SYSTEM_NOT_INITIALIZED}), 500
+        
+        data = request.get_json()
+        # Accept both player_id (UUID) and display_name, fallback for legacy clients
+        player_id = data.get('player_id') or data.get('player_name') or data.get('name')
+        display_name = data.get('display_name', player_id)
+        if not player_id or not isinstance(player_id, str) or len(player_id.strip()) == 0:
+            return jsonify({'error': 'Invalid player_id: must be a non-empty string'}), 400
+        player_id = player_id.strip()
+        
+        npc_name = data.get('npcname', '').strip()
+        area = data.get('area', '').strip()
+        
+        idempotency_key, idempotency_ttl = _idempotency_key(data, 'sense', player_id, npc_name, area)
+        (payload, status), outcome = request_coalescer.run(
+            idempotency_key, lambda: _run_sense_turn(player_id, display_name, npc_name, area),
+            ttl=idempotency_ttl
+        )
+        return _idempotent_response(payload, status, outcome)
     
     except Exception as e:
         logger.error(f"Error in sense endpoint: {str(e)}")
@@ -1369,6 +1583,7 @@ def sense_player():
 @app.route('/leave', methods=['POST'])
 def leave_player():
     """Handle player departure - save conversation and register player leaving."""
+    turn_player_id = None
     try:
         if not game_system:
             return jsonify({'error': GAME_SYSTEM_NOT_INITIALIZED}), 500
@@ -1383,7 +1598,8 @@ def leave_player():
         
         # Get player system safely
         try:
-            player_system = game_system.get_player_system(player_id)
+            player_system, queue_wait = game_system.acquire_player_turn(player_id)
+            turn_player_id = player_id
             if not player_system or not hasattr(player_system, 'game_state'):
                 return jsonify({
                     'message': f"*{display_name} has left*",
@@ -1453,7 +1669,8 @@ def leave_player():
             'player_id': player_id,
             'display_name': display_name,
             'current_area': current_area,
-            'conversation_saved': conversation_saved
+            'conversation_saved': conversation_saved,
+            'queue_wait_ms': int(queue_wait * 1000)
         })
     
     except Exception as e:
@@ -1468,11 +1685,15 @@ def leave_player():
             'conversation_saved': False,
             'error': str(e)
         }), 500
+    finally:
+        if turn_player_id:
+            game_system.release_player_turn(turn_player_id)
 
 
 @app.route('/api/leave_npc', methods=['POST'])
 def leave_npc_conversation():
     """Handle NPC conversation departure from LSL - save conversation and reset NPC state."""
+    turn_player_id = None
     try:
         if not game_system:
             return jsonify({'error': GAME_SYSTEM_NOT_INITIALIZED}), 500
@@ -1501,7 +1722,8 @@ def leave_npc_conversation():
         
         # Get player system safely
         try:
-            player_system = game_system.get_player_system(player_id)
+            player_system, queue_wait = game_system.acquire_player_turn(player_id)
+            turn_player_id = player_id
             if not player_system or not hasattr(player_system, 'game_state'):
                 return jsonify({
                     'message': f"*{display_name} has left conversation with {npc_name}*",
@@ -1573,7 +1795,8 @@ def leave_npc_conversation():
             'area': current_area,
             'status': status,
             'action': action,
-            'conversation_saved': conversation_saved
+            'conversation_saved': conversation_saved,
+            'queue_wait_ms': int(queue_wait * 1000)
         })
     
     except Exception as e:
@@ -1583,6 +1806,9 @@ def leave_npc_conversation():
             'conversation_saved': False,
             'error': str(e)
         }), 500
+    finally:
+        if turn_player_id:
+            game_system.release_player_turn(turn_player_id)
 
 @app.route('/reset', methods=['POST'])
 def reset_database():
@@ -1603,6 +1829,8 @@ def reset_database():
         
         # Reload NPC and story data
         game_system.db.reload_data()
+        get_content_cache().reload()
+        get_prompt_template_cache().clear()
         
         # Preload NPCs from text files
         npc_preload_success = preload_npcs()
@@ -1626,6 +1854,8 @@ def reload_game_data():
         
         # Reload data
         game_system.db.reload_data()
+        get_content_cache().reload()  # Prompt content files (SYSPROMPT, ANTEFATTO, PREFIX...)
+        get_prompt_template_cache().clear()  # Compiled NPC prompts embed NPC data and the teleport list
         
         return jsonify({
             'success': True,
@@ -1667,4 +1897,5 @@ if __name__ == '__main__':
     debug = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
     
     logger.info(f"Starting Nexus Flask API on port {port}")
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    # Threaded serving is safe: each player's turns are serialized by GameSystem
+    app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
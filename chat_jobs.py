@@ -0,0 +1,115 @@
+# chat_jobs.py
+# Submit-and-poll execution of chat turns for clients with short HTTP timeouts (LSL llHTTPRequest).
+
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChatJob:
+    """A chat turn running (or finished) on the job pool"""
+    job_id: str
+    dedupe_key: Optional[Tuple[Any, ...]]
+    status: str = 'pending'  # pending, running, done, error
+    result: Optional[Dict[str, Any]] = None
+    http_status: int = 200
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            'job_id': self.job_id,
+            'status': self.status,
+            'age_ms': int((time.time() - self.created_at) * 1000),
+        }
+        if self.status == 'done':
+            data['result'] = self.result
+        elif self.status == 'error':
+            data['error'] = self.error or (self.result or {}).get('error', 'Unknown error')
+        return data
+
+
+class ChatJobManager:
+    """
+    Runs chat turns on a bounded worker pool and keeps their results for `ttl` seconds.
+    Resubmitting a turn with the same dedupe key while its job is still running, or
+    finished less than `dedupe_window` seconds ago, returns the existing job instead of
+    recomputing it (LSL retries after HttpTimeout).
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, ttl: Optional[float] = None,
+                 dedupe_window: Optional[float] = None):
+        self.max_workers = max_workers or int(os.environ.get('NEXUS_CHAT_JOB_WORKERS', '8'))
+        self.ttl = ttl if ttl is not None else float(os.environ.get('NEXUS_CHAT_JOB_TTL', '300'))
+        self.dedupe_window = dedupe_window if dedupe_window is not None else \
+            float(os.environ.get('NEXUS_CHAT_JOB_DEDUPE_WINDOW', '30'))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='chat-job')
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, ChatJob] = {}
+        self._jobs_by_key: Dict[Tuple[Any, ...], str] = {}
+
+    def submit(self, turn_func: Callable[[], Tuple[Dict[str, Any], int]],
+               dedupe_key: Optional[Tuple[Any, ...]] = None) -> Tuple[ChatJob, bool]:
+        """Queues `turn_func` (returning (payload, http_status)). Returns (job, created)."""
+        self.purge_expired()
+        with self._lock:
+            if dedupe_key is not None and dedupe_key in self._jobs_by_key:
+                existing = self._jobs.get(self._jobs_by_key[dedupe_key])
+                if existing is not None and (existing.finished_at is None or
+                                             time.time() - existing.finished_at <= self.dedupe_window):
+                    return existing, False
+            job = ChatJob(job_id=uuid.uuid4().hex, dedupe_key=dedupe_key)
+            self._jobs[job.job_id] = job
+            if dedupe_key is not None:
+                self._jobs_by_key[dedupe_key] = job.job_id
+
+        self._executor.submit(self._run, job, turn_func)
+        return job, True
+
+    def _run(self, job: ChatJob, turn_func: Callable[[], Tuple[Dict[str, Any], int]]) -> None:
+        job.status = 'running'
+        try:
+            payload, http_status = turn_func()
+            job.result = payload
+            job.http_status = http_status
+            job.status = 'done' if http_status < 400 else 'error'
+        except Exception as e:
+            logger.error(f"[CHAT-JOB] Job {job.job_id} failed: {e}", exc_info=True)
+            job.error = str(e)
+            job.http_status = 500
+            job.status = 'error'
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id: str) -> Optional[ChatJob]:
+        self.purge_expired()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def purge_expired(self) -> int:
+        """Forgets finished jobs older than the TTL. Running jobs are never dropped."""
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and now - job.finished_at > self.ttl]
+            for job_id in expired:
+                job = self._jobs.pop(job_id)
+                if job.dedupe_key is not None and self._jobs_by_key.get(job.dedupe_key) == job_id:
+                    del self._jobs_by_key[job.dedupe_key]
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
@@ -0,0 +1,45 @@
+import time
+
+from chat_jobs import ChatJobManager
+
+
+def _wait_finished(manager, job_id, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job and job.finished_at is not None:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_resubmitted_turn_attaches_to_existing_job():
+    manager = ChatJobManager(max_workers=2, ttl=60, dedupe_window=60)
+    calls = []
+
+    def turn():
+        calls.append(1)
+        time.sleep(0.05)
+        return {'npc_response': 'Salve'}, 200
+
+    job, created = manager.submit(turn, dedupe_key=('p1', 'ciao'))
+    again, created_again = manager.submit(turn, dedupe_key=('p1', 'ciao'))
+    assert created and not created_again
+    assert again.job_id == job.job_id
+
+    finished = _wait_finished(manager, job.job_id)
+    assert finished.to_dict()['result'] == {'npc_response': 'Salve'}
+    assert len(calls) == 1
+
+
+def test_finished_jobs_expire_after_ttl():
+    manager = ChatJobManager(max_workers=1, ttl=0.05, dedupe_window=0)
+    job, _ = manager.submit(lambda: ({'error': 'boom'}, 500), dedupe_key=('p1', 'x'))
+    finished = _wait_finished(manager, job.job_id)
+    assert finished.status == 'error'
+    assert finished.to_dict()['error'] == 'boom'
+
+    time.sleep(0.1)
+    assert manager.get(job.job_id) is None
+    _, created = manager.submit(lambda: ({}, 200), dedupe_key=('p1', 'x'))
+    assert created
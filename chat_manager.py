@@ -5,17 +5,25 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+import copy
+import threading
 import time
 import random
 import re
-from typing import List, Dict, Optional, Tuple, Any
+from collections.abc import Sequence
+from typing import List, Dict, Optional, Tuple, Any, Callable
 import traceback # Added for more detailed error printing if needed
 
+from llm_cancellation import CancellationToken
+
 # Importa le dipendenze necessarie
 try:
     from llm_wrapper import llm_wrapper
     from terminal_formatter import TerminalFormatter
     from llm_stats_tracker import get_global_stats_tracker
+    from token_budget import estimate_message_tokens, history_token_budget, select_history_window
+    from conversation_summarizer import maybe_schedule_summary, summary_message
+    from prompt_segments import system_message as prompt_system_message
 except ImportError as e:
     print(f"Error importing modules in chat_manager.py: {e}")
     class TerminalFormatter:
@@ -159,7 +167,8 @@ def generate_summary_for_llsettext(npc_response: str, npc_name: str = "NPC", use
                 messages=messages,
                 model_name=model,
                 stream=False,
-                collect_stats=False
+                collect_stats=False,
+                cache=True  # Same response text -> same summary
             )
             
             if summary and len(summary.strip()) > 0:
@@ -389,15 +398,59 @@ def build_npc_system_prompt(game_session_state, npc_name=None):
         traceback.print_exc()
         return ""
 
+class ForkedHistory(Sequence):
+    """
+    Message list of a forked ChatSession: the parent's first `base_len` messages, shared
+    read-only (sessions only ever append to them), followed by a private tail. Forking
+    costs the same whatever the conversation length.
+    """
+
+    def __init__(self, prefix: List[Dict[str, str]], base_len: int):
+        self.prefix = prefix
+        self.base_len = base_len
+        self.tail: List[Dict[str, str]] = []
+
+    def __len__(self) -> int:
+        return self.base_len + len(self.tail)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            head = self.prefix[start:min(stop, self.base_len)] if start < self.base_len else []
+            return head + self.tail[max(0, start - self.base_len):max(0, stop - self.base_len)]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        return self.prefix[index] if index < self.base_len else self.tail[index - self.base_len]
+
+    def append(self, message: Dict[str, str]) -> None:
+        self.tail.append(message)
+
+
+_LEGACY_TOTALS = ('total_session_calls', 'total_session_input_tokens',
+                  'total_session_output_tokens', 'total_session_time')
+_fork_commit_lock = threading.Lock()
+
+
 class ChatSession:
     """Gestisce una sessione di chat interattiva con un LLM."""
     def __init__(self, model_name: Optional[str] = None, use_formatting: bool = True, model_type: str = "dialogue"):
         self.model_name = model_name
         self._effective_model_name: Optional[str] = None
         self.model_type = model_type  # Type of LLM usage (dialogue, profile, etc.)
+        self.npc_name: Optional[str] = None  # For per-NPC prompt cache statistics
         self.system_prompt: Optional[str] = None
         self.messages: List[Dict[str, str]] = []
         self.last_stats: Optional[Dict[str, Any]] = None
+        self.last_history_trim: Dict[str, int] = {"tokens": 0, "messages": 0}
+        # Rolling summary of messages[:summarized_count] (see conversation_summarizer)
+        self.rolling_summary: Optional[str] = None
+        self.summarized_count: int = 0
+        self.summary_persist: Optional[Callable[[str, int], None]] = None
+        self.summary_in_flight: bool = False
         self.current_player_hint: Optional[str] = None
         self.session_start_time: float = time.time()
         # Legacy stats for backward compatibility
@@ -407,6 +460,8 @@ class ChatSession:
         self.total_session_time: float = 0.0
         # Get reference to global stats tracker
         self.stats_tracker = get_global_stats_tracker()
+        self._fork_parent: Optional['ChatSession'] = None
+        self._fork_totals: Dict[str, Any] = {}
 
     def set_system_prompt(self, prompt: str):
         self.system_prompt = prompt
@@ -435,8 +490,50 @@ class ChatSession:
         self.messages.append({"role": role, "content": content})
 
 
+    def fork(self) -> 'ChatSession':
+        """
+        Copy-on-write child for a speculative turn. It shares the messages so far (read-only)
+        and every other attribute by reference, and keeps what it appends to itself. Adopt
+        its turn with commit_fork(); a discarded fork leaves this session untouched.
+        """
+        child = copy.copy(self)
+        child.messages = ForkedHistory(self.messages, len(self.messages))
+        child._fork_parent = self
+        child._fork_totals = {name: getattr(self, name) for name in _LEGACY_TOTALS}
+        return child
+
+    def commit_fork(self, child: 'ChatSession') -> bool:
+        """
+        Atomically appends the fork's new messages and takes over its per-call state.
+        Returns False (nothing changes) if this session gained messages since the fork.
+        """
+        if child._fork_parent is not self:
+            raise ValueError("commit_fork: session is not a fork of this session")
+        with _fork_commit_lock:
+            history = child.messages
+            if self.messages is not history.prefix or len(self.messages) != history.base_len:
+                return False
+            self.messages.extend(history.tail)
+            self.system_prompt = child.system_prompt
+            self.last_stats = child.last_stats
+            self.last_history_trim = child.last_history_trim
+            self._effective_model_name = child._effective_model_name
+            for name in _LEGACY_TOTALS:
+                setattr(self, name, getattr(self, name) + getattr(child, name) - child._fork_totals[name])
+            child._fork_parent = None  # A fork is committed at most once
+        maybe_schedule_summary(self)
+        return True
+
+    def detach(self) -> 'ChatSession':
+        """Turns a fork into an independent session (copies the shared messages once)."""
+        self.messages = list(self.messages)
+        self._fork_parent = None
+        return self
+
     def clear_memory(self):
         self.messages = []
+        self.rolling_summary = None
+        self.summarized_count = 0
         self.last_stats = None
         self.total_session_calls = 0
         self.total_session_input_tokens = 0
@@ -445,11 +542,12 @@ class ChatSession:
         print(f"{TerminalFormatter.YELLOW}Memoria messaggi resettata (System Prompt e Hint NPC mantenuti, se impostati).{TerminalFormatter.RESET}")
 
 
-    def ask(self, prompt: str, current_npc_name_for_placeholder: str = "NPC", stream: bool = True, collect_stats: bool = True, npc_data: Optional[Dict[str, Any]] = None, game_session_state: Optional[Dict[str, Any]] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+    def ask(self, prompt: str, current_npc_name_for_placeholder: str = "NPC", stream: bool = True, collect_stats: bool = True, npc_data: Optional[Dict[str, Any]] = None, game_session_state: Optional[Dict[str, Any]] = None, cancel_token: Optional[CancellationToken] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
         """Sends a prompt to the LLM and gets a response.
         MODIFIED: Added current_npc_name_for_placeholder for better empty response placeholders.
         MODIFIED: Added sudo mode detection for special test mode.
         MODIFIED: Added game_session_state parameter to regenerate system prompt dynamically.
+        cancel_token (llm_cancellation.CancellationToken) aborts the in-flight LLM request when cancelled.
         """
         start_call_time = time.time()
 
@@ -471,10 +569,11 @@ class ChatSession:
             prompt = prompt.strip()[5:]  # Remove "sudo " prefix
             print(f"{TerminalFormatter.YELLOW}🔧 SUDO MODE ACTIVATED - NPC will be highly compliant{TerminalFormatter.RESET}")
 
+        history_length = len(self.messages)
         if not original_prompt.startswith("[") or not original_prompt.endswith("]"):
              self.add_message("user", original_prompt)
 
-        messages_for_llm = self.get_history()
+        messages_for_llm = self.get_history(token_budget=history_token_budget(self.model_name))
         
         # Modify behavior for sudo mode - add special compliance instructions
         if sudo_mode:
@@ -494,10 +593,14 @@ class ChatSession:
                 formatting_function=TerminalFormatter.format_terminal_text,
                 stream=stream,
                 width=TerminalFormatter.get_terminal_width(),
-                collect_stats=collect_stats
+                collect_stats=collect_stats,
+                usage_type=self.model_type,
+                cancel_token=cancel_token
             )
             if stats and self._effective_model_name is None and not stats.get("error"):
                 self._effective_model_name = stats.get("model")
+            if stats and stats.get("rate_limited") and self._fork_parent is None and len(self.messages) > history_length:
+                self.messages.pop()  # No model had capacity: the player will resend this turn (forks are just dropped)
 
         except Exception as e:
             print(f"\n{TerminalFormatter.RED}❌ Errore durante la chiamata a llm_wrapper: {e}{TerminalFormatter.RESET}")
@@ -531,6 +634,9 @@ class ChatSession:
             output_text = "" # Ensure `ask` returns empty string, not None
 
 
+        if stats is not None:
+            stats["history_tokens_trimmed"] = self.last_history_trim["tokens"]
+            stats["history_messages_trimmed"] = self.last_history_trim["messages"]
         self.last_stats = stats
         if stats and not stats.get("error"):
             # Legacy stats for backward compatibility
@@ -542,26 +648,33 @@ class ChatSession:
             # Record in global stats tracker
             model_name = self._effective_model_name or self.model_name or "Unknown"
             self.stats_tracker.record_call(model_name, self.model_type, stats)
+            self.stats_tracker.record_prompt_cache(self.npc_name or "unknown", model_name, stats)
+            if self._fork_parent is None:
+                maybe_schedule_summary(self)  # Forks leave it to the session that adopts their turn
 
         return output_text if output_text is not None else "", stats
 
 
-    def get_history(self) -> List[Dict[str, str]]:
+    def get_history(self, token_budget: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        System prompt plus conversation. With a token_budget, turns covered by the rolling
+        summary are replaced by the summary and only the most recent remaining turns that
+        fit are included (see token_budget.select_history_window); what was left out is
+        recorded in last_history_trim.
+        """
         full_history = []
         if self.system_prompt:
-            # Use cache_control for Gemini/Anthropic models to cache static system prompt
-            # Format: content array with cache_control marker for OpenRouter caching
-            full_history.append({
-                "role": "system",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": self.system_prompt,
-                        "cache_control": {"type": "ephemeral"}
-                    }
-                ]
-            })
-        full_history.extend(self.messages)
+            # Static NPC segment as a cache_control block, volatile player state as a separate uncached block
+            full_history.append(prompt_system_message(self.system_prompt))
+        messages = self.messages
+        if token_budget is not None and self.rolling_summary and 0 < self.summarized_count <= len(self.messages):
+            summary = summary_message(self.rolling_summary)
+            full_history.append(summary)
+            messages = self.messages[self.summarized_count:]
+            token_budget = max(1, token_budget - estimate_message_tokens(summary))
+        window, trimmed_tokens, trimmed_messages = select_history_window(messages, token_budget)
+        self.last_history_trim = {"tokens": trimmed_tokens, "messages": trimmed_messages}
+        full_history.extend(window)
         return full_history
 
     def get_last_stats(self) -> Optional[Dict[str, Any]]: return self.last_stats
@@ -0,0 +1,65 @@
+from unittest.mock import patch
+
+import chat_manager
+from chat_manager import ChatSession
+
+
+def _session(turns):
+    session = ChatSession(model_name="test/model")
+    session.set_system_prompt("Sei Jorin.")
+    for i in range(turns):
+        session.add_message("user", f"domanda {i}")
+        session.add_message("assistant", f"risposta {i}")
+    return session
+
+
+def _ask(session, text="Come stai?"):
+    stats = {"model": "test/model", "total_time": 0.5, "input_tokens": 10, "output_tokens": 3}
+    with patch.object(chat_manager, "llm_wrapper", return_value=("Bene!", stats)), \
+            patch.object(chat_manager, "maybe_schedule_summary") as schedule:
+        session.ask(text, stream=False)
+    return schedule
+
+
+def test_fork_shares_history_and_keeps_its_turn_private():
+    parent = _session(50)
+    fork = parent.fork()
+    assert fork.messages.prefix is parent.messages  # no copy of the conversation
+
+    schedule = _ask(fork)
+    schedule.assert_not_called()  # summaries are scheduled on the adopting session
+    assert len(parent.messages) == 100 and parent.total_session_calls == 0
+    assert [m["content"] for m in fork.messages[-3:]] == ["risposta 49", "Come stai?", "Bene!"]
+    assert fork.get_history()[-1] == {"role": "assistant", "content": "Bene!"}
+
+
+def test_commit_fork_appends_the_turn_atomically():
+    parent = _session(2)
+    fork = parent.fork()
+    _ask(fork)
+
+    with patch.object(chat_manager, "maybe_schedule_summary") as schedule:
+        assert parent.commit_fork(fork)
+    schedule.assert_called_once_with(parent)
+    assert [m["content"] for m in parent.messages[-2:]] == ["Come stai?", "Bene!"]
+    assert parent.total_session_calls == 1 and parent.last_stats["output_tokens"] == 3
+
+
+def test_commit_is_refused_once_the_parent_moved_on():
+    parent = _session(2)
+    fork = parent.fork()
+    _ask(fork)
+    parent.add_message("user", "/go Village")
+
+    assert not parent.commit_fork(fork)
+    assert len(parent.messages) == 5
+    detached = fork.detach()
+    assert isinstance(detached.messages, list) and len(detached.messages) == 6
+
+
+def test_rate_limited_turn_leaves_no_unanswered_message_in_history():
+    session = _session(1)
+    stats = {"model": "test/model", "error": "Rate limit reached", "rate_limited": True, "retry_after": 3.0}
+    with patch.object(chat_manager, "llm_wrapper", return_value=("", stats)):
+        assert session.ask("Come stai?", stream=False) == ("", stats)
+    assert [m["content"] for m in session.messages] == ["domanda 0", "risposta 0"]
@@ -1,4 +1,5 @@
 import json
+import os
 import re
 from typing import Dict, List, Any, Optional, Callable
 
@@ -9,6 +10,58 @@ except ImportError:
   class TerminalFormatter:
     DIM = ""; RESET = ""; BOLD = ""; YELLOW = ""; RED = ""; GREEN = ""; MAGENTA = ""; CYAN = ""; ITALIC = ""
 
+# Structured output for the NLP call (NEXUS_NLP_STRUCTURED_OUTPUT, default on): the provider is asked
+# for exactly these fields and the reply is capped at NEXUS_NLP_MAX_TOKENS output tokens (default 60).
+COMMAND_INTERPRETATION_SCHEMA = {
+  "name": "command_interpretation",
+  "description": "Classificazione dell'input del giocatore",
+  "schema": {
+    "type": "object",
+    "properties": {
+      "is_command": {"type": "boolean"},
+      "inferred_command": {"type": ["string", "null"]},
+      "confidence": {"type": "number"}
+    },
+    "required": ["is_command", "inferred_command", "confidence"],
+    "additionalProperties": False
+  }
+}
+
+def structured_output_enabled() -> bool:
+  return os.environ.get("NEXUS_NLP_STRUCTURED_OUTPUT", "1").lower() not in ("0", "false", "no")
+
+# Tassonomia delle parole chiave, in ordine di priorità (usata da _fallback_interpretation
+# e dal classificatore locale in intent_classifier)
+INTENT_KEYWORDS: Dict[str, List[str]] = {
+  # Iniziare conversazione con NPC (COMANDO /talk) - prima dei piani futuri!
+  'talk_npc': ['parla con', 'parlare con', 'voglio parlare con', 'talk to', 'speak with', 'speak to'],
+  # Piani futuri (DIALOGO, non /talk o /go): il giocatore PARLA di andare da qualcuno
+  'future_plans': ['vado da', 'andrò da', 'andrò a parlare con', 'vado a vedere',
+                   'vado a trovare', 'saluto e vado', "i'm going to", "i'll go to", "i'll talk to"],
+  # Discussioni su NPCs (DIALOGO, non /talk)
+  'discuss_npc': ['parlami di', 'cosa sai di', 'dimmi di', 'chi è', 'mi parli di', 'cosa mi dici di',
+                  'hai sentito parlare di', 'conosci', 'tell me about', 'what do you know about',
+                  'sai qualcosa di', 'cosa pensi di', 'chi sono gli altri', 'chi altro',
+                  'chi c\'è qui', 'chi altro conosci', 'who else', 'who are the others'],
+  # Raccogliere (DIALOGO, non comando)
+  'collect': ['raccolgo', 'prendo', 'pick up', 'pick it up', 'la raccolgo', 'la prendo', 'lo raccolgo', 'lo prendo'],
+  # Richiedere direttamente (COMANDO /receive)
+  'demand': ['dammi', 'voglio', 'passami', 'devo avere'],
+  # Ricevere/chiedere educatamente (DIALOGO)
+  'ask': ['hai qualcosa', 'cosa mi', 'mi puoi dare', 'mi dai', 'cosa hai', 'may i have', 'can i get',
+          'posso avere', 'potrei avere', 'hai il', 'hai la', 'hai un'],
+  # Dare (COMANDO /give)
+  'give': ['eccoti', 'ti do', 'do il', 'do la', 'offro', 'regalo', 'consegno', 'porto', 'portato', 'ho portato',
+           'ecco i', 'ecco la', 'ecco il', 'prendi', 'tieni', 'here are', 'here is', 'i bring', 'i have brought'],
+  # Movimento verso luoghi (non NPCs)
+  'movement': ['vai in', 'andiamo in', 'andiamo a', 'spostarsi', 'andare'],
+  'inventory': ['inventario', 'oggetti', 'borsa', 'cosa ho', 'tasca'],
+  'who': ['chi c\'è', 'chi è qui', 'persone', 'abitanti'],
+  'areas': ['aree', 'liste', 'elenca', 'lista aree'],
+  'help': ['aiuto', 'help', 'comandi', 'cosa posso fare'],
+  'exit': ['esci', 'esco', 'uscire', 'fine', 'basta'],
+}
+
 def get_available_commands() -> Dict[str, str]:
   """Restituisce un dizionario dei comandi disponibili con descrizioni."""
   return {
@@ -62,8 +115,12 @@ def get_italian_area_mapping() -> Dict[str, str]:
     'paese': 'Village'
   }
 
-def build_command_interpretation_prompt(user_input: str, current_context: Dict[str, Any]) -> List[Dict[str, str]]:
-  """Costruisce il prompt per l'LLM di interpretazione comandi."""
+def build_command_interpretation_prompt(user_input: str, current_context: Dict[str, Any],
+                                        compact: bool = False) -> List[Dict[str, str]]:
+  """Costruisce il prompt per l'LLM di interpretazione comandi.
+
+  compact=True chiede solo i campi di COMMAND_INTERPRETATION_SCHEMA, senza "reasoning".
+  """
   available_commands = get_available_commands()
   commands_text = "\n".join([f"- {cmd}: {desc}" for cmd, desc in available_commands.items()])
   
@@ -84,6 +141,18 @@ def build_command_interpretation_prompt(user_input: str, current_context: Dict[s
     if en_name in available_areas:
       areas_text += f"- '{it_name}' → '{en_name}'\n"
 
+  if compact:
+    output_format = """Rispondi SOLO con JSON compatto, senza spiegazioni:
+{"is_command": true/false, "inferred_command": "/comando args" o null, "confidence": 0.0-1.0}"""
+  else:
+    output_format = """Rispondi SOLO con un oggetto JSON valido nel seguente formato:
+{
+  "is_command": true/false,
+  "inferred_command": "/comando args" o null,
+  "confidence": 0.0-1.0,
+  "reasoning": "breve spiegazione"
+}"""
+
   system_prompt = f"""Sei un assistente intelligente che interpreta l'input del giocatore in un gioco di ruolo testuale.
 
 Il tuo compito è determinare se l'input del giocatore è:
@@ -212,13 +281,7 @@ IMPORTANTE:
 - RICORDA: raccogliere/prendere oggetti dall'ambiente = DIALOGO, non /give
 - RICORDA: chiedere genericamente "hai qualcosa?" = DIALOGO, non comando
 
-Rispondi SOLO con un oggetto JSON valido nel seguente formato:
-{{
-  "is_command": true/false,
-  "inferred_command": "/comando args" o null,
-  "confidence": 0.0-1.0,
-  "reasoning": "breve spiegazione"
-}}"""
+{output_format}"""
 
   return [
     {"role": "system", "content": system_prompt},
@@ -252,18 +315,26 @@ def interpret_user_intent(
     'available_areas': game_state.get('available_areas', [])
   }
   
-  messages = build_command_interpretation_prompt(user_input, context)
+  structured = structured_output_enabled()
+  messages = build_command_interpretation_prompt(user_input, context, compact=structured)
+  structured_kwargs = {}
+  if structured:
+    structured_kwargs = {'response_schema': COMMAND_INTERPRETATION_SCHEMA,
+                         'max_tokens': int(os.environ.get("NEXUS_NLP_MAX_TOKENS", "60"))}
   
   try:
     response_text, stats = llm_wrapper_func(
       messages=messages,
       model_name=model_name,
       stream=False,  # Non vogliamo streaming per questo
-      collect_stats=True
+      collect_stats=True,
+      usage_type="command_interpretation",
+      cache=True,  # Common phrases in the same context interpret the same way
+      **structured_kwargs
     )
     
-    # Record stats for command interpretation
-    if stats:
+    # Record stats for command interpretation (cache hits are counted by llm_wrapper, not as calls)
+    if stats and not stats.get("cached"):
       try:
         stats_tracker = get_global_stats_tracker()
         stats_tracker.record_call(model_name, "command_interpretation", stats)
@@ -274,6 +345,15 @@ def interpret_user_intent(
       print(f"{TF.YELLOW}Warning: LLM error in command interpretation: {stats['error']}{TF.RESET}")
       return _fallback_interpretation(user_input, game_state)
     
+    if structured:
+      # Providers that honour the schema return bare JSON: no repair needed
+      try:
+        interpretation = json.loads(response_text)
+        if isinstance(interpretation, dict) and 'is_command' in interpretation and 'confidence' in interpretation:
+          return _complete_interpretation(interpretation, user_input)
+      except (json.JSONDecodeError, TypeError):
+        pass  # Model ignored the schema: go through the repair steps below
+    
     try:
       cleaned_response = response_text.strip()
       
@@ -320,13 +400,7 @@ def interpret_user_intent(
         if field not in interpretation:
           raise ValueError(f"Missing required field: {field}")
       
-      interpretation['original_input'] = user_input
-      if 'reasoning' not in interpretation:
-        interpretation['reasoning'] = "No reasoning provided"
-      if 'inferred_command' not in interpretation:
-        interpretation['inferred_command'] = None
-      
-      return interpretation
+      return _complete_interpretation(interpretation, user_input)
       
     except (json.JSONDecodeError, ValueError) as e:
       print(f"{TF.YELLOW}Warning: Could not parse LLM response for command interpretation: {e}{TF.RESET}")
@@ -337,6 +411,15 @@ def interpret_user_intent(
     print(f"{TF.RED}Error during command interpretation: {e}{TF.RESET}")
     return _fallback_interpretation(user_input, game_state)
 
+def _complete_interpretation(interpretation: Dict[str, Any], user_input: str) -> Dict[str, Any]:
+  """Fills the optional fields of a parsed interpretation."""
+  interpretation['original_input'] = user_input
+  if 'reasoning' not in interpretation:
+    interpretation['reasoning'] = "No reasoning provided"
+  if 'inferred_command' not in interpretation:
+    interpretation['inferred_command'] = None
+  return interpretation
+
 def _extract_json_manually(text: str) -> Dict[str, Any]:
   """Extract JSON fields manually from malformed response."""
   result = {}
@@ -372,42 +455,19 @@ def _fallback_interpretation(user_input: str, game_state: Dict[str, Any]) -> Dic
   available_areas = game_state.get('available_areas', [])
   italian_mapping = get_italian_area_mapping()
   
-  # Parole chiave per raccogliere (DIALOGO, non comando)
-  collect_keywords = ['raccolgo', 'prendo', 'pick up', 'pick it up', 'la raccolgo', 'la prendo', 'lo raccolgo', 'lo prendo']
-  
-  # Parole chiave per dare (COMANDO /give)
-  give_keywords = ['eccoti', 'ti do', 'do il', 'do la', 'offro', 'regalo', 'consegno', 'porto', 'portato', 'ho portato',
-                   'ecco i', 'ecco la', 'ecco il', 'prendi', 'tieni', 'here are', 'here is', 'i bring', 'i have brought']
-  
-  # Parole chiave per ricevere/chiedere educatamente (DIALOGO)
-  ask_keywords = ['hai qualcosa', 'cosa mi', 'mi puoi dare', 'mi dai', 'cosa hai', 'may i have', 'can i get',
-                  'posso avere', 'potrei avere', 'hai il', 'hai la', 'hai un']
-  
-  # Parole chiave per richiedere direttamente (COMANDO /receive)
-  demand_keywords = ['dammi', 'voglio', 'passami', 'devo avere']
-  
-  # Parole chiave per discussioni su NPCs (DIALOGO, not /talk)
-  discuss_npc_keywords = ['parlami di', 'cosa sai di', 'dimmi di', 'chi è', 'mi parli di', 'cosa mi dici di',
-                         'hai sentito parlare di', 'conosci', 'tell me about', 'what do you know about',
-                         'sai qualcosa di', 'cosa pensi di', 'chi sono gli altri', 'chi altro',
-                         'chi c\'è qui', 'chi altro conosci', 'who else', 'who are the others']
-
-  # Parole chiave per piani futuri (DIALOGO, non /talk o /go)
-  # Queste indicano che il giocatore sta PARLANDO di andare da qualcuno, non eseguendo il comando
-  future_plans_keywords = ['vado da', 'andrò da', 'andrò a parlare con', 'vado a vedere',
-                          'vado a trovare', 'saluto e vado', "i'm going to", "i'll go to", "i'll talk to"]
-
-  # Parole chiave per iniziare conversazione con NPC (COMANDO /talk)
-  talk_npc_keywords = ['parla con', 'parlare con', 'voglio parlare con', 'talk to', 'speak with', 'speak to']
-
-  # Parole chiave per movimento verso luoghi (non NPCs)
-  movement_keywords = ['vai in', 'andiamo in', 'andiamo a', 'spostarsi', 'andare']
-  
-  inventory_keywords = ['inventario', 'oggetti', 'borsa', 'cosa ho', 'tasca']
-  who_keywords = ['chi c\'è', 'chi è qui', 'persone', 'abitanti']
-  help_keywords = ['aiuto', 'help', 'comandi', 'cosa posso fare']
-  exit_keywords = ['esci', 'esco', 'uscire', 'fine', 'basta']
-  areas_keywords = ['aree', 'liste', 'elenca', 'lista aree']
+  collect_keywords = INTENT_KEYWORDS['collect']
+  give_keywords = INTENT_KEYWORDS['give']
+  ask_keywords = INTENT_KEYWORDS['ask']
+  demand_keywords = INTENT_KEYWORDS['demand']
+  discuss_npc_keywords = INTENT_KEYWORDS['discuss_npc']
+  future_plans_keywords = INTENT_KEYWORDS['future_plans']
+  talk_npc_keywords = INTENT_KEYWORDS['talk_npc']
+  movement_keywords = INTENT_KEYWORDS['movement']
+  inventory_keywords = INTENT_KEYWORDS['inventory']
+  who_keywords = INTENT_KEYWORDS['who']
+  help_keywords = INTENT_KEYWORDS['help']
+  exit_keywords = INTENT_KEYWORDS['exit']
+  areas_keywords = INTENT_KEYWORDS['areas']
   
   # Controlla se vuole parlare con un NPC (COMANDO /talk) - Prima di controllare piani futuri!
   for keyword in talk_npc_keywords:
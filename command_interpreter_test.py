@@ -0,0 +1,69 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import llm_resilience
+import llm_wrapper as lw
+from command_interpreter import COMMAND_INTERPRETATION_SCHEMA, interpret_user_intent
+
+GAME_STATE = {'current_area': 'Tavern', 'current_npc': {'name': 'Jorin'},
+              'available_areas': ['Tavern', 'Village']}
+
+
+def test_structured_mode_requests_schema_and_parses_bare_json(monkeypatch):
+    monkeypatch.delenv("NEXUS_NLP_STRUCTURED_OUTPUT", raising=False)
+    llm = MagicMock(return_value=('{"is_command": true, "inferred_command": "/go Village", "confidence": 0.9}',
+                                  {"total_time": 0.1}))
+
+    result = interpret_user_intent("vado al villaggio", GAME_STATE, llm, "test/model")
+
+    kwargs = llm.call_args.kwargs
+    assert kwargs["response_schema"] is COMMAND_INTERPRETATION_SCHEMA
+    assert kwargs["max_tokens"] == 60
+    assert '"reasoning"' not in kwargs["messages"][0]["content"]
+    assert result["inferred_command"] == "/go Village" and result["original_input"] == "vado al villaggio"
+
+
+def test_schema_is_sent_as_openrouter_response_format_and_anthropic_tool(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "k")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "k")
+    options = {"response_schema": COMMAND_INTERPRETATION_SCHEMA, "max_tokens": 60}
+    answer = {"is_command": False, "inferred_command": None, "confidence": 0.8}
+    response = MagicMock(status_code=200)
+    response.json.side_effect = [
+        {"choices": [{"message": {"content": json.dumps(answer)}}], "usage": {}},
+        {"content": [{"type": "tool_use", "name": "command_interpretation", "input": answer}], "usage": {}},
+    ]
+    messages = [{"role": "system", "content": "s"}, {"role": "user", "content": "ciao"}]
+
+    with patch.object(lw, "_post_llm_request", return_value=response) as post:
+        lw._call_openrouter(messages, "test/model", None, False, 80, request_options=options)
+        text, _ = lw._try_anthropic_api(messages, llm_resilience.ANTHROPIC_DIRECT_MODEL, None, False, 80, True,
+                                        request_options=options)
+
+    openrouter_payload, anthropic_payload = (call.args[3] for call in post.call_args_list)
+    assert openrouter_payload["response_format"]["json_schema"]["schema"] == COMMAND_INTERPRETATION_SCHEMA["schema"]
+    assert openrouter_payload["max_tokens"] == 60
+    assert anthropic_payload["tool_choice"] == {"type": "tool", "name": "command_interpretation"}
+    assert anthropic_payload["max_tokens"] == 60
+    assert json.loads(text) == answer
+
+
+def test_models_ignoring_the_schema_still_go_through_json_repair(monkeypatch):
+    monkeypatch.setenv("NEXUS_NLP_STRUCTURED_OUTPUT", "0")
+    llm = MagicMock(return_value=("```json\n{'is_command': false, 'confidence': 0.95}\n```", {}))
+
+    result = interpret_user_intent("ciao Jorin", GAME_STATE, llm, "test/model")
+
+    assert "response_schema" not in llm.call_args.kwargs
+    assert result["is_command"] is False and result["reasoning"] == "No reasoning provided"
+
+
+def test_cache_hits_are_not_recorded_as_interpretation_calls(monkeypatch):
+    monkeypatch.delenv("NEXUS_NLP_STRUCTURED_OUTPUT", raising=False)
+    cached_stats = {"model": "test/model", "total_time": 0.0, "input_tokens": 0, "output_tokens": 0, "cached": True}
+    llm = MagicMock(return_value=('{"is_command": false, "inferred_command": null, "confidence": 0.9}', cached_stats))
+
+    with patch('command_interpreter.get_global_stats_tracker') as tracker:
+        interpret_user_intent("ciao Jorin", GAME_STATE, llm, "test/model")
+
+    tracker.return_value.record_call.assert_not_called()
@@ -4,8 +4,9 @@ import traceback
 import re
 import hashlib
 import time
-import threading
 import logging
+import contextlib
+import functools
 from typing import Dict, List, Any, Optional, Tuple, Callable
 
 logger = logging.getLogger(__name__)
@@ -37,6 +38,10 @@ from command_handlers.handle_sussurri import handle_sussurri
 from command_handlers.handle_brief import handle_brief
 
 import session_utils # Keep for other utilities like get_npc_color
+import output_channel
+from output_channel import emit
+from llm_stats_tracker import get_global_stats_tracker
+from speculation import SpeculativeTurn, OUTCOME_COMMAND, OUTCOME_DIALOGUE
 
 # Dummy TerminalFormatter fallback for color/style safety
 class DummyTF:
@@ -95,6 +100,9 @@ def _speculative_nlp_interpretation(user_input: str, state: Dict[str, Any], resu
                     available_areas = session_utils.get_known_areas_from_list(all_known_npcs)
                     state_copy['available_areas'] = available_areas
 
+            cancel_token = result_container.get('cancel_token')
+            if cancel_token is not None:
+                llm_wrapper_func = functools.partial(llm_wrapper_func, cancel_token=cancel_token)
             intent_result = interpret_user_intent(
                 user_input, state_copy, llm_wrapper_func, nlp_model_name, nlp_confidence_threshold
             )
@@ -153,9 +161,8 @@ def _speculative_dialogue_generation(user_input: str, state: Dict[str, Any], res
     logger.info(f"[DIALOGUE-SPECULATIVE] Starting dialogue generation for: '{user_input[:30]}...'")
     start_time = time.time()
 
-    # Create a temporary copy of chat session to avoid side effects
-    import copy
-    temp_session = copy.deepcopy(chat_session)
+    # Copy-on-write fork of the chat session: side effects stay in the fork until adopted
+    temp_session = chat_session.fork()
 
     # Check for cancellation before expensive LLM call
     if result_container.get('cancelled', False):
@@ -167,18 +174,26 @@ def _speculative_dialogue_generation(user_input: str, state: Dict[str, Any], res
     npc_name_for_prompt = current_npc.get('name', 'NPC')
     temp_session.add_message("user", user_input)
 
-    response_text, response_stats = temp_session.ask(
-      prompt=user_input,
-      current_npc_name_for_placeholder=npc_name_for_prompt,
-      stream=False,  # Never stream in speculative mode to avoid overlapping output
-      collect_stats=True,
-      npc_data=current_npc,
-      game_session_state=state # Pass game session state for dynamic system prompt regeneration
-    )
+    # Only stream when a client is listening for tokens: the gated relay holds them
+    # back until the turn is confirmed as dialogue, so nothing overlaps on the console.
+    token_relay = result_container.get('token_relay')
+    with output_channel.token_listener(token_relay) if token_relay else contextlib.nullcontext():
+      response_text, response_stats = temp_session.ask(
+        prompt=user_input,
+        current_npc_name_for_placeholder=npc_name_for_prompt,
+        stream=token_relay is not None,
+        collect_stats=True,
+        npc_data=current_npc,
+        game_session_state=state, # Pass game session state for dynamic system prompt regeneration
+        cancel_token=result_container.get('cancel_token')
+      )
 
     # Final check for cancellation before storing result
     if result_container.get('cancelled', False):
       logger.info(f"[DIALOGUE-SPECULATIVE] Cancelled after LLM call, discarding result")
+      if response_stats and not response_stats.get('cancelled'):
+        # Finished before the cancel arrived: the whole call was paid for and thrown away
+        get_global_stats_tracker().record_cancellation(temp_session.model_type, response_stats.get('total_tokens', 0), aborted=False)
       result_container['completed'] = True
       return
 
@@ -199,8 +214,22 @@ def _speculative_dialogue_generation(user_input: str, state: Dict[str, Any], res
     result_container['dialogue_result'] = None
     result_container['completed'] = True
 
+def _defer_rate_limited_turn(state: Dict[str, Any], stats: Optional[Dict[str, Any]]) -> bool:
+  """No model had rate-limit capacity for the NPC reply: mark the turn as "retry later" (the API answers 503)."""
+  if not (stats and stats.get('rate_limited')):
+    return False
+  state['npc_made_new_response_this_turn'] = False
+  state['llm_retry_after'] = stats.get('retry_after')
+  TF = state.get('TerminalFormatter')
+  yellow = getattr(TF, 'YELLOW', '') if TF else ''
+  reset = getattr(TF, 'RESET', '') if TF else ''
+  emit(f"{yellow}All models are busy right now, try again in {stats.get('retry_after', 0):.0f}s.{reset}")
+  return True
+
 def _build_dialogue_response(state: Dict[str, Any], dialogue_data: Dict[str, Any]) -> Dict[str, Any]:
   """Build a properly formatted response from speculative dialogue generation."""
+  if _defer_rate_limited_turn(state, dialogue_data.get('response_stats')):
+    return state  # The fork is dropped, so the player's message stays out of the history
   TF = state.get('TerminalFormatter')
   response_text = dialogue_data['response_text']
   npc_name = dialogue_data['npc_name']
@@ -211,11 +240,14 @@ def _build_dialogue_response(state: Dict[str, Any], dialogue_data: Dict[str, Any
     TF = TF or DummyTF
     npc_color = session_utils.get_npc_color(npc_name, TF)
     reset = getattr(TF, 'RESET', '') if TF else ''
-    print(f"{npc_color}{npc_name} > {reset}{response_text}")
+    emit(f"{npc_color}{npc_name} > {reset}{response_text}")
     
-    # Replace the current chat session with the completed one
-    if temp_session and state.get('chat_session'):
-      state['chat_session'] = temp_session
+    # Adopt the speculative turn into the current chat session
+    chat_session = state.get('chat_session')
+    if temp_session and chat_session and temp_session is not chat_session:
+      if not chat_session.commit_fork(temp_session):
+        logger.warning(f"[PARALLEL-PROCESSING] Chat session changed during speculation, switching to the forked session")
+        state['chat_session'] = temp_session.detach()
   
   return state
 
@@ -266,55 +298,10 @@ def process_input_revised(user_input: str, state: Dict[str, Any]) -> Dict[str, A
   command_processed_this_turn = False
 
   # Start speculative processing for non-slash inputs immediately
-  nlp_thread = None
-  dialogue_thread = None
-  nlp_result_container = {'completed': False, 'intent_result': None}
-  dialogue_result_container = {'completed': False, 'dialogue_result': None}
-  
-  if not user_input.startswith('/'):
-    nlp_enabled = state.get('nlp_command_interpretation_enabled', True)
-    current_npc = state.get('current_npc')
-    chat_session = state.get('chat_session')
-    
-    if nlp_enabled:
-      # Always start NLP interpretation
-      nlp_thread = threading.Thread(
-        target=_speculative_nlp_interpretation,
-        args=(user_input, state, nlp_result_container),
-        daemon=True
-      )
-      nlp_thread.start()
-      
-      # Wait briefly for NLP to complete before starting dialogue
-      nlp_thread.join(timeout=1.2)  # Quick NLP check - 1200ms
-      
-      if nlp_result_container['completed']:
-        intent_result = nlp_result_container['intent_result']
-        nlp_confidence_threshold = state.get('nlp_command_confidence_threshold', 0.7)
-        
-        # If NLP quickly identifies this as a command, don't start dialogue thread
-        if intent_result['is_command'] and intent_result['confidence'] >= nlp_confidence_threshold:
-          logger.info(f"[PARALLEL-PROCESSING] NLP quickly detected command, skipping dialogue thread")
-        else:
-          # Low confidence or not a command - start dialogue generation
-          if current_npc and chat_session and not state.get('in_hint_mode', False):
-            dialogue_thread = threading.Thread(
-              target=_speculative_dialogue_generation,
-              args=(user_input, state, dialogue_result_container),
-              daemon=True
-            )
-            dialogue_thread.start()
-            logger.info(f"[PARALLEL-PROCESSING] Started dialogue thread after NLP check")
-      else:
-        # NLP didn't complete quickly - assume it might be dialogue and start dialogue thread
-        if current_npc and chat_session and not state.get('in_hint_mode', False):
-          dialogue_thread = threading.Thread(
-            target=_speculative_dialogue_generation,
-            args=(user_input, state, dialogue_result_container),
-            daemon=True
-          )
-          dialogue_thread.start()
-          logger.info(f"[PARALLEL-PROCESSING] NLP timeout, started dialogue thread anyway")
+  speculation = None
+  if not user_input.startswith('/') and state.get('nlp_command_interpretation_enabled', True):
+    speculation = SpeculativeTurn(user_input, state, _speculative_nlp_interpretation,
+                                  _speculative_dialogue_generation).start()
 
   if user_input.startswith('/'):
     parts = user_input[1:].split(None, 1)
@@ -335,102 +322,47 @@ def process_input_revised(user_input: str, state: Dict[str, Any]) -> Dict[str, A
       else:
         yellow = getattr(TF, 'YELLOW', '') if TF else ''
         reset = getattr(TF, 'RESET', '') if TF else ''
-        print(f"{yellow}Unknown command '/{command}'. Try /help.{reset}")
+        emit(f"{yellow}Unknown command '/{command}'. Try /help.{reset}")
         command_processed_this_turn = True
     except Exception as e:
         red = getattr(TF, 'RED', '') if TF else ''
         reset = getattr(TF, 'RESET', '') if TF else ''
-        print(f"{red}Error processing command '/{command}': {type(e).__name__} - {e}{reset}")
+        emit(f"{red}Error processing command '/{command}': {type(e).__name__} - {e}{reset}")
         if debug_mode:
             traceback.print_exc()
         command_processed_this_turn = True
 
-  # Smart parallel processing results handling
-  elif nlp_thread:
-    # NLP thread may have already completed in the initial check, but handle it again if needed
-    if not nlp_result_container['completed']:
-      nlp_thread.join(timeout=1.5)  # Additional wait if needed
-    
-    if nlp_result_container['completed']:
-      intent_result = nlp_result_container['intent_result']
-      nlp_confidence_threshold = state.get('nlp_command_confidence_threshold', 0.7)
-      
-      if state.get('nlp_command_debug', False) or debug_mode:
-        reasoning = intent_result.get('reasoning', 'N/A')
-        dim = getattr(TF, 'DIM', '') if TF else ''
-        reset = getattr(TF, 'RESET', '') if TF else ''
-        print(f"{dim}[NLP-PARALLEL] Intent: {intent_result['is_command']}, Conf: {intent_result['confidence']:.2f}, Cmd: {intent_result.get('inferred_command')}, Reason: {reasoning}{reset}")
+  # Smart parallel processing results handling: the speculation engine settles the race
+  elif speculation:
+    outcome = speculation.resolve()
+    intent_result = outcome.intent_result
 
-      # High confidence command - execute command
-      if intent_result['is_command'] and intent_result['confidence'] >= nlp_confidence_threshold:
-        inferred_command_full = intent_result.get('inferred_command')
-        if inferred_command_full:
-          # Cancel dialogue thread if it's still running since we now know this is a command
-          if dialogue_thread and dialogue_thread.is_alive():
-            logger.info(f"[PARALLEL-PROCESSING] Cancelling dialogue thread - NLP detected command")
-            dialogue_result_container['cancelled'] = True
+    if intent_result and (state.get('nlp_command_debug', False) or debug_mode):
+      reasoning = intent_result.get('reasoning', 'N/A')
+      dim = getattr(TF, 'DIM', '') if TF else ''
+      reset = getattr(TF, 'RESET', '') if TF else ''
+      emit(f"{dim}[NLP-PARALLEL] Intent: {intent_result['is_command']}, Conf: {intent_result['confidence']:.2f}, Cmd: {intent_result.get('inferred_command')}, Reason: {reasoning}{reset}")
+
+    if outcome.kind == OUTCOME_COMMAND:
+      inferred_command_full = intent_result['inferred_command']
+      dim = getattr(TF, 'DIM', '') if TF else ''
+      reset = getattr(TF, 'RESET', '') if TF else ''
+      emit(f"{dim}[Interpreted as: {inferred_command_full}]{reset}")
+      _add_profile_action(state, f"Used natural language: '{user_input}' → '{inferred_command_full}'")
+      return process_input_revised(inferred_command_full, state)
+
+    if outcome.kind == OUTCOME_DIALOGUE:
+      # Use the pre-generated dialogue response!
+      logger.info(f"[PARALLEL-PROCESSING] Using speculative dialogue result")
+      state['npc_made_new_response_this_turn'] = True
+      _add_profile_action(state, f"Said to NPC: '{user_input[:50]}{'...' if len(user_input) > 50 else ''}'")
+      return _build_dialogue_response(state, outcome.dialogue_result)
+
+    if intent_result is None and debug_mode:
+      yellow = getattr(TF, 'YELLOW', '') if TF else ''
+      reset = getattr(TF, 'RESET', '') if TF else ''
+      emit(f"{yellow}[NLP-PARALLEL] Timeout, proceeding as dialogue{reset}")
 
-          dim = getattr(TF, 'DIM', '') if TF else ''
-          reset = getattr(TF, 'RESET', '') if TF else ''
-          print(f"{dim}[Interpreted as: {inferred_command_full}]{reset}")
-          _add_profile_action(state, f"Used natural language: '{user_input}' → '{inferred_command_full}'")
-          return process_input_revised(inferred_command_full, state)
-      
-      # Low confidence - proceed with dialogue (use speculative result if available)
-      elif dialogue_thread:
-        dialogue_thread.join(timeout=1.5)  # Wait for dialogue to complete
-        
-        if (dialogue_result_container['completed'] and
-            dialogue_result_container['dialogue_result'] and
-            not dialogue_result_container.get('cancelled', False)):
-          # Use the pre-generated dialogue response!
-          dialogue_data = dialogue_result_container['dialogue_result']
-          logger.info(f"[PARALLEL-PROCESSING] Using speculative dialogue result")
-
-          state['npc_made_new_response_this_turn'] = True
-          _add_profile_action(state, f"Said to NPC: '{user_input[:50]}{'...' if len(user_input) > 50 else ''}'")
-
-          # Return early with the pre-generated response
-          return _build_dialogue_response(state, dialogue_data)
-        else:
-          # Wait longer for dialogue thread to complete to avoid overlapping output
-          if dialogue_thread and dialogue_thread.is_alive():
-            logger.info(f"[PARALLEL-PROCESSING] Waiting for dialogue thread to complete...")
-            dialogue_thread.join(timeout=3.0)  # Wait longer
-
-            # Check again if we got a result
-            if (dialogue_result_container['completed'] and
-                dialogue_result_container['dialogue_result'] and
-                not dialogue_result_container.get('cancelled', False)):
-              dialogue_data = dialogue_result_container['dialogue_result']
-              logger.info(f"[PARALLEL-PROCESSING] Using dialogue result after extended wait")
-
-              state['npc_made_new_response_this_turn'] = True
-              _add_profile_action(state, f"Said to NPC: '{user_input[:50]}{'...' if len(user_input) > 50 else ''}'")
-
-              return _build_dialogue_response(state, dialogue_data)
-
-          logger.info(f"[PARALLEL-PROCESSING] Dialogue not ready, falling back to normal processing")
-    else:
-      # NLP didn't complete - proceed with dialogue if available
-      if dialogue_thread:
-        dialogue_thread.join(timeout=1.5)
-        if (dialogue_result_container['completed'] and
-            dialogue_result_container['dialogue_result'] and
-            not dialogue_result_container.get('cancelled', False)):
-          dialogue_data = dialogue_result_container['dialogue_result']
-          logger.info(f"[PARALLEL-PROCESSING] NLP timeout, using dialogue result")
-
-          state['npc_made_new_response_this_turn'] = True
-          _add_profile_action(state, f"Said to NPC: '{user_input[:50]}{'...' if len(user_input) > 50 else ''}'")
-
-          return _build_dialogue_response(state, dialogue_data)
-      
-      if debug_mode:
-        yellow = getattr(TF, 'YELLOW', '') if TF else ''
-        reset = getattr(TF, 'RESET', '') if TF else ''
-        print(f"{yellow}[NLP-PARALLEL] Timeout, proceeding as dialogue{reset}")
-    
     # If we reach here, proceed with normal dialogue processing
 
   # LLM call for dialogue or forced NPC reaction
@@ -462,7 +394,7 @@ def process_input_revised(user_input: str, state: Dict[str, Any]) -> Dict[str, A
         TF = TF or DummyTF
         yellow = getattr(TF, 'YELLOW', '')
         reset = getattr(TF, 'RESET', '')
-        print(f"{yellow}Session mismatch detected: You are in '{player_area}', but trying to talk to '{current_npc.get('name')}' in '{npc_area}'. Please use /go and /talk to reset your conversation.{reset}")
+        emit(f"{yellow}Session mismatch detected: You are in '{player_area}', but trying to talk to '{current_npc.get('name')}' in '{npc_area}'. Please use /go and /talk to reset your conversation.{reset}")
         _add_profile_action(state, f"Attempted to talk to NPC in wrong area: '{current_npc.get('name')}' in '{npc_area}' while in '{player_area}'")
         state['npc_made_new_response_this_turn'] = False
         return state
@@ -484,7 +416,7 @@ def process_input_revised(user_input: str, state: Dict[str, Any]) -> Dict[str, A
       if not command_processed_this_turn or (is_in_hint_mode and not command_processed_this_turn):
           bold = getattr(TF, 'BOLD', '')
           reset = getattr(TF, 'RESET', '')
-          print(f"\n{bold}{npc_color}{npc_name_for_prompt} > {reset}")
+          emit(f"\n{bold}{npc_color}{npc_name_for_prompt} > {reset}")
 
       try:
         _response_text, stats = chat_session.ask(
@@ -495,6 +427,8 @@ def process_input_revised(user_input: str, state: Dict[str, Any]) -> Dict[str, A
           current_npc, # Pass NPC data for SL command generation
           state # Pass game session state for dynamic system prompt regeneration
         )
+        if _defer_rate_limited_turn(state, stats):
+          return state
         if not _response_text.strip() and not (stats and stats.get("error")):
           dim = getattr(TF, 'DIM', '') if TF else ''
           italic = getattr(TF, 'ITALIC', '') if TF else ''
@@ -505,7 +439,7 @@ def process_input_revised(user_input: str, state: Dict[str, Any]) -> Dict[str, A
             italic = getattr(TF, 'ITALIC', '') if TF else ''
             reset = getattr(TF, 'RESET', '') if TF else ''
             placeholder_msg = f"{dim}{italic}*{state.get('wise_guide_npc_name', 'Guide')} ponders deeply...*{reset}"
-          print(placeholder_msg)
+          emit(placeholder_msg)
 
         state['npc_made_new_response_this_turn'] = True
         if _response_text.strip():
@@ -517,7 +451,7 @@ def process_input_revised(user_input: str, state: Dict[str, Any]) -> Dict[str, A
             track_relationship_changes(state, npc_name_for_prompt, _response_text)
 
         if state.get('auto_show_stats', False) and stats and fmt_stats_func:
-          print(fmt_stats_func(stats))
+          emit(fmt_stats_func(stats))
 
         # MODIFIED: Cache hint if in hint mode
         if is_in_hint_mode and state.get('hint_cache') is not None: # hint_cache is now a dict
@@ -532,14 +466,14 @@ def process_input_revised(user_input: str, state: Dict[str, Any]) -> Dict[str, A
         state['npc_made_new_response_this_turn'] = False
         red = getattr(TF, 'RED', '') if TF else ''
         reset = getattr(TF, 'RESET', '') if TF else ''
-        print(f"{red}LLM Chat Error with {npc_name_for_prompt}: {type(e).__name__} - {e}{reset}")
+        emit(f"{red}LLM Chat Error with {npc_name_for_prompt}: {type(e).__name__} - {e}{reset}")
         if debug_mode:
           traceback.print_exc()
 
     elif user_input: # User typed something but not in a conversation
       yellow = getattr(TF, 'YELLOW', '') if TF else ''
       reset = getattr(TF, 'RESET', '') if TF else ''
-      print(f"{yellow}You're not talking to anyone. Use /go to move to an area, then /talk <npc_name>.{reset}")
+      emit(f"{yellow}You're not talking to anyone. Use /go to move to an area, then /talk <npc_name>.{reset}")
       _add_profile_action(state, f"Attempted to talk while not in conversation: '{user_input[:50]}'")
 
   return state
\ No newline at end of file
@@ -0,0 +1,101 @@
+# content_cache.py
+# Process-wide cache of the static content files that go into NPC system prompts.
+#
+# build_system_prompt used to re-read and re-parse SYSPROMPT.toml, NARRATIVE_FRAMEWORK.txt,
+# ANTEFATTO.txt and the NPC_PREFIX.<area>.<name>.txt files on every dialogue turn. Loaders
+# now go through ContentCache.get(path, loader, variant): the parsed/condensed value is kept
+# per (absolute path, variant) together with the file's mtime and shared by all players.
+# A missing file is cached too (as whatever the loader returns for it), so repeated lookups
+# of absent PREFIX files cost nothing.
+#
+# Entries are revalidated with os.stat at most once per check interval; a changed mtime (or
+# a file appearing/disappearing) reloads the entry. reload() drops everything, and is
+# called by the /api/admin/reload endpoint.
+#
+# Settings:
+#   NEXUS_CONTENT_CACHE                 ("1")  0 reads the files on every call
+#   NEXUS_CONTENT_CACHE_CHECK_INTERVAL  (2.0)  seconds between mtime checks of an entry
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class ContentCache:
+    """mtime-validated cache of values derived from files"""
+
+    def __init__(self, check_interval: Optional[float] = None):
+        if check_interval is None:
+            check_interval = float(os.environ.get('NEXUS_CONTENT_CACHE_CHECK_INTERVAL', '2.0'))
+        self.check_interval = check_interval
+        self._entries: Dict[Tuple[str, Hashable], Tuple[Optional[int], float, Any]] = {}  # -> (mtime, checked_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def get(self, path: str, loader: Callable[[str], Any], variant: Hashable = None) -> Any:
+        """Value of loader(path), reused until the file's mtime changes."""
+        if not content_cache_enabled():
+            return loader(path)
+        key = (os.path.abspath(path), variant)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                mtime, checked_at, value = entry
+                if now - checked_at < self.check_interval:
+                    self.hits += 1
+                    return value
+                if _mtime(key[0]) == mtime:
+                    self._entries[key] = (mtime, now, value)
+                    self.hits += 1
+                    return value
+                logger.info(f"[CONTENT-CACHE] {path} changed on disk, reloading")
+            self.misses += 1
+
+        # Stat before loading so a write racing the load is seen at the next check
+        mtime = _mtime(key[0])
+        value = loader(path)
+        with self._lock:
+            self._entries[key] = (mtime, time.monotonic(), value)
+        return value
+
+    def reload(self) -> None:
+        """Forget every entry; the next get() of each file reads it again"""
+        with self._lock:
+            self._entries.clear()
+            self.reloads += 1
+        logger.info("[CONTENT-CACHE] Cleared, content files will be re-read")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'reloads': self.reloads}
+
+
+def content_cache_enabled() -> bool:
+    return os.environ.get('NEXUS_CONTENT_CACHE', '1') != '0'
+
+
+_global_content_cache: Optional[ContentCache] = None
+_global_content_cache_lock = threading.Lock()
+
+def get_content_cache() -> ContentCache:
+    """Get or create the process-wide content cache"""
+    global _global_content_cache
+    with _global_content_cache_lock:
+        if _global_content_cache is None:
+            _global_content_cache = ContentCache()
+        return _global_content_cache
@@ -0,0 +1,57 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import session_utils
+from content_cache import ContentCache
+
+
+def _touch(path, text, mtime):
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_file_is_loaded_once_until_its_mtime_changes(tmp_path):
+    path = tmp_path / "ANTEFATTO.txt"
+    _touch(path, "prima versione", 1_000_000)
+    cache = ContentCache(check_interval=0)
+    loader = MagicMock(side_effect=lambda p: open(p, encoding="utf-8").read())
+
+    assert cache.get(str(path), loader) == "prima versione"
+    assert cache.get(str(path), loader) == "prima versione"
+    assert loader.call_count == 1
+
+    _touch(path, "seconda versione", 1_000_100)
+    assert cache.get(str(path), loader) == "seconda versione"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_missing_files_are_cached_and_reload_forgets_everything(tmp_path):
+    path = tmp_path / "NPC_PREFIX.tavern.jorin.txt"
+    cache = ContentCache(check_interval=3600)
+    loader = MagicMock(return_value="")
+
+    assert cache.get(str(path), loader) == ""
+    assert cache.get(str(path), loader) == ""
+    assert loader.call_count == 1
+
+    cache.reload()
+    cache.get(str(path), loader)
+    assert loader.call_count == 2 and cache.stats()["reloads"] == 1
+
+
+def test_prompt_content_is_served_from_memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "NPC_PREFIX.tavern.jorin.txt").write_text("Jorin conosce il Velo.", encoding="utf-8")
+    cache = ContentCache(check_interval=3600)
+
+    with patch.object(session_utils, "get_content_cache", return_value=cache):
+        first = (session_utils._load_sysprompt_config(), session_utils._load_narrative_framework(),
+                 session_utils._condense_antefatto_for_npc("", target_chars=1200),
+                 session_utils._load_npc_narrative_prefix("Tavern", "Jorin"))
+        with patch("builtins.open", side_effect=AssertionError("file read on a cached call")):
+            second = (session_utils._load_sysprompt_config(), session_utils._load_narrative_framework(),
+                      session_utils._condense_antefatto_for_npc("", target_chars=1200),
+                      session_utils._load_npc_narrative_prefix("Tavern", "Jorin"))
+
+    assert first == second
+    assert first[3] == "Jorin conosce il Velo."
@@ -0,0 +1,108 @@
+# conversation_summarizer.py
+# Rolling summary (memory compaction) of older NPC conversation turns.
+#
+# When the unsummarized part of a ChatSession, excluding the most recent
+# NEXUS_SUMMARY_KEEP_RECENT messages, grows past NEXUS_SUMMARY_TRIGGER_TOKENS, a
+# background-lane task folds those turns into the session's rolling summary.
+# ChatSession.get_history then sends the summary in place of the summarized turns.
+#
+# Settings:
+#   NEXUS_SUMMARY_TRIGGER_TOKENS  (1500)  unsummarized tokens that trigger a refresh
+#   NEXUS_SUMMARY_KEEP_RECENT     (12)    newest messages never folded into the summary
+#   NEXUS_SUMMARY_MAX_CHARS       (1200)  target length of the summary
+#   NEXUS_SUMMARY_MODEL           (NEXUS_LLSETTEXT_MODEL / OPENROUTER_DEFAULT_MODEL)
+
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from llm_scheduler import get_llm_scheduler, LaneSaturatedError, LANE_BACKGROUND, PRIORITY_BACKGROUND
+from token_budget import BREAK_MARKER_PREFIX, RESUMED_MARKER_PREFIX, estimate_message_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_MARKER_PREFIX = "[CONVERSATION_SUMMARY:"
+
+
+def summary_message(summary: str) -> Dict[str, str]:
+    """The message injected in place of the summarized turns."""
+    return {"role": "user", "content": f"{SUMMARY_MARKER_PREFIX} Riassunto delle conversazioni precedenti: {summary}]"}
+
+
+def _summary_model() -> str:
+    return os.environ.get("NEXUS_SUMMARY_MODEL") or os.environ.get(
+        "NEXUS_LLSETTEXT_MODEL", os.environ.get("OPENROUTER_DEFAULT_MODEL", "google/gemini-2.5-flash"))
+
+
+def build_summary_messages(previous_summary: Optional[str], turns: List[Dict[str, Any]],
+                           max_chars: int) -> List[Dict[str, str]]:
+    transcript = []
+    for msg in turns:
+        content = str(msg.get("content", ""))
+        if content.startswith((BREAK_MARKER_PREFIX, RESUMED_MARKER_PREFIX)):
+            transcript.append("— pausa nella conversazione —")
+        elif msg.get("role") == "user":
+            transcript.append(f"Cercastorie: {content}")
+        else:
+            transcript.append(f"PNG: {content}")
+    return [
+        {"role": "system", "content": (
+            "You maintain the long-term memory of an NPC in an interactive story. "
+            f"Merge the existing summary with the new dialogue into ONE updated summary of at most {max_chars} characters, in Italian. "
+            "Keep facts the NPC must remember: promises, quests offered or completed, items exchanged, names, the player's attitude. "
+            "Drop small talk. Output ONLY the summary text.")},
+        {"role": "user", "content": (
+            f"Riassunto esistente:\n{previous_summary or '(nessuno)'}\n\n"
+            f"Nuovo dialogo:\n" + "\n".join(transcript))},
+    ]
+
+
+def summarize_turns(previous_summary: Optional[str], turns: List[Dict[str, Any]]) -> Optional[str]:
+    """Synchronous LLM call folding `turns` into `previous_summary`. None on failure."""
+    from llm_wrapper import llm_wrapper
+    max_chars = int(os.environ.get("NEXUS_SUMMARY_MAX_CHARS", "1200"))
+    text, stats = llm_wrapper(messages=build_summary_messages(previous_summary, turns, max_chars),
+                              model_name=_summary_model(), stream=False, collect_stats=False,
+                              usage_type="summary")
+    if (stats and stats.get("error")) or not text or not text.strip() or text.startswith("[Errore"):
+        logger.warning(f"[SUMMARY] Summarization failed: {(stats or {}).get('error', 'empty response')}")
+        return None
+    return text.strip()
+
+
+def _run_summary(chat_session: Any, start: int, end: int) -> None:
+    try:
+        summary = summarize_turns(chat_session.rolling_summary, chat_session.messages[start:end])
+        if summary is None or chat_session.summarized_count != start:
+            return  # failed, or the session was cleared or re-summarized meanwhile
+        chat_session.rolling_summary = summary
+        chat_session.summarized_count = end
+        logger.info(f"[SUMMARY] Folded messages {start}-{end} into rolling summary ({len(summary)} chars)")
+        if chat_session.summary_persist is not None:
+            chat_session.summary_persist(summary, end)
+    except Exception as e:
+        logger.error(f"[SUMMARY] Error updating rolling summary: {e}", exc_info=True)
+    finally:
+        chat_session.summary_in_flight = False
+
+
+def maybe_schedule_summary(chat_session: Any) -> bool:
+    """Queues a summary refresh on the background lane when the unsummarized tail is large enough."""
+    if chat_session.summary_in_flight:
+        return False
+    start = chat_session.summarized_count
+    end = len(chat_session.messages) - int(os.environ.get("NEXUS_SUMMARY_KEEP_RECENT", "12"))
+    if end <= start:
+        return False
+    tail_tokens = sum(estimate_message_tokens(m) for m in chat_session.messages[start:end])
+    if tail_tokens < int(os.environ.get("NEXUS_SUMMARY_TRIGGER_TOKENS", "1500")):
+        return False
+
+    chat_session.summary_in_flight = True
+    try:
+        get_llm_scheduler().submit(LANE_BACKGROUND, _run_summary, chat_session, start, end,
+                                   priority=PRIORITY_BACKGROUND)
+    except LaneSaturatedError:
+        chat_session.summary_in_flight = False
+        return False
+    return True
@@ -0,0 +1,56 @@
+import time
+from unittest.mock import patch
+
+import conversation_summarizer
+from chat_manager import ChatSession
+from db_manager import DbManager
+
+
+def _session_with_turns(count):
+    session = ChatSession(model_name="test/model")
+    session.set_system_prompt("Sei Jorin, il locandiere.")
+    for i in range(count):
+        session.add_message("user", f"domanda {i} " + "x" * 200)
+        session.add_message("assistant", f"risposta {i} " + "y" * 200)
+    return session
+
+
+def test_large_tail_is_folded_into_summary_in_background_and_persisted():
+    session = _session_with_turns(10)
+    persisted = []
+    session.summary_persist = lambda summary, count: persisted.append((summary, count))
+
+    env = {"NEXUS_SUMMARY_KEEP_RECENT": "4", "NEXUS_SUMMARY_TRIGGER_TOKENS": "500"}
+    with patch.dict("os.environ", env), \
+            patch.object(conversation_summarizer, "summarize_turns", return_value="Il Cercastorie ha promesso il cristallo.") as summarize:
+        assert conversation_summarizer.maybe_schedule_summary(session)
+        deadline = time.time() + 2
+        while session.summary_in_flight and time.time() < deadline:
+            time.sleep(0.01)
+        assert not conversation_summarizer.maybe_schedule_summary(session)  # tail now below the threshold
+
+    assert summarize.call_args[0] == (None, session.messages[:16])
+    assert (session.rolling_summary, session.summarized_count) == ("Il Cercastorie ha promesso il cristallo.", 16)
+    assert persisted == [("Il Cercastorie ha promesso il cristallo.", 16)]
+
+
+def test_budgeted_history_sends_summary_in_place_of_summarized_turns():
+    session = _session_with_turns(10)
+    session.rolling_summary = "Il Cercastorie ha promesso il cristallo."
+    session.summarized_count = 16
+
+    history = session.get_history(token_budget=10000)
+    assert history[0]["role"] == "system"
+    assert history[1]["content"].startswith(conversation_summarizer.SUMMARY_MARKER_PREFIX)
+    assert "promesso il cristallo" in history[1]["content"]
+    assert history[2:] == session.messages[16:]
+    assert len(session.get_history()) == 21  # unbudgeted history stays complete
+
+
+def test_summary_roundtrip_in_mockup_db(tmp_path):
+    db = DbManager(use_mockup=True, mockup_dir=str(tmp_path))
+    assert db.load_conversation_summary("p1", "jorin") is None
+    db.save_conversation_summary("p1", "jorin", "Riassunto", 8)
+    assert db.load_conversation_summary("p1", "jorin") == {"summary": "Riassunto", "summarized_count": 8}
+    db.save_conversation("p1", "jorin", [{"role": "user", "content": "ciao"}])
+    assert [c.get("npc_code") for c in db.get_conversation_history("p1")] == ["jorin"]
@@ -486,6 +486,57 @@ class DbManager:
                 if cursor: cursor.close()
                 if conn and conn.is_connected(): conn.close()
 
+    def save_conversation_summary(self, player_id: str, npc_code: str, summary: str, summarized_count: int) -> None:
+        """Stores the rolling summary covering the first `summarized_count` messages of a conversation."""
+        if not player_id or not npc_code or not summary: return
+
+        if self.use_mockup:
+            p_dir = self.conversation_dir_template.format(player_id=player_id); os.makedirs(p_dir, exist_ok=True)
+            file_path = os.path.join(p_dir, f"{npc_code}.summary")
+            try:
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump({"summary": summary, "summarized_count": summarized_count}, f, indent=2, ensure_ascii=False)
+            except Exception as e: print(f"Error saving mockup conversation summary {file_path}: {e}")
+        else: # DB
+            conn = None; cursor = None
+            try:
+                conn = self.connect(); cursor = conn.cursor()
+                sql = """
+                      INSERT INTO ConversationSummary (player_id, npc_code, summary, summarized_count, last_updated)
+                      VALUES (%s, %s, %s, %s, NOW())
+                          ON DUPLICATE KEY UPDATE summary = VALUES(summary), summarized_count = VALUES(summarized_count), last_updated = NOW(); \
+                      """
+                cursor.execute(sql, (player_id, npc_code, summary, summarized_count))
+                conn.commit()
+            except Exception as e:
+                if conn: conn.rollback()
+            finally:
+                if cursor: cursor.close()
+                if conn and conn.is_connected(): conn.close()
+
+    def load_conversation_summary(self, player_id: str, npc_code: str) -> Optional[Dict[str, Any]]:
+        """Returns {'summary', 'summarized_count'} for a conversation, or None when it has no summary yet."""
+        if not player_id or not npc_code: return None
+        if self.use_mockup:
+            file_path = os.path.join(self.conversation_dir_template.format(player_id=player_id), f"{npc_code}.summary")
+            if os.path.exists(file_path):
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as f: return json.load(f)
+                except Exception: return None
+            return None
+        else: # DB
+            conn = None; cursor = None
+            try:
+                conn = self.connect(); cursor = conn.cursor()
+                cursor.execute("SELECT summary, summarized_count FROM ConversationSummary WHERE player_id = %s AND npc_code = %s", (player_id, npc_code))
+                result = cursor.fetchone()
+                return {"summary": result[0], "summarized_count": result[1]} if result and result[0] else None
+            except Exception as e:
+                return None
+            finally:
+                if cursor: cursor.close()
+                if conn and conn.is_connected(): conn.close()
+
     def get_conversation_history(self, player_id: str, npc_name: str = None) -> List[Dict[str, Any]]:
         """Get conversation history for a player, optionally filtered by NPC."""
         if not player_id: return []
@@ -569,6 +620,7 @@ class DbManager:
             try:
                 conn = self.connect(); cursor = conn.cursor()
                 cursor.execute("DELETE FROM ConversationHistory WHERE player_id = %s", (player_id,))
+                cursor.execute("DELETE FROM ConversationSummary WHERE player_id = %s", (player_id,))
                 conn.commit()
                 return True
             except Exception as e:
@@ -1386,6 +1438,20 @@ class DbManager:
                                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
                            """
             )
+            self._ensure_table_exists(
+                table_name="ConversationSummary",
+                create_sql="""
+                           CREATE TABLE IF NOT EXISTS ConversationSummary (
+                                                                              player_id VARCHAR(255) NOT NULL,
+                               npc_code VARCHAR(255) NOT NULL,
+                               summary TEXT NOT NULL,
+                               summarized_count INT NOT NULL DEFAULT 0,
+                               last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                               PRIMARY KEY (player_id, npc_code)
+                               ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+                           """,
+                check_column='summarized_count'
+            )
             self._ensure_table_exists(
                 table_name="PlayerProfiles",
                 create_sql="""
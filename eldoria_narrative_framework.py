@@ -212,6 +212,7 @@ def validate_narrative_against_framework(narrative_text: str,
             model_name=model_name,
             stream=False,
             collect_stats=False,
+            usage_type="narrative_validation",
         )
     except Exception as e:
         import logging
@@ -0,0 +1,365 @@
+# fake_llm_server.py
+# Local stand-in for the OpenRouter and Anthropic HTTP APIs, for offline load tests.
+#
+# Speaks POST /api/v1/chat/completions (OpenRouter/OpenAI shape, SSE or JSON, with
+# usage and prompt_tokens_details.cached_tokens) and POST /v1/messages (Anthropic
+# shape, SSE events or JSON). Point llm_wrapper at it with:
+#   OPENROUTER_API_BASE=http://127.0.0.1:8765/api/v1
+#   ANTHROPIC_API_BASE=http://127.0.0.1:8765/v1
+# (any non-empty OPENROUTER_API_KEY / ANTHROPIC_API_KEY is accepted).
+#
+# Settings (CLI flags override):
+#   NEXUS_FAKE_LLM_TTFT            (0.4)   seconds before the first token
+#   NEXUS_FAKE_LLM_TOKENS_PER_SEC  (40)    streaming speed after the first token
+#   NEXUS_FAKE_LLM_ERROR_RATE      (0)     fraction of requests answered with HTTP 500
+#   NEXUS_FAKE_LLM_429_RATE        (0)     fraction of requests answered with HTTP 429
+#   NEXUS_FAKE_LLM_REPLY           canned reply template; {model}, {last_user} and
+#                                  {turn} are substituted
+#
+# Prompt caching is simulated: a system prompt seen before is reported as cached.
+#
+#   python fake_llm_server.py --port 8765 --ttft 0.8 --tps 30 --rate-limit-rate 0.05
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+from token_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_PATH = '/api/v1/chat/completions'
+ANTHROPIC_PATH = '/v1/messages'
+
+DEFAULT_REPLY = ("*{model} annuisce lentamente* Le tue parole mi arrivano chiare, Cercastorie: "
+                 "\"{last_user}\". Il Velo trema ancora, ma oggi possiamo parlarne con calma.")
+
+
+@dataclass
+class FakeLLMConfig:
+    ttft: float = 0.4
+    tokens_per_sec: float = 40.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: int = 1
+    reply: str = DEFAULT_REPLY
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> 'FakeLLMConfig':
+        return cls(
+            ttft=float(os.environ.get('NEXUS_FAKE_LLM_TTFT', '0.4')),
+            tokens_per_sec=float(os.environ.get('NEXUS_FAKE_LLM_TOKENS_PER_SEC', '40')),
+            error_rate=float(os.environ.get('NEXUS_FAKE_LLM_ERROR_RATE', '0')),
+            rate_limit_rate=float(os.environ.get('NEXUS_FAKE_LLM_429_RATE', '0')),
+            reply=os.environ.get('NEXUS_FAKE_LLM_REPLY', DEFAULT_REPLY),
+        )
+
+
+@dataclass
+class FakeLLMStats:
+    requests: int = 0
+    streamed: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    by_path: Dict[str, int] = field(default_factory=dict)
+
+
+def split_tokens(text: str) -> List[str]:
+    """Splits a reply into word-sized stream chunks (leading whitespace kept on each chunk)."""
+    return re.findall(r'\s*\S+', text) or [text]
+
+
+class FakeLLMServer:
+    """Threaded HTTP server answering like OpenRouter and Anthropic with configurable timing and faults."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, config: Optional[FakeLLMConfig] = None):
+        self.config = config or FakeLLMConfig.from_env()
+        self.stats = FakeLLMStats()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._seen_prefixes: "OrderedDict[str, None]" = OrderedDict()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeLLMServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-llm-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> 'FakeLLMServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # --- request model ---
+
+    def pick_fault(self) -> Optional[int]:
+        """HTTP status to inject for the next request, or None to answer normally."""
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.config.rate_limit_rate:
+            return 429
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            return 500
+        return None
+
+    def cached_prompt_tokens(self, system_prompt: str) -> int:
+        """Simulates provider prefix caching: the system prompt is cached from its second use on."""
+        if not system_prompt:
+            return 0
+        key = hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()
+        with self._lock:
+            seen = key in self._seen_prefixes
+            self._seen_prefixes[key] = None
+            self._seen_prefixes.move_to_end(key)
+            while len(self._seen_prefixes) > 1000:
+                self._seen_prefixes.popitem(last=False)
+        return estimate_tokens(system_prompt) if seen else 0
+
+    def render_reply(self, model: str, messages: List[Dict[str, Any]]) -> str:
+        last_user = next((_content_text(m.get('content')) for m in reversed(messages)
+                          if m.get('role') == 'user'), '')
+        turn = sum(1 for m in messages if m.get('role') == 'user')
+        return self.config.reply.format(model=model, last_user=last_user[:120], turn=turn)
+
+    def token_delays(self, count: int) -> Iterator[float]:
+        """Sleep before each streamed token: TTFT first, then 1/tokens_per_sec."""
+        interval = 1.0 / self.config.tokens_per_sec if self.config.tokens_per_sec > 0 else 0.0
+        for i in range(count):
+            yield self.config.ttft if i == 0 else interval
+
+    def _record(self, path: str, stream: bool, fault: Optional[int]) -> None:
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.by_path[path] = self.stats.by_path.get(path, 0) + 1
+            if stream:
+                self.stats.streamed += 1
+            if fault == 429:
+                self.stats.rate_limited += 1
+            elif fault:
+                self.stats.errors += 1
+
+    def _handler_class(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real providers
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != '/stats':
+                    self._send_json(404, {'error': {'message': 'not found'}})
+                    return
+                with server._lock:
+                    self._send_json(200, dict(server.stats.__dict__, by_path=dict(server.stats.by_path)))
+
+            def do_POST(self):
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                except json.JSONDecodeError:
+                    self._send_json(400, {'error': {'message': 'invalid JSON body'}})
+                    return
+                if self.path not in (OPENROUTER_PATH, ANTHROPIC_PATH):
+                    self._send_json(404, {'error': {'message': f'unknown path {self.path}'}})
+                    return
+
+                stream = bool(body.get('stream'))
+                fault = server.pick_fault()
+                server._record(self.path, stream, fault)
+                if fault == 429:
+                    time.sleep(min(server.config.ttft, 0.05))
+                    self._send_json(429, {'error': {'message': 'Rate limit exceeded (fake)', 'code': 429}},
+                                    {'Retry-After': str(server.config.retry_after)})
+                    return
+                if fault:
+                    time.sleep(server.config.ttft)
+                    self._send_json(fault, {'error': {'message': 'Upstream error (fake)', 'code': fault}})
+                    return
+
+                if self.path == OPENROUTER_PATH:
+                    self._openrouter(body, stream)
+                else:
+                    self._anthropic(body, stream)
+
+            # --- OpenRouter / OpenAI shape ---
+
+            def _openrouter(self, body: Dict[str, Any], stream: bool) -> None:
+                model = body.get('model', 'fake/model')
+                messages = body.get('messages', [])
+                system_prompt = ''.join(_content_text(m.get('content')) for m in messages if m.get('role') == 'system')
+                reply = server.render_reply(model, messages)
+                prompt_tokens, completion_tokens = _prompt_tokens(messages), estimate_tokens(reply)
+                usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                         'total_tokens': prompt_tokens + completion_tokens,
+                         'prompt_tokens_details': {'cached_tokens': server.cached_prompt_tokens(system_prompt)}}
+                completion_id = f'gen-fake-{int(time.time() * 1000)}'
+
+                if not stream:
+                    time.sleep(server.config.ttft + _stream_seconds(server.config, completion_tokens))
+                    self._send_json(200, {'id': completion_id, 'model': model, 'object': 'chat.completion',
+                                          'choices': [{'index': 0, 'finish_reason': 'stop',
+                                                       'message': {'role': 'assistant', 'content': reply}}],
+                                          'usage': usage})
+                    return
+
+                self._start_sse()
+                chunks = split_tokens(reply)
+                for token, delay in zip(chunks, server.token_delays(len(chunks))):
+                    time.sleep(delay)
+                    self._sse_data({'id': completion_id, 'model': model, 'object': 'chat.completion.chunk',
+                                    'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]})
+                self._sse_data({'id': completion_id, 'model': model, 'object': 'chat.completion.chunk',
+                                'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+                if body.get('usage', {}).get('include'):
+                    self._sse_data({'id': completion_id, 'model': model, 'choices': [], 'usage': usage})
+                self._sse_raw(b'data: [DONE]\n\n')
+                self._end_sse()
+
+            # --- Anthropic shape ---
+
+            def _anthropic(self, body: Dict[str, Any], stream: bool) -> None:
+                model = body.get('model', 'claude-fake')
+                messages = body.get('messages', [])
+                system_prompt = _content_text(body.get('system'))
+                reply = server.render_reply(model, messages)
+                cached = server.cached_prompt_tokens(system_prompt)
+                input_tokens = _prompt_tokens(messages) + estimate_tokens(system_prompt)
+                output_tokens = estimate_tokens(reply)
+                usage = {'input_tokens': input_tokens - cached, 'cache_read_input_tokens': cached,
+                         'cache_creation_input_tokens': 0, 'output_tokens': output_tokens}
+                message_id = f'msg_fake_{int(time.time() * 1000)}'
+
+                if not stream:
+                    time.sleep(server.config.ttft + _stream_seconds(server.config, output_tokens))
+                    self._send_json(200, {'id': message_id, 'type': 'message', 'role': 'assistant', 'model': model,
+                                          'content': [{'type': 'text', 'text': reply}],
+                                          'stop_reason': 'end_turn', 'usage': usage})
+                    return
+
+                self._start_sse()
+                self._sse_event('message_start', {'type': 'message_start', 'message': {
+                    'id': message_id, 'type': 'message', 'role': 'assistant', 'model': model, 'content': [],
+                    'usage': dict(usage, output_tokens=1)}})
+                self._sse_event('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                                        'content_block': {'type': 'text', 'text': ''}})
+                chunks = split_tokens(reply)
+                for token, delay in zip(chunks, server.token_delays(len(chunks))):
+                    time.sleep(delay)
+                    self._sse_event('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                                            'delta': {'type': 'text_delta', 'text': token}})
+                self._sse_event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+                self._sse_event('message_delta', {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'},
+                                                  'usage': {'output_tokens': output_tokens}})
+                self._sse_event('message_stop', {'type': 'message_stop'})
+                self._end_sse()
+
+            # --- wire helpers ---
+
+            def _send_json(self, status: int, payload: Dict[str, Any],
+                           extra_headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (extra_headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _start_sse(self) -> None:
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+
+            def _sse_raw(self, data: bytes) -> None:
+                self.wfile.write(f'{len(data):X}\r\n'.encode() + data + b'\r\n')
+                self.wfile.flush()
+
+            def _sse_data(self, payload: Dict[str, Any]) -> None:
+                self._sse_raw(f'data: {json.dumps(payload)}\n\n'.encode('utf-8'))
+
+            def _sse_event(self, event: str, payload: Dict[str, Any]) -> None:
+                self._sse_raw(f'event: {event}\ndata: {json.dumps(payload)}\n\n'.encode('utf-8'))
+
+            def _end_sse(self) -> None:
+                self.wfile.write(b'0\r\n\r\n')
+                self.wfile.flush()
+
+        return _Handler
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, list):  # content blocks
+        return ''.join(block.get('text', '') for block in content if isinstance(block, dict))
+    return str(content or '')
+
+
+def _prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(estimate_tokens(_content_text(m.get('content'))) + 4 for m in messages)
+
+
+def _stream_seconds(config: FakeLLMConfig, tokens: int) -> float:
+    return tokens / config.tokens_per_sec if config.tokens_per_sec > 0 else 0.0
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    defaults = FakeLLMConfig.from_env()
+    parser = argparse.ArgumentParser(description='Local OpenRouter/Anthropic stand-in for offline load tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--ttft', type=float, default=defaults.ttft, help='seconds to first token')
+    parser.add_argument('--tps', type=float, default=defaults.tokens_per_sec, help='streamed tokens per second')
+    parser.add_argument('--error-rate', type=float, default=defaults.error_rate, help='fraction of HTTP 500 replies')
+    parser.add_argument('--rate-limit-rate', type=float, default=defaults.rate_limit_rate,
+                        help='fraction of HTTP 429 replies')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--reply', default=defaults.reply, help='reply template ({model}, {last_user}, {turn})')
+    parser.add_argument('--seed', type=int, default=None, help='seed for fault injection')
+    args = parser.parse_args(argv)
+
+    config = FakeLLMConfig(ttft=args.ttft, tokens_per_sec=args.tps, error_rate=args.error_rate,
+                           rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                           reply=args.reply, seed=args.seed)
+    server = FakeLLMServer(args.host, args.port, config)
+    print(f"[FAKE-LLM] Listening on {server.base_url}")
+    print(f"[FAKE-LLM]   OPENROUTER_API_BASE={server.base_url}/api/v1")
+    print(f"[FAKE-LLM]   ANTHROPIC_API_BASE={server.base_url}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import requests
+import pytest
+
+import llm_resilience
+from fake_llm_server import FakeLLMConfig, FakeLLMServer
+from llm_wrapper import llm_wrapper
+
+MESSAGES = [{"role": "system", "content": "Sei Jorin, il locandiere. " * 20},
+            {"role": "user", "content": "Hai una stanza libera?"}]
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    config = FakeLLMConfig(ttft=0.01, tokens_per_sec=0, reply="Certo, {last_user}", seed=1)
+    with FakeLLMServer(config=config) as server:
+        monkeypatch.setenv("OPENROUTER_API_BASE", f"{server.base_url}/api/v1")
+        monkeypatch.setenv("ANTHROPIC_API_BASE", f"{server.base_url}/v1")
+        monkeypatch.setenv("OPENROUTER_API_KEY", "fake-key")
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "fake-key")
+        monkeypatch.setenv("NEXUS_LLM_RETRIES", "0")
+        llm_resilience.reset_breakers()
+        yield server
+    llm_resilience.reset_breakers()
+
+
+def test_llm_wrapper_streams_from_fake_openrouter_with_usage_and_cache(fake_server):
+    tokens = []
+    text, stats = llm_wrapper(MESSAGES, model_name="fake/model", stream=True, collect_stats=True,
+                              on_token=tokens.append)
+    assert text == "Certo, Hai una stanza libera?" == "".join(tokens)
+    assert stats["time_to_first_token"] is not None
+    assert stats["cached_tokens"] == 0
+
+    text, stats = llm_wrapper(MESSAGES, model_name="fake/model", stream=False, collect_stats=True)
+    assert text == "Certo, Hai una stanza libera?"
+    assert stats["cached_tokens"] > 0 and stats["input_tokens"] > stats["cached_tokens"]
+    assert fake_server.stats.by_path == {"/api/v1/chat/completions": 2}
+
+
+def test_llm_wrapper_reads_anthropic_stream_usage(fake_server):
+    text, stats = llm_wrapper(MESSAGES, model_name=llm_resilience.ANTHROPIC_DIRECT_MODEL, stream=True,
+                              collect_stats=True, on_token=lambda token: None)
+    assert text == "Certo, Hai una stanza libera?"
+    assert stats["output_tokens"] > 0 and stats["input_tokens"] > 0
+
+
+def test_rate_limit_injection_sends_retry_after(fake_server):
+    fake_server.config.rate_limit_rate = 1.0
+    response = requests.post(f"{fake_server.base_url}/api/v1/chat/completions",
+                             json={"model": "fake/model", "messages": MESSAGES}, timeout=5)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert fake_server.stats.rate_limited == 1
@@ -1,4 +1,5 @@
 # game_system_api.py
+import os
 import sys
 import traceback
 import copy
@@ -6,8 +7,12 @@ import threading
 import time
 import logging
 import hashlib
+import weakref
 from typing import Dict, List, Any, Optional, Tuple, Callable
 import re
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import wait as futures_wait
 
 # Assume all necessary modules are in PYTHONPATH or imported correctly
 from db_manager import DbManager
@@ -15,6 +20,8 @@ from chat_manager import ChatSession, format_stats
 from llm_wrapper import llm_wrapper
 import session_utils
 import command_processor
+import output_channel
+from llm_scheduler import get_llm_scheduler, LaneSaturatedError, LANE_BACKGROUND, PRIORITY_BACKGROUND
 from player_profile_manager import update_player_profile, get_default_player_profile
 from main_utils import get_nlp_command_config, format_npcs_list, get_help_text
 from wise_guide_selector import get_wise_guide_npc_name
@@ -82,7 +89,7 @@ class _SinglePlayerGameSystem:
             'game_system_instance': self,  # Reference for accessing cached data
         }
         # Async profile update tracking
-        self._profile_update_thread = None
+        self._profile_update_future = None
         self._pending_profile_update = False
         self.output_buffer: List[str] = []
         
@@ -203,9 +210,9 @@ class _SinglePlayerGameSystem:
 
     def wait_for_profile_update(self, timeout: float = 0.5) -> bool:
         """Wait for profile update to complete with timeout. Returns True if completed."""
-        if self._profile_update_thread and self._profile_update_thread.is_alive():
-            self._profile_update_thread.join(timeout=timeout)
-            return not self._profile_update_thread.is_alive()
+        if self._profile_update_future and not self._profile_update_future.done():
+            futures_wait([self._profile_update_future], timeout=timeout)
+            return self._profile_update_future.done()
         return True
 
     def _auto_start_initial_conversation(self):
@@ -244,6 +251,7 @@ class _SinglePlayerGameSystem:
         self.output_buffer = []
         self.game_state['npc_made_new_response_this_turn'] = False
         self.game_state['actions_this_turn_for_profile'] = []
+        self.game_state['llm_retry_after'] = None
 
         # Pre-load context for better performance
         current_npc = self.game_state.get('current_npc', {})
@@ -255,15 +263,8 @@ class _SinglePlayerGameSystem:
             self.game_state.get('player_profile_cache', get_default_player_profile())
         )
 
-        original_stdout = sys.stdout
-        class CaptureStdout:
-            def __init__(self, buffer_list):
-                self.buffer_list = buffer_list
-            def write(self, s):
-                self.buffer_list.append(s)
-            def flush(self):
-                pass
-        sys.stdout = CaptureStdout(self.output_buffer)
+        # Output printed while handling this request goes to this request's buffer only
+        sink_token = output_channel.bind_sink(self.output_buffer)
 
         try:
             if self.game_state is None:
@@ -296,20 +297,23 @@ class _SinglePlayerGameSystem:
                 current_npc_obj_for_profile = self.game_state.get('current_npc')
                 npc_name_for_profile_update = current_npc_obj_for_profile.get('name') if current_npc_obj_for_profile else None
 
-                # Start async profile update
+                # Start async profile update on the background LLM lane
                 self._pending_profile_update = True
-                self._profile_update_thread = threading.Thread(
-                    target=self._async_profile_update,
-                    args=(initial_profile_for_comparison, interaction_log_for_profile, npc_name_for_profile_update),
-                    daemon=True
-                )
-                self._profile_update_thread.start()
-                logger.info(f"[PROFILE-ASYNC] Started background thread for {self.game_state['player_id']}")
+                try:
+                    self._profile_update_future = get_llm_scheduler().submit(
+                        LANE_BACKGROUND, self._async_profile_update,
+                        initial_profile_for_comparison, interaction_log_for_profile, npc_name_for_profile_update,
+                        priority=PRIORITY_BACKGROUND
+                    )
+                    logger.info(f"[PROFILE-ASYNC] Queued background profile update for {self.game_state['player_id']}")
+                except LaneSaturatedError as e:
+                    self._pending_profile_update = False
+                    logger.warning(f"[PROFILE-ASYNC] Skipping profile update for {self.game_state['player_id']}: {e}")
 
             logger.info(f"[DEBUG] End of try block, game_state is None: {self.game_state is None}")
 
         finally:
-            sys.stdout = original_stdout
+            output_channel.release_sink(sink_token)
             logger.info(f"[DEBUG] Start of finally block, game_state is None: {self.game_state is None}, type: {type(self.game_state)}")
 
             current_npc_name_for_filter = None
@@ -590,7 +594,8 @@ class _SinglePlayerGameSystem:
             'credits': self.game_state['player_credits_cache'],
             'profile_summary': self._get_profile_summary_for_api(),
             'status': self.game_state.get('status', 'ok'),
-            'last_speaker_for_suffix': last_speaker_for_suffix
+            'last_speaker_for_suffix': last_speaker_for_suffix,
+            'retry_after': self.game_state.get('llm_retry_after')  # set when no model had capacity to reply
         }
 
     def _get_profile_summary_for_api(self) -> str:
@@ -604,6 +609,38 @@ class _SinglePlayerGameSystem:
         return f"Traits: {trait_desc}. LLM notes: {llm_analysis_notes[:100]}..."
 
 
+class _PlayerTurnQueue:
+    """FIFO ticket lock: turns for one player run one at a time, in arrival order."""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._next_ticket = 0
+        self._now_serving = 0
+
+    def take_ticket(self) -> int:
+        """Joins the queue; from here on the queue is busy until the matching release()."""
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            return ticket
+
+    def wait(self, ticket: int) -> float:
+        """Blocks until it is this ticket's turn. Returns the time spent queued (seconds)."""
+        start_time = time.time()
+        with self._cond:
+            while ticket != self._now_serving:
+                self._cond.wait()
+        return time.time() - start_time
+
+    def release(self) -> None:
+        with self._cond:
+            self._now_serving += 1
+            self._cond.notify_all()
+
+    @property
+    def busy(self) -> bool:
+        return self._next_ticket != self._now_serving
+
+
 class GameSystem:
     """
     Manages multiple single-player game systems.
@@ -634,12 +671,99 @@ class GameSystem:
         self.profile_analysis_model_name = profile_analysis_model_name
         self.debug_mode = debug_mode
 
-        self._player_systems: Dict[str, _SinglePlayerGameSystem] = {}
+        # Resident player sessions, most recently used last (LRU order).
+        self._player_systems: "OrderedDict[str, _SinglePlayerGameSystem]" = OrderedDict()
+        self._player_last_access: Dict[str, float] = {}
+        self._registry_lock = threading.Lock()
+        # Held (referenced) only while a session is being built or flushed, so entries go away on their own.
+        self._construction_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+        # Dropped together with an idle evicted/closed session (see _drop_idle_turn_queue).
+        self._turn_queues: Dict[str, _PlayerTurnQueue] = {}
+        self.max_resident_players = max(1, int(os.environ.get('NEXUS_MAX_RESIDENT_PLAYERS', '200')))
+        self.player_idle_timeout = float(os.environ.get('NEXUS_PLAYER_IDLE_TIMEOUT', '1800'))
+
+    def _get_construction_lock(self, player_id: str) -> threading.Lock:
+        with self._registry_lock:
+            return self._construction_lock_locked(player_id)
+
+    def _construction_lock_locked(self, player_id: str) -> threading.Lock:
+        lock = self._construction_locks.get(player_id)
+        if lock is None:
+            lock = threading.Lock()
+            self._construction_locks[player_id] = lock
+        return lock
+
+    def _join_turn_queue(self, player_id: str) -> Tuple[_PlayerTurnQueue, int]:
+        # The ticket is taken under the registry lock, so eviction never drops a queue
+        # that a caller has looked up but not yet joined.
+        with self._registry_lock:
+            queue = self._turn_queues.get(player_id)
+            if queue is None:
+                queue = _PlayerTurnQueue()
+                self._turn_queues[player_id] = queue
+            return queue, queue.take_ticket()
+
+    def _drop_idle_turn_queue(self, player_id: str) -> None:
+        """Forgets the player's turn queue if no turn is running or waiting. Caller holds _registry_lock."""
+        queue = self._turn_queues.get(player_id)
+        if queue is not None and not queue.busy:
+            del self._turn_queues[player_id]
+
+    def acquire_player_turn(self, player_id: str) -> Tuple[_SinglePlayerGameSystem, float]:
+        """
+        Waits for this player's previous turns to finish, then returns the player's
+        session and the queue wait in seconds. Different players never block each other.
+        Must be paired with release_player_turn.
+        """
+        queue, ticket = self._join_turn_queue(player_id)
+        queue_wait = queue.wait(ticket)
+        try:
+            player_system = self.get_player_system(player_id)
+        except Exception:
+            queue.release()
+            raise
+        if queue_wait > 0.05:
+            logger.info(f"[PLAYER-TURN] {player_id} waited {int(queue_wait * 1000)}ms for previous turn")
+        return player_system, queue_wait
+
+    def release_player_turn(self, player_id: str) -> None:
+        with self._registry_lock:
+            queue = self._turn_queues.get(player_id)  # busy, so it cannot have been dropped
+        if queue is not None:
+            queue.release()
+
+    @contextmanager
+    def player_turn(self, player_id: str):
+        """Context-manager form of acquire_player_turn/release_player_turn."""
+        player_system, queue_wait = self.acquire_player_turn(player_id)
+        try:
+            yield player_system, queue_wait
+        finally:
+            self.release_player_turn(player_id)
+
+    def _touch_player(self, player_id: str) -> Optional[_SinglePlayerGameSystem]:
+        """Return the resident session (if any) and mark it as most recently used."""
+        with self._registry_lock:
+            player_system = self._player_systems.get(player_id)
+            if player_system is not None:
+                self._player_systems.move_to_end(player_id)
+                self._player_last_access[player_id] = time.time()
+            return player_system
 
     def get_player_system(self, player_id: str) -> _SinglePlayerGameSystem:
-        if player_id not in self._player_systems:
+        player_system = self._touch_player(player_id)
+        if player_system is not None:
+            return player_system
+
+        # One construction per player: concurrent callers for the same id wait here
+        # instead of building a second session (and paying for a second auto-start).
+        with self._get_construction_lock(player_id):
+            player_system = self._touch_player(player_id)
+            if player_system is not None:
+                return player_system
+
             print(f"[GameSystem Manager] Creating new session for player: {player_id}")
-            self._player_systems[player_id] = _SinglePlayerGameSystem(
+            player_system = _SinglePlayerGameSystem(
                 db=self.db,
                 story=self.story,
                 wise_guide_npc_name=self.wise_guide_npc_name,
@@ -648,13 +772,75 @@ class GameSystem:
                 profile_analysis_model_name=self.profile_analysis_model_name,
                 debug_mode=self.debug_mode
             )
-        return self._player_systems[player_id]
+            with self._registry_lock:
+                self._player_systems[player_id] = player_system
+                self._player_last_access[player_id] = time.time()
+
+        self.evict_players(exclude=player_id)
+        return player_system
+
+    def _flush_player_system(self, player_system: _SinglePlayerGameSystem) -> None:
+        """Persist a session's state and conversation so it can be rehydrated later."""
+        if hasattr(player_system, 'wait_for_profile_update'):
+            player_system.wait_for_profile_update(timeout=2.0)
+        game_state = player_system.game_state or {}
+        player_id = game_state.get('player_id')
+        if not player_id:
+            return
+        try:
+            self.db.save_player_state(player_id, game_state)
+            if game_state.get('current_npc') and game_state.get('chat_session'):
+                session_utils.save_current_conversation(
+                    self.db, player_id, game_state['current_npc'],
+                    game_state['chat_session'], TerminalFormatter, game_state
+                )
+        except Exception as e:
+            logger.error(f"[SESSION-REGISTRY] Error flushing session for {player_id}: {e}")
+
+    def evict_players(self, exclude: Optional[str] = None) -> List[str]:
+        """
+        Hibernates idle sessions and trims the registry down to max_resident_players.
+        Evicted sessions are flushed to the DB and rebuilt on their next request.
+        """
+        now = time.time()
+        to_evict: List[Tuple[str, _SinglePlayerGameSystem, threading.Lock]] = []
+        with self._registry_lock:
+            resident = len(self._player_systems)
+            for pid in list(self._player_systems.keys()):  # oldest first
+                if pid == exclude:
+                    continue
+                turn_queue = self._turn_queues.get(pid)
+                if turn_queue is not None and turn_queue.busy:
+                    continue  # never evict a session mid-turn
+                idle_for = now - self._player_last_access.get(pid, now)
+                over_capacity = resident - len(to_evict) > self.max_resident_players
+                if not over_capacity and (self.player_idle_timeout <= 0 or idle_for < self.player_idle_timeout):
+                    continue
+                # The construction lock is taken before the session leaves the registry and held
+                # through the flush, so a rehydration for this id waits for the flushed state.
+                # Non-blocking: get_player_system takes the two locks in the opposite order.
+                construction_lock = self._construction_lock_locked(pid)
+                if not construction_lock.acquire(blocking=False):
+                    continue  # being built right now, so not idle
+                to_evict.append((pid, self._player_systems.pop(pid), construction_lock))
+                self._player_last_access.pop(pid, None)
+                self._drop_idle_turn_queue(pid)
+
+        for pid, player_system, construction_lock in to_evict:
+            try:
+                self._flush_player_system(player_system)
+            finally:
+                construction_lock.release()
+            logger.info(f"[SESSION-REGISTRY] Evicted session for {pid}")
+        return [pid for pid, _, _ in to_evict]
 
     def close_player_session(self, player_id: str) -> None:
-        if player_id in self._player_systems:
+        with self._registry_lock:
+            player_system = self._player_systems.pop(player_id, None)
+            self._player_last_access.pop(player_id, None)
+            self._drop_idle_turn_queue(player_id)
+        if player_system is not None:
             # Wait for any pending profile updates before closing
-            player_system = self._player_systems[player_id]
             if hasattr(player_system, 'wait_for_profile_update'):
                 player_system.wait_for_profile_update(timeout=2.0)
-            del self._player_systems[player_id]
             print(f"[GameSystem Manager] Closed session for player: {player_id}")
@@ -0,0 +1,135 @@
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+
+import game_system_api
+from game_system_api import GameSystem
+
+
+class _FakePlayerSystem:
+    def __init__(self, db, story, wise_guide_npc_name, player_id, model_name,
+                 profile_analysis_model_name, debug_mode):
+        time.sleep(0.05)  # widen the construction race window
+        self.game_state = {'player_id': player_id, 'current_npc': None, 'chat_session': None}
+        self.wait_for_profile_update = MagicMock(return_value=True)
+
+
+@pytest.fixture
+def game_system(monkeypatch):
+    monkeypatch.setenv('NEXUS_MAX_RESIDENT_PLAYERS', '2')
+    monkeypatch.setenv('NEXUS_PLAYER_IDLE_TIMEOUT', '60')
+    with patch.object(game_system_api, 'DbManager') as mock_db_cls, \
+         patch.object(game_system_api, 'get_wise_guide_npc_name', return_value=None), \
+         patch.object(game_system_api, '_SinglePlayerGameSystem', _FakePlayerSystem):
+        mock_db_cls.return_value.get_storyboard.return_value = {'description': 'Test story'}
+        yield GameSystem(use_mockup=True)
+
+
+def test_concurrent_get_player_system_builds_once(game_system):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(game_system.get_player_system('p1')))
+               for _ in range(5)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert len(results) == 5
+    assert all(r is results[0] for r in results)
+
+
+def test_construction_locks_do_not_outlive_their_use(game_system):
+    for i in range(20):
+        game_system.get_player_system(f'p{i}')
+    game_system.close_player_session('p19')
+    assert list(game_system._player_systems) == ['p18']
+    assert len(game_system._construction_locks) == 0
+
+
+def test_lru_eviction_flushes_state_and_rehydrates(game_system):
+    p1 = game_system.get_player_system('p1')
+    game_system.get_player_system('p2')
+    game_system.get_player_system('p1')  # p2 is now least recently used
+    game_system.get_player_system('p3')
+
+    assert list(game_system._player_systems.keys()) == ['p1', 'p3']
+    game_system.db.save_player_state.assert_called_once()
+    assert game_system.db.save_player_state.call_args[0][0] == 'p2'
+
+    assert game_system.get_player_system('p1') is p1
+    rehydrated = game_system.get_player_system('p2')
+    assert rehydrated.game_state['player_id'] == 'p2'
+
+
+def test_idle_sessions_are_hibernated(game_system):
+    game_system.get_player_system('p1')
+    game_system._player_last_access['p1'] -= 120
+    assert game_system.evict_players() == ['p1']
+    assert 'p1' not in game_system._player_systems
+
+
+def test_player_turns_are_serialized_but_players_run_in_parallel(game_system):
+    events = []
+
+    def turn(player_id, tag):
+        with game_system.player_turn(player_id) as (_, queue_wait):
+            events.append(('start', tag))
+            time.sleep(0.1)
+            events.append(('end', tag))
+
+    same = [threading.Thread(target=turn, args=('p1', f'p1-{i}')) for i in range(2)]
+    other = threading.Thread(target=turn, args=('p2', 'p2'))
+    for t in same + [other]: t.start()
+    for t in same + [other]: t.join()
+
+    p1_events = [e for e in events if e[1].startswith('p1')]
+    assert [kind for kind, _ in p1_events] == ['start', 'end', 'start', 'end']
+    # p2 did not queue behind both of p1's turns
+    assert events.index(('start', 'p2')) < events.index(p1_events[-1])
+
+
+def test_busy_player_is_not_evicted(game_system):
+    game_system.get_player_system('p1')
+    game_system._player_last_access['p1'] -= 120
+    with game_system.player_turn('p1'):
+        game_system._player_last_access['p1'] -= 120
+        assert game_system.evict_players() == []
+        assert 'p1' in game_system._turn_queues
+    assert game_system.evict_players() == ['p1']
+    assert 'p1' not in game_system._turn_queues  # idle queue dropped with the session
+
+
+def test_closed_session_drops_its_turn_queue(game_system):
+    with game_system.player_turn('p1'):
+        pass
+    game_system.close_player_session('p1')
+    assert game_system._turn_queues == {}
+    with game_system.player_turn('p1') as (player_system, _):
+        assert player_system.game_state['player_id'] == 'p1'
+
+
+def test_rehydration_waits_for_the_eviction_flush(game_system, monkeypatch):
+    game_system.get_player_system('p1')
+    game_system._player_last_access['p1'] -= 120
+    locked_when_removed = []
+    drop_queue = game_system._drop_idle_turn_queue
+    monkeypatch.setattr(game_system, '_drop_idle_turn_queue', lambda pid: (
+        locked_when_removed.append(game_system._construction_locks[pid].locked()), drop_queue(pid)))
+    flush_started, release_flush, events = threading.Event(), threading.Event(), []
+
+    def slow_flush(player_system):
+        flush_started.set()
+        release_flush.wait(2)
+        events.append('flushed')
+    monkeypatch.setattr(game_system, '_flush_player_system', slow_flush)
+
+    evictor = threading.Thread(target=game_system.evict_players)
+    evictor.start()
+    assert flush_started.wait(2)
+    rehydrator = threading.Thread(target=lambda: events.append(game_system.get_player_system('p1')))
+    rehydrator.start()
+    time.sleep(0.1)
+    assert events == []  # the rebuild waits for the flush
+    release_flush.set()
+    evictor.join(); rehydrator.join()
+
+    assert locked_when_removed == [True]  # no window between leaving the registry and the flush
+    assert events[0] == 'flushed' and events[1].game_state['player_id'] == 'p1'
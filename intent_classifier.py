@@ -0,0 +1,155 @@
+# intent_classifier.py
+# Local fast path for natural-language command detection, run before the LLM interpreter.
+#
+# The keyword taxonomy of command_interpreter (INTENT_KEYWORDS) is compiled once into a
+# single word-bounded alternation (longest keyword first), and the known area and NPC
+# names into a second one cached per vocabulary, so an input is scanned in one pass each.
+# English command phrases (ENGLISH_KEYWORDS) are added to the same taxonomy.
+# Only clear-cut inputs are decided locally:
+#   - dialogue cues (future plans, questions about NPCs, polite requests, collecting
+#     items) without a command cue, or a greeting / the current NPC's name in a
+#     sentence that names no place, no other NPC and no motion/command cue -> dialogue
+#   - a talk cue naming exactly one known NPC                             -> /talk <npc>
+#   - a movement cue naming exactly one known area                        -> /go <area>
+#   - a short (<= SHORT_COMMAND_MAX_WORDS) inventory/help/areas/who request -> that command
+#     ("mostrami l'inventario", "list the areas", or the bare keyword; a noun such as
+#     'oggetti' or 'persone' inside a sentence is not a request)
+# Everything else (give/receive, exit, mixed cues, sentences without any signal such as
+# "dove sono") returns None and goes to interpret_user_intent.
+#
+#   NEXUS_LOCAL_INTENT   (1)  0 sends every input to the LLM interpreter
+
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Tuple
+
+from command_interpreter import INTENT_KEYWORDS, get_italian_area_mapping
+
+DIALOGUE_CATEGORIES = frozenset({'future_plans', 'discuss_npc', 'collect', 'ask'})
+AMBIGUOUS_CATEGORIES = frozenset({'give', 'demand', 'exit'})
+SHORT_COMMANDS = {'inventory': '/inventory', 'help': '/help', 'areas': '/areas', 'who': '/who'}
+SHORT_COMMAND_MAX_WORDS = 4
+
+# English counterparts of the command categories of INTENT_KEYWORDS
+ENGLISH_KEYWORDS: Dict[str, List[str]] = {
+    'inventory': ['inventory', 'my items', 'my bag', 'what do i have', 'what am i carrying'],
+    'who': ['who is here', "who's here", 'who is around'],
+    'areas': ['areas', 'locations', 'places'],
+    'help': ['commands', 'what can i do'],
+    'exit': ['exit', 'quit', 'leave the game', 'log out'],
+}
+
+# Verbs of motion not in the taxonomy: alone they make an input ambiguous, with an area they are /go
+MOTION_KEYWORDS = ['vado', 'vai', 'andiamo', 'torno', 'entro', 'raggiungo', 'portami',
+                   'go', 'go to', 'walk', 'walk to', 'head to', 'travel to']
+
+# What turns a short command noun into a request: an imperative, or a phrase that is a request by itself
+REQUEST_KEYWORDS = ['mostra', 'mostrami', 'fammi vedere', 'apri', 'controlla', 'elenca', 'elencami',
+                    'cosa ho', 'chi c\'è', 'chi è qui', 'cosa posso fare',
+                    'show', 'show me', 'list', 'open', 'check', 'display',
+                    'what do i have', 'what am i carrying', 'who is here', "who's here", 'what can i do']
+
+# Positive signals that a sentence without cues is said to the NPC
+GREETING_KEYWORDS = ['ciao', 'salve', 'buongiorno', 'buonasera', 'saluti', 'hello', 'hi', 'hey',
+                     'greetings', 'good morning', 'good evening']
+
+DIALOGUE_CONFIDENCE = 0.95
+PLAIN_DIALOGUE_CONFIDENCE = 0.9
+COMMAND_CONFIDENCE = 0.9
+
+
+def local_intent_enabled() -> bool:
+    return os.environ.get("NEXUS_LOCAL_INTENT", "1").lower() not in ("0", "false", "no")
+
+
+def _alternation(phrases: Iterable[str]) -> Pattern:
+    ordered = sorted({p.lower() for p in phrases if p}, key=len, reverse=True)
+    return re.compile(r"(?<!\w)(?:" + "|".join(re.escape(p) for p in ordered) + r")(?!\w)")
+
+
+def _keyword_table() -> Dict[str, str]:
+    table: Dict[str, str] = {}
+    for taxonomy in (INTENT_KEYWORDS, ENGLISH_KEYWORDS):
+        for category, keywords in taxonomy.items():  # Dict order is priority order
+            for keyword in keywords:
+                table.setdefault(keyword.lower(), category)
+    for keyword in MOTION_KEYWORDS:
+        table.setdefault(keyword, 'motion')
+    return table
+
+
+_KEYWORD_CATEGORY = _keyword_table()
+_KEYWORD_PATTERN = _alternation(_KEYWORD_CATEGORY)
+_REQUEST_PATTERN = _alternation(REQUEST_KEYWORDS)
+_GREETING_PATTERN = _alternation(GREETING_KEYWORDS)
+
+
+@lru_cache(maxsize=32)
+def _vocabulary(areas: Tuple[str, ...], npc_names: Tuple[str, ...]) -> Tuple[Pattern, Dict[str, Tuple[str, str]]]:
+    """Pattern matching any area or NPC name, and matched text -> ('area' | 'npc', canonical name)."""
+    names: Dict[str, Tuple[str, str]] = {}
+    for area in areas:
+        names[area.lower()] = ('area', area)
+    for italian, english in get_italian_area_mapping().items():
+        if not areas or english in areas:
+            names.setdefault(italian, ('area', english))
+    for npc in npc_names:
+        names.setdefault(npc.lower(), ('npc', npc))
+    return _alternation(names), names
+
+
+def _result(is_command: bool, command: Optional[str], confidence: float, user_input: str,
+            reasoning: str) -> Dict[str, Any]:
+    return {'is_command': is_command, 'inferred_command': command, 'confidence': confidence,
+            'original_input': user_input, 'reasoning': f"Local: {reasoning}", 'source': 'local'}
+
+
+def classify_intent(user_input: str, areas: Iterable[str] = (), npc_names: Iterable[str] = (),
+                    current_npc: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Decides clear-cut inputs without the LLM (same shape as interpret_user_intent); None if ambiguous."""
+    text = " ".join(user_input.lower().split())
+    if not text:
+        return None
+
+    categories: List[str] = [_KEYWORD_CATEGORY[m.group(0)] for m in _KEYWORD_PATTERN.finditer(text)]
+    cues = set(categories)
+    vocabulary_pattern, vocabulary = _vocabulary(tuple(areas), tuple(npc_names))
+    mentioned_areas, mentioned_npcs = set(), set()
+    if vocabulary:
+        for match in vocabulary_pattern.finditer(text):
+            kind, name = vocabulary[match.group(0)]
+            (mentioned_areas if kind == 'area' else mentioned_npcs).add(name)
+    other_npcs = mentioned_npcs - {current_npc}
+
+    if cues & AMBIGUOUS_CATEGORIES:
+        return None
+
+    dialogue_cues = cues & DIALOGUE_CATEGORIES
+    command_cues = cues - DIALOGUE_CATEGORIES
+    if dialogue_cues and not command_cues:
+        return _result(False, None, DIALOGUE_CONFIDENCE, user_input, f"dialogue cue ({', '.join(sorted(dialogue_cues))})")
+    if dialogue_cues:
+        return None
+
+    if cues == {'talk_npc'} and len(other_npcs) == 1 and not mentioned_areas:
+        npc = next(iter(other_npcs))
+        return _result(True, f"/talk {npc}", COMMAND_CONFIDENCE, user_input, f"talk to {npc}")
+
+    if cues and cues <= {'movement', 'motion'} and len(mentioned_areas) == 1 and not other_npcs:
+        area = next(iter(mentioned_areas))
+        return _result(True, f"/go {area}", COMMAND_CONFIDENCE, user_input, f"movement to {area}")
+
+    is_request = _REQUEST_PATTERN.search(text) or _KEYWORD_PATTERN.fullmatch(text.strip(" .!"))
+    if (len(cues) == 1 and next(iter(cues)) in SHORT_COMMANDS and is_request and '?' not in text
+            and len(text.split()) <= SHORT_COMMAND_MAX_WORDS and not mentioned_areas and not other_npcs):
+        command = SHORT_COMMANDS[next(iter(cues))]
+        return _result(True, command, COMMAND_CONFIDENCE, user_input, f"short {command} request")
+
+    if cues or mentioned_areas or other_npcs or not current_npc:
+        return None
+    if _GREETING_PATTERN.search(text):
+        return _result(False, None, PLAIN_DIALOGUE_CONFIDENCE, user_input, "greeting")
+    if current_npc in mentioned_npcs:
+        return _result(False, None, PLAIN_DIALOGUE_CONFIDENCE, user_input, f"addressed to {current_npc}")
+    return None
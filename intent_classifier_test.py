@@ -0,0 +1,65 @@
+from unittest.mock import MagicMock, patch
+
+import command_processor
+import speculation
+from intent_classifier import classify_intent
+
+AREAS = ['Ancient Ruins', 'City', 'Forest', 'Tavern', 'Village']
+NPCS = ['Jorin', 'Boros', 'Lyra', 'Syra']
+
+
+def _decide(text, current_npc='Jorin'):
+    result = classify_intent(text, AREAS, NPCS, current_npc)
+    return result and (result['is_command'], result['inferred_command'])
+
+
+def test_clear_cut_inputs_are_decided_locally():
+    assert _decide("Ciao Jorin, come stai oggi?") == (False, None)
+    assert _decide("vado da boros") == (False, None)  # future plan, not /talk
+    assert _decide("parlami di Lyra") == (False, None)
+    assert _decide("raccolgo la piaga") == (False, None)
+    assert _decide("vado in taverna") == (True, "/go Tavern")
+    assert _decide("voglio parlare con Syra") == (True, "/talk Syra")
+    assert _decide("inventario") == (True, "/inventory")
+    assert _decide("mostrami l'inventario") == (True, "/inventory")
+    assert _decide("show my inventory") == (True, "/inventory")
+    assert _decide("who is here") == (True, "/who")
+    assert _decide("list the areas") == (True, "/areas")
+    assert _decide("go to the tavern") == (True, "/go Tavern")
+
+
+def test_ambiguous_inputs_are_left_to_the_llm():
+    assert _decide("eccoti la moneta rara") is None  # /give needs the item name
+    assert _decide("dammi il diario") is None
+    assert _decide("basta, me ne vado") is None
+    assert _decide("la foresta è pericolosa") is None  # names a place without a cue
+    assert _decide("che oggetti vendi?") is None
+    assert _decide("exit") is None
+    assert _decide("quit") is None
+    assert _decide("go north") is None
+
+
+def test_sentences_without_a_positive_signal_are_not_dialogue():
+    assert _decide("dove sono") is None
+    assert _decide("dove sono", current_npc=None) is None
+    assert _decide("Jorin, raccontami del Velo") == (False, None)  # addressed to the current NPC
+    assert _decide("Ciao, come stai?", current_npc=None) is None
+
+
+def test_command_nouns_in_a_sentence_are_not_requests():
+    assert _decide("che oggetti hai") is None
+    assert _decide("le persone sono strane") is None
+    assert _decide("guardo nella borsa") is None
+
+
+def test_local_decision_skips_the_llm_interpretation(monkeypatch):
+    monkeypatch.delenv("NEXUS_LOCAL_INTENT", raising=False)
+    state = {'nlp_command_interpretation_enabled': True, 'current_npc': None, 'chat_session': None,
+             'llm_wrapper_func': MagicMock(), 'available_areas': AREAS}
+    handle_go = MagicMock(side_effect=lambda args, st: st)
+    with patch.object(speculation, 'get_llm_scheduler') as scheduler, \
+            patch.dict(command_processor.command_handlers_map, {'go': handle_go}):
+        command_processor.process_input_revised("vado in taverna", state)
+    scheduler.assert_not_called()
+    handle_go.assert_called_once()
+    assert handle_go.call_args.args[0] == "Tavern"
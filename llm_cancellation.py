@@ -0,0 +1,67 @@
+# llm_cancellation.py
+# Cooperative cancellation of in-flight LLM calls.
+#
+# A CancellationToken is handed to llm_wrapper (directly or via ChatSession.ask).
+# The transport registers an abort callback on it for the duration of a request:
+# the async client cancels the aiohttp task (closing the connection), the requests
+# fallback closes the streaming response. Non-streaming calls on the requests
+# fallback cannot be interrupted mid-flight; their result is discarded instead.
+
+import threading
+from typing import Callable, List, Optional
+
+
+class LLMCancelled(Exception):
+    """Raised by the transport when the call's CancellationToken was cancelled."""
+
+
+class CancellationToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """Cancels the token and runs the registered abort callbacks. False if already cancelled."""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass  # Aborting is best effort; the caller sees the cancelled flag either way
+        return True
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Registers `callback` (run at once if already cancelled). Returns a function that unregisters it."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def child(self) -> 'CancellationToken':
+        """New token that is cancelled with this one but can also be cancelled on its own."""
+        token = CancellationToken()
+        unregister = self.on_cancel(lambda: token.cancel(self.reason or "cancelled"))
+        token.on_cancel(unregister)
+        return token
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise LLMCancelled(self.reason or "cancelled")
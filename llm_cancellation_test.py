@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+import llm_resilience
+from fake_llm_server import FakeLLMConfig, FakeLLMServer
+from llm_cancellation import CancellationToken, LLMCancelled
+from llm_stats_tracker import get_global_stats_tracker, reset_global_stats_tracker
+from llm_wrapper import llm_wrapper
+
+MESSAGES = [{"role": "user", "content": "Raccontami del Velo"}]
+
+
+@pytest.fixture
+def slow_server(monkeypatch):
+    config = FakeLLMConfig(ttft=0.05, tokens_per_sec=5, reply="uno due tre quattro cinque sei sette otto")
+    with FakeLLMServer(config=config) as server:
+        monkeypatch.setenv("OPENROUTER_API_BASE", f"{server.base_url}/api/v1")
+        monkeypatch.setenv("OPENROUTER_API_KEY", "fake-key")
+        monkeypatch.setenv("NEXUS_LLM_RETRIES", "0")
+        llm_resilience.reset_breakers()
+        reset_global_stats_tracker()
+        yield server
+    llm_resilience.reset_breakers()
+
+
+def test_cancelling_a_stream_aborts_it_and_counts_wasted_tokens(slow_server):
+    token = CancellationToken()
+    received = []
+
+    def on_token(text):
+        received.append(text)
+        token.cancel("nlp detected command")
+
+    start = time.time()
+    text, stats = llm_wrapper(MESSAGES, model_name="fake/model", stream=True, collect_stats=True,
+                              usage_type="dialogue", on_token=on_token, cancel_token=token)
+    assert time.time() - start < 1.0  # the full reply would take ~1.5s
+    assert text == "" and stats["cancelled"] and stats["wasted_tokens"] > 0
+    assert received == ["uno"]
+    assert get_global_stats_tracker().get_cancellation_stats()["dialogue"]["cancelled"] == 1
+
+
+def test_cancelling_a_non_streaming_call_returns_before_the_response(slow_server):
+    pytest.importorskip("aiohttp")
+    slow_server.config.ttft = 2.0
+    token = CancellationToken()
+    threading.Timer(0.1, token.cancel).start()
+
+    start = time.time()
+    text, stats = llm_wrapper(MESSAGES, model_name="fake/model", stream=False, collect_stats=True,
+                              usage_type="command_interpretation", cancel_token=token)
+    assert time.time() - start < 1.0
+    assert stats["cancelled"] and text == ""
+
+
+def test_token_runs_abort_callbacks_once():
+    calls = []
+    token = CancellationToken()
+    unregister = token.on_cancel(lambda: calls.append("removed"))
+    unregister()
+    token.on_cancel(lambda: calls.append("abort"))
+    assert token.cancel("done") and not token.cancel("again")
+    token.on_cancel(lambda: calls.append("late"))  # already cancelled: runs at once
+    assert calls == ["abort", "late"]
+    with pytest.raises(LLMCancelled):
+        token.raise_if_cancelled()
@@ -0,0 +1,261 @@
+# llm_client.py
+# Asyncio client layer for outbound LLM HTTP calls.
+#
+# One event loop runs on a daemon thread and owns one aiohttp session per provider,
+# each with its own connection pool, concurrency cap and timeouts:
+#   NEXUS_LLM_<PROVIDER>_MAX_CONNECTIONS  (default 100)
+#   NEXUS_LLM_<PROVIDER>_CONCURRENCY      (default 64)  in-flight requests
+#   NEXUS_LLM_<PROVIDER>_CONNECT_TIMEOUT  (default 10s)
+#   NEXUS_LLM_<PROVIDER>_READ_TIMEOUT     (default 120s) max gap between chunks
+# Async callers await `request()`; threaded callers (llm_wrapper) use the sync facade
+# `post()`, whose response mimics the parts of requests.Response the parsers use.
+# Enabled when aiohttp is installed (poetry install -E async) and NEXUS_LLM_ASYNC_CLIENT is not "0".
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+
+from llm_cancellation import CancellationToken, LLMCancelled
+
+try:
+    import aiohttp
+except ImportError:  # Optional dependency: pip install aiohttp
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+_END_OF_STREAM = object()
+
+
+@dataclass
+class ProviderConfig:
+    """Pool, concurrency and timeout settings for one LLM provider"""
+    name: str
+    max_connections: int = 100
+    concurrency: int = 64
+    connect_timeout: float = 10.0
+    read_timeout: float = 120.0
+
+    @classmethod
+    def from_env(cls, name: str) -> 'ProviderConfig':
+        prefix = f'NEXUS_LLM_{name.upper()}_'
+        return cls(
+            name=name,
+            max_connections=int(os.environ.get(prefix + 'MAX_CONNECTIONS', '100')),
+            concurrency=int(os.environ.get(prefix + 'CONCURRENCY', '64')),
+            connect_timeout=float(os.environ.get(prefix + 'CONNECT_TIMEOUT', '10')),
+            read_timeout=float(os.environ.get(prefix + 'READ_TIMEOUT', '120')),
+        )
+
+
+class LLMResponse:
+    """
+    Response returned by the client. Exposes status_code, text, json(), iter_lines()
+    and raise_for_status() like requests.Response, so the existing stream parsers and
+    error handling in llm_wrapper work unchanged.
+    """
+
+    def __init__(self, status_code: int, body: Optional[bytes] = None,
+                 lines: Optional["queue.Queue"] = None, closer=None):
+        self.status_code = status_code
+        self._body = body
+        self._lines = lines
+        self._closer = closer
+
+    @property
+    def content(self) -> bytes:
+        if self._body is None:
+            self._body = b"\n".join(self.iter_lines())
+        return self._body
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def iter_lines(self) -> Iterator[bytes]:
+        if self._lines is None:
+            yield from (self._body or b"").splitlines()
+            return
+        while True:
+            item = self._lines.get()
+            if item is _END_OF_STREAM:
+                return
+            if isinstance(item, BaseException):
+                raise _as_requests_error(item)
+            yield item
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error", response=self)
+
+    def close(self) -> None:
+        if self._closer is not None:
+            self._closer()
+
+
+def _as_requests_error(error: BaseException) -> BaseException:
+    """Maps aiohttp/asyncio failures onto the requests exceptions llm_wrapper already handles"""
+    if isinstance(error, requests.exceptions.RequestException):
+        return error
+    if isinstance(error, asyncio.TimeoutError):
+        return requests.exceptions.Timeout(str(error) or "LLM request timed out")
+    return requests.exceptions.ConnectionError(str(error))
+
+
+class AsyncLLMClient:
+    """Per-provider pooled aiohttp sessions on a private event loop"""
+
+    def __init__(self, provider_configs: Optional[Dict[str, ProviderConfig]] = None):
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is required for the async LLM client")
+        self._provider_configs = dict(provider_configs or {})
+        self._sessions: Dict[str, "aiohttp.ClientSession"] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='llm-client-loop', daemon=True)
+        self._thread.start()
+
+    def config_for(self, provider: str) -> ProviderConfig:
+        if provider not in self._provider_configs:
+            self._provider_configs[provider] = ProviderConfig.from_env(provider)
+        return self._provider_configs[provider]
+
+    def _session_for(self, provider: str) -> "aiohttp.ClientSession":
+        # Only called on the client loop, so no locking is needed
+        if provider not in self._sessions:
+            cfg = self.config_for(provider)
+            connector = aiohttp.TCPConnector(limit=cfg.max_connections, keepalive_timeout=60)
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=cfg.connect_timeout,
+                                            sock_read=cfg.read_timeout)
+            self._sessions[provider] = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._semaphores[provider] = asyncio.Semaphore(cfg.concurrency)
+            self._in_flight[provider] = 0
+        return self._sessions[provider]
+
+    async def request(self, provider: str, url: str, headers: Dict[str, str],
+                      payload: Dict[str, Any], timeout: Optional[float] = None) -> LLMResponse:
+        """Native async path: POSTs `payload` and returns the fully-read response."""
+        session = self._session_for(provider)
+        async with self._semaphores[provider]:
+            self._in_flight[provider] += 1
+            try:
+                request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+                async with session.post(url, headers=headers, json=payload, timeout=request_timeout) as resp:
+                    return LLMResponse(resp.status, body=await resp.read())
+            finally:
+                self._in_flight[provider] -= 1
+
+    async def _stream(self, provider: str, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                      ready: concurrent.futures.Future, lines: "queue.Queue") -> None:
+        session = self._session_for(provider)
+        try:
+            async with self._semaphores[provider]:
+                self._in_flight[provider] += 1
+                try:
+                    async with session.post(url, headers=headers, json=payload) as resp:
+                        if resp.status >= 400:
+                            ready.set_result(LLMResponse(resp.status, body=await resp.read()))
+                            return
+                        ready.set_result(LLMResponse(resp.status, lines=lines))
+                        async for raw_line in resp.content:
+                            lines.put(raw_line.rstrip(b"\r\n"))
+                finally:
+                    self._in_flight[provider] -= 1
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(_as_requests_error(e))
+            else:
+                lines.put(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            lines.put(_END_OF_STREAM)
+
+    def post(self, provider: str, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+             stream: bool = False, timeout: Optional[float] = None,
+             cancel_token: Optional[CancellationToken] = None) -> LLMResponse:
+        """
+        Sync facade for threaded callers. Non-streaming calls block until the body is read;
+        streaming calls return once headers arrive and iter_lines() yields lines as they come.
+        Raises requests.exceptions.Timeout / ConnectionError on transport failures, and
+        LLMCancelled when `cancel_token` is cancelled before the response is complete
+        (the request task is cancelled, which closes its connection).
+        """
+        if not stream:
+            future = asyncio.run_coroutine_threadsafe(
+                self.request(provider, url, headers, payload, timeout), self._loop)
+            unregister = cancel_token.on_cancel(future.cancel) if cancel_token else None
+            try:
+                return future.result()
+            except BaseException as e:
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise LLMCancelled(cancel_token.reason or "cancelled") from e
+                raise _as_requests_error(e) from e
+            finally:
+                if unregister:
+                    unregister()
+
+        ready: concurrent.futures.Future = concurrent.futures.Future()
+        lines: "queue.Queue" = queue.Queue()
+        task = asyncio.run_coroutine_threadsafe(
+            self._stream(provider, url, headers, payload, ready, lines), self._loop)
+        if cancel_token is not None:
+            def abort():
+                task.cancel()
+                if not ready.done():  # The task may be cancelled before it ever runs
+                    try:
+                        ready.set_exception(LLMCancelled(cancel_token.reason or "cancelled"))
+                    except concurrent.futures.InvalidStateError:
+                        pass
+            cancel_token.on_cancel(abort)  # Stays registered while the body streams
+        try:
+            response = ready.result(timeout=timeout)
+        except concurrent.futures.TimeoutError as e:
+            task.cancel()
+            raise requests.exceptions.Timeout(f"No response headers from {provider} within {timeout}s") from e
+        except BaseException:
+            if cancel_token is not None and cancel_token.cancelled:
+                raise LLMCancelled(cancel_token.reason or "cancelled")
+            raise
+        response._closer = task.cancel
+        return response
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {
+                'in_flight': self._in_flight.get(name, 0),
+                'concurrency': cfg.concurrency,
+                'max_connections': cfg.max_connections,
+            }
+            for name, cfg in self._provider_configs.items()
+        }
+
+
+_global_client: Optional[AsyncLLMClient] = None
+_global_client_lock = threading.Lock()
+
+def async_client_enabled() -> bool:
+    return aiohttp is not None and os.environ.get('NEXUS_LLM_ASYNC_CLIENT', '1') != '0'
+
+def get_llm_client() -> Optional[AsyncLLMClient]:
+    """Get or create the process-wide client, or None when the async path is disabled"""
+    global _global_client
+    if not async_client_enabled():
+        return None
+    with _global_client_lock:
+        if _global_client is None:
+            _global_client = AsyncLLMClient()
+            logger.info("[LLM-CLIENT] Async LLM client started")
+        return _global_client
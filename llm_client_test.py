@@ -0,0 +1,71 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+pytest.importorskip("aiohttp")
+
+from llm_client import AsyncLLMClient, ProviderConfig
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if self.path == '/slow':
+            time.sleep(0.5)
+            return
+        if self.path == '/fail':
+            self.send_response(429)
+            self.end_headers()
+            self.wfile.write(b'{"error": {"message": "rate limited"}}')
+            return
+        self.send_response(200)
+        self.end_headers()
+        if body.get('stream'):
+            for token in ('Ciao', ' viandante'):
+                self.wfile.write(f'data: {json.dumps({"token": token})}\n\n'.encode())
+                self.wfile.flush()
+            self.wfile.write(b'data: [DONE]\n')
+        else:
+            self.wfile.write(json.dumps({'echo': body['messages']}).encode())
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+@pytest.fixture(scope='module')
+def client():
+    return AsyncLLMClient({'fake': ProviderConfig(name='fake', max_connections=4, concurrency=2)})
+
+
+def test_sync_facade_returns_requests_like_responses(client, base_url):
+    response = client.post('fake', f'{base_url}/chat', {}, {'messages': ['hi']})
+    assert response.status_code == 200
+    assert response.json() == {'echo': ['hi']}
+
+    streamed = client.post('fake', f'{base_url}/chat', {}, {'messages': [], 'stream': True}, stream=True)
+    lines = [line for line in streamed.iter_lines() if line]
+    assert lines[-1] == b'data: [DONE]'
+    assert [json.loads(line[5:])['token'] for line in lines[:-1]] == ['Ciao', ' viandante']
+
+
+def test_transport_failures_map_to_requests_exceptions(client, base_url):
+    failed = client.post('fake', f'{base_url}/fail', {}, {'messages': []})
+    with pytest.raises(requests.exceptions.HTTPError) as excinfo:
+        failed.raise_for_status()
+    assert excinfo.value.response.json()['error']['message'] == 'rate limited'
+
+    with pytest.raises(requests.exceptions.Timeout):
+        client.post('fake', f'{base_url}/slow', {}, {'messages': []}, timeout=0.1)
+    assert client.stats()['fake']['in_flight'] == 0
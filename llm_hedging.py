@@ -0,0 +1,172 @@
+# llm_hedging.py
+# Hedged requests for interactive dialogue.
+#
+# The primary call starts immediately. If it has neither streamed a first token nor
+# finished after `delay` seconds (a percentile of recent dialogue latency from
+# LLMStatsTracker), a second call is started. For streaming calls the first attempt
+# to produce a token wins and only its tokens reach the player; for non-streaming
+# calls the first successful completion wins. Each leg gets its own CancellationToken,
+# a child of the caller's token: once the winner is known the loser's token is
+# cancelled, which closes its connection (a streaming loser also stops at its next
+# token). A non-streaming loser on the requests fallback cannot be interrupted
+# mid-flight and its result is discarded.
+#
+# Settings:
+#   NEXUS_HEDGE_DIALOGUE        ("0")  enable hedging for the dialogue usage type
+#   NEXUS_HEDGE_PERCENTILE      (95)   latency percentile used as the hedge delay
+#   NEXUS_HEDGE_MIN_SAMPLES     (20)   recent calls needed before hedging kicks in
+#   NEXUS_HEDGE_MODEL           (same) model for the hedge call
+#   NEXUS_HEDGE_MAX_PER_MINUTE  (10)   cap on extra (hedge) calls per minute
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import output_channel
+from llm_cancellation import CancellationToken, LLMCancelled
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'primary'
+HEDGE = 'hedge'
+
+CallResult = Tuple[str, Optional[Dict[str, Any]]]
+
+
+def hedging_enabled(usage_type: Optional[str]) -> bool:
+    return usage_type == 'dialogue' and os.environ.get('NEXUS_HEDGE_DIALOGUE', '0') == '1'
+
+
+class HedgeBudget:
+    """Sliding one-minute window limiting how many hedge calls may be issued."""
+
+    def __init__(self, max_per_minute: Optional[int] = None):
+        self.max_per_minute = max_per_minute if max_per_minute is not None else \
+            int(os.environ.get('NEXUS_HEDGE_MAX_PER_MINUTE', '10'))
+        self._issued: deque = deque()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        now = time.time()
+        with self._lock:
+            while self._issued and now - self._issued[0] > 60:
+                self._issued.popleft()
+            if len(self._issued) >= self.max_per_minute:
+                return False
+            self._issued.append(now)
+            return True
+
+
+class _HedgeLost(LLMCancelled):
+    """Raised inside a losing stream's token callback to stop reading it (stream parsers re-raise it)."""
+
+
+class _HedgeRace:
+    def __init__(self, downstream: Optional[Callable[[str], None]], tokens: Dict[str, CancellationToken]):
+        self._downstream = downstream
+        self._cond = threading.Condition()
+        self.tokens = tokens
+        self.winner: Optional[str] = None
+        self.results: Dict[str, CallResult] = {}
+        self.started = 0
+        self.progressed = threading.Event()  # primary streamed a token or finished
+
+    def _cancel_losers(self, winner: str) -> None:
+        for name, token in self.tokens.items():
+            if name != winner:
+                token.cancel(f"hedge race won by {winner}")
+
+    def listener_for(self, name: str) -> Callable[[str], None]:
+        def on_token(text: str) -> None:
+            won = False
+            with self._cond:
+                if self.winner is None:
+                    self.winner = name
+                    won = True
+                    self._cond.notify_all()
+            if won:
+                self._cancel_losers(name)
+            if self.winner != name:
+                raise _HedgeLost(f"hedge race won by {self.winner}")
+            if name == PRIMARY:
+                self.progressed.set()
+            if self._downstream is not None:
+                self._downstream(text)
+        return on_token
+
+    def run(self, name: str, call: Callable[[CancellationToken], CallResult], stream: bool) -> None:
+        try:
+            if stream:
+                with output_channel.token_listener(self.listener_for(name)):
+                    result = call(self.tokens[name])
+            else:
+                result = call(self.tokens[name])
+        except Exception as e:
+            logger.exception(f"[HEDGE] {name} call failed: {e}")
+            result = ("", {"error": f"{type(e).__name__}: {e}"})
+        won = False
+        with self._cond:
+            self.results[name] = result
+            if self.winner is None and not (result[1] or {}).get('error'):
+                self.winner = name
+                won = True
+            self._cond.notify_all()
+        if won:
+            self._cancel_losers(name)
+        if name == PRIMARY:
+            self.progressed.set()
+
+    def start(self, name: str, call: Callable[[CancellationToken], CallResult], stream: bool) -> None:
+        with self._cond:
+            self.started += 1
+        threading.Thread(target=output_channel.bind_current_context(self.run),
+                         args=(name, call, stream), name=f"llm-hedge-{name}", daemon=True).start()
+
+    def wait(self) -> Tuple[str, CallResult]:
+        with self._cond:
+            self._cond.wait_for(lambda: (self.winner is not None and self.winner in self.results)
+                                or len(self.results) == self.started)
+            name = self.winner if self.winner in self.results else PRIMARY
+            return name, self.results[name]
+
+
+def hedged_call(primary: Callable[[CancellationToken], CallResult], hedge: Callable[[CancellationToken], CallResult],
+                delay: float, stream: bool, budget: HedgeBudget,
+                cancel_token: Optional[CancellationToken] = None) -> Tuple[CallResult, Dict[str, Any]]:
+    """
+    Runs `primary`, adding `hedge` if nothing has happened after `delay` seconds and the
+    budget allows. Each leg is called with its own token (a child of `cancel_token`),
+    cancelled when the other leg wins. Returns the winning result and a summary dict
+    (hedged, winner, delay).
+    """
+    downstream = output_channel.current_token_listener()
+    parent = cancel_token or CancellationToken()
+    race = _HedgeRace(downstream, {PRIMARY: parent.child(), HEDGE: parent.child()})
+    race.start(PRIMARY, primary, stream)
+
+    hedged = False
+    if not race.progressed.wait(delay):
+        if budget.try_acquire():
+            hedged = True
+            logger.info(f"[HEDGE] No response after {delay:.2f}s, sending hedge request")
+            race.start(HEDGE, hedge, stream)
+        else:
+            logger.info("[HEDGE] Hedge budget exhausted for this minute, waiting on primary")
+
+    winner, result = race.wait()
+    return result, {'hedged': hedged, 'winner': winner, 'delay': delay}
+
+
+_global_budget: Optional[HedgeBudget] = None
+_global_budget_lock = threading.Lock()
+
+def get_hedge_budget() -> HedgeBudget:
+    """Get or create the process-wide hedge budget"""
+    global _global_budget
+    with _global_budget_lock:
+        if _global_budget is None:
+            _global_budget = HedgeBudget()
+        return _global_budget
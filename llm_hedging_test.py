@@ -0,0 +1,117 @@
+import time
+
+import pytest
+
+import output_channel
+from llm_cancellation import CancellationToken, LLMCancelled
+from llm_hedging import HEDGE, PRIMARY, HedgeBudget, _HedgeLost, hedged_call
+from llm_stats_tracker import LATENCY_WINDOW, LLMStatsTracker
+from llm_wrapper import process_direct_streaming_output
+
+
+def _streaming_call(tokens, first_token_delay):
+    def call(leg_token):
+        time.sleep(first_token_delay)
+        text = ""
+        try:
+            for token in tokens:
+                output_channel.publish_token(token)
+                text += token
+        except Exception as e:  # the stream parsers swallow errors the same way
+            text += f"[aborted: {type(e).__name__}]"
+        return text, {"model": "m", "total_time": first_token_delay}
+    return call
+
+
+def test_slow_primary_stream_loses_to_hedge_and_its_tokens_are_dropped():
+    received = []
+    with output_channel.token_listener(received.append):
+        (text, stats), summary = hedged_call(
+            _streaming_call(["lento"], first_token_delay=0.3),
+            _streaming_call(["Salve", " viandante"], first_token_delay=0.0),
+            delay=0.05, stream=True, budget=HedgeBudget(max_per_minute=5))
+
+    assert summary == {'hedged': True, 'winner': HEDGE, 'delay': 0.05}
+    assert text == "Salve viandante"
+    assert received == ["Salve", " viandante"]
+
+
+def test_fast_primary_and_exhausted_budget_skip_the_hedge():
+    hedge_calls = []
+    hedge = lambda leg_token: hedge_calls.append(1) or ("hedge", {})
+
+    result, summary = hedged_call(lambda leg_token: ("primary", {}), hedge, delay=0.5, stream=False,
+                                  budget=HedgeBudget(max_per_minute=5))
+    assert result[0] == "primary" and not summary['hedged']
+
+    slow_primary = lambda leg_token: time.sleep(0.1) or ("primary", {})
+    result, summary = hedged_call(slow_primary, hedge, delay=0.01, stream=False,
+                                  budget=HedgeBudget(max_per_minute=0))
+    assert (result[0], summary['winner'], summary['hedged']) == ("primary", PRIMARY, False)
+    assert hedge_calls == []
+
+
+def test_losing_leg_is_cancelled_but_not_the_caller():
+    turn_token = CancellationToken()
+    primary_tokens = []
+
+    def slow_primary(leg_token):
+        primary_tokens.append(leg_token)
+        deadline = time.time() + 2
+        while not leg_token.cancelled and time.time() < deadline:
+            time.sleep(0.01)
+        return "", {"error": "Cancelled", "cancelled": True}
+
+    result, summary = hedged_call(slow_primary, lambda leg_token: ("Salve", {}), delay=0.01, stream=False,
+                                  budget=HedgeBudget(max_per_minute=5), cancel_token=turn_token)
+
+    assert (result[0], summary['winner']) == ("Salve", HEDGE)
+    deadline = time.time() + 2
+    while not primary_tokens[0].cancelled and time.time() < deadline:
+        time.sleep(0.01)
+    assert primary_tokens[0].cancelled and not turn_token.cancelled
+
+
+def test_leg_tokens_follow_the_callers_token():
+    turn_token = CancellationToken()
+    leg_token = turn_token.child()
+    turn_token.cancel("turn settled")
+    assert leg_token.cancelled and leg_token.reason == "turn settled"
+
+
+def test_stream_parser_lets_a_lost_hedge_abort_the_stream():
+    class Response:
+        def iter_lines(self):
+            yield b'data: {"choices": [{"delta": {"content": "lento"}}]}'
+            yield b'data: {"choices": [{"delta": {"content": " ancora"}}]}'
+
+    def on_token(text):
+        raise _HedgeLost("hedge race won by hedge")
+
+    with pytest.raises(LLMCancelled):
+        process_direct_streaming_output(Response(), None, 80, None, on_token=on_token)
+
+
+def test_latency_percentile_uses_first_token_time_of_successful_calls():
+    tracker = LLMStatsTracker()
+    for ttft in (0.1, 0.2, 0.3, 0.4, 2.0):
+        tracker.record_call('m', 'dialogue', {'total_time': 5.0, 'time_to_first_token': ttft})
+    tracker.record_call('m', 'dialogue', {'total_time': 60.0, 'error': 'Timeout'})
+    tracker.record_call('m', 'profile', {'total_time': 9.0})
+
+    assert tracker.latency_percentile('dialogue', 50) == 0.3
+    assert tracker.latency_percentile('dialogue', 100) == 2.0
+    assert tracker.latency_percentile('dialogue', 95, min_samples=10) is None
+
+
+def test_latency_percentile_reads_a_bounded_series_per_model():
+    tracker = LLMStatsTracker()
+    tracker.record_call('rare', 'dialogue', {'total_time': 1.5})
+    for _ in range(3 * LATENCY_WINDOW):
+        tracker.record_call('busy', 'dialogue', {'total_time': 5.0, 'time_to_first_token': 0.2})
+        tracker.record_call('busy', 'dialogue', {'total_time': 0.01, 'cached': True})
+
+    assert tracker.latency_percentile('dialogue', 50, model_name='rare') == 1.5
+    assert tracker.latency_percentile('dialogue', 100) == 0.2  # the rare call fell out of the per-type window
+    assert tracker.latency_percentile('dialogue', 50, total_time=True) == 5.0
+    assert len(tracker._latencies[('dialogue', 'busy')]) == LATENCY_WINDOW
@@ -0,0 +1,236 @@
+# llm_rate_limiter.py
+# Process-wide request-per-minute and token-per-minute limits per (provider, model) target.
+#
+# Every call is pre-charged one request and an estimate of its tokens (prompt
+# estimate + NEXUS_RATE_LIMIT_OUTPUT_ESTIMATE), then reconciled with the usage the
+# provider reports. Interactive callers wait up to NEXUS_RATE_LIMIT_MAX_WAIT seconds
+# for capacity. Background usage types (profile, summary, narrative validation,
+# analysis) may only use the part of each bucket above NEXUS_RATE_LIMIT_BACKGROUND_RESERVE
+# and wait up to NEXUS_RATE_LIMIT_BACKGROUND_MAX_WAIT, so they are deferred first.
+# A caller that cannot get capacity in time gets RateLimitExceeded and llm_wrapper
+# moves on to the next target of the fallback chain without a network call. When no
+# target of the chain has capacity, llm_wrapper returns an empty reply whose stats carry
+# rate_limited and the shortest retry_after, and the chat API answers 503 + Retry-After.
+#
+# Limits (0 = unlimited):
+#   NEXUS_RATE_LIMIT_RPM, NEXUS_RATE_LIMIT_TPM                   (0)  every target
+#   NEXUS_RATE_LIMIT_RPM_<MODEL>, NEXUS_RATE_LIMIT_TPM_<MODEL>        per-model override, MODEL
+#                                                                     as in token_budget
+#   OpenRouter ":free" models default to FREE_MODEL_RPM (20).
+
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from token_budget import estimate_message_tokens
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_USAGE_TYPES = frozenset({'profile', 'summary', 'narrative_validation', 'analysis'})
+FREE_MODEL_RPM = 20
+
+Target = Tuple[str, str]
+
+
+class RateLimitExceeded(RuntimeError):
+    """No capacity within the caller's wait budget. `retry_after` is an estimate in seconds."""
+    def __init__(self, target: Target, retry_after: float):
+        super().__init__(f"Rate limit reached for {target[0]}:{target[1]}, retry after {retry_after:.1f}s")
+        self.target = target
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Bucket holding up to `per_minute` units, refilled continuously. The level may go negative (debt)."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """
+        Seconds until `amount` can be taken while leaving `reserve` (fraction of capacity) behind.
+        An amount larger than the unreserved part only needs a full bucket, so it is never refused forever.
+        """
+        missing = min(amount, self.capacity * (1.0 - reserve)) + reserve * self.capacity - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def give(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+def _model_key(model_name: str) -> str:
+    return re.sub(r"[^A-Z0-9]+", "_", model_name.upper()).strip("_")
+
+
+def _limit(kind: str, model_name: str) -> int:
+    default = os.environ.get(f"NEXUS_RATE_LIMIT_{kind}", "0")
+    if kind == "RPM" and model_name.endswith(":free") and default == "0":
+        default = str(FREE_MODEL_RPM)
+    return int(os.environ.get(f"NEXUS_RATE_LIMIT_{kind}_{_model_key(model_name)}", default))
+
+
+class TargetLimiter:
+    """RPM and TPM buckets of one (provider, model) target."""
+
+    def __init__(self, target: Target, rpm: int, tpm: int):
+        self.target = target
+        self.rpm = TokenBucket(rpm) if rpm > 0 else None
+        self.tpm = TokenBucket(tpm) if tpm > 0 else None
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.rejections = 0
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rpm is None and self.tpm is None
+
+    def _wait_time_locked(self, tokens: int, reserve: float) -> float:
+        now = time.monotonic()
+        wait = 0.0
+        if self.rpm is not None:
+            self.rpm.refill(now)
+            wait = self.rpm.wait_time(1, reserve)
+        if self.tpm is not None:
+            self.tpm.refill(now)
+            wait = max(wait, self.tpm.wait_time(tokens, reserve))
+        return wait
+
+    def acquire(self, tokens: int, reserve: float, max_wait: float) -> int:
+        """Charges one request and `tokens`, waiting up to max_wait. Returns the tokens charged."""
+        if self.unlimited:
+            return 0
+        deadline = time.monotonic() + max_wait
+        waited = False
+        while True:
+            with self._lock:
+                wait = self._wait_time_locked(tokens, reserve)
+                if wait <= 0:
+                    if self.rpm is not None:
+                        self.rpm.take(1)
+                    charged = min(tokens, int(self.tpm.capacity)) if self.tpm is not None else 0
+                    if self.tpm is not None:
+                        self.tpm.take(charged)
+                    if waited:
+                        self.waits += 1
+                    return charged
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    self.rejections += 1
+                    raise RateLimitExceeded(self.target, wait)
+            waited = True
+            time.sleep(min(wait, remaining))
+
+    def reconcile(self, charged: int, actual_tokens: Optional[int]) -> None:
+        """Replaces the pre-charged estimate with the reported usage (refund when the call produced none)."""
+        if self.tpm is None:
+            return
+        with self._lock:
+            difference = charged - (actual_tokens or 0)
+            if difference > 0:
+                self.tpm.give(difference)
+            else:
+                self.tpm.take(-difference)
+
+    def note_rate_limited(self) -> None:
+        """The provider answered 429 anyway: drain the request bucket so callers back off."""
+        if self.rpm is None:
+            return
+        with self._lock:
+            self.rpm.refill(time.monotonic())
+            self.rpm.level = min(self.rpm.level, 0.0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._wait_time_locked(0, 0.0)
+            return {
+                'rpm_limit': int(self.rpm.capacity) if self.rpm else None,
+                'rpm_available': round(self.rpm.level, 1) if self.rpm else None,
+                'tpm_limit': int(self.tpm.capacity) if self.tpm else None,
+                'tpm_available': int(self.tpm.level) if self.tpm else None,
+                'waits': self.waits,
+                'rejections': self.rejections,
+            }
+
+
+@dataclass
+class Reservation:
+    limiter: TargetLimiter
+    charged_tokens: int
+
+    def reconcile(self, stats: Optional[Dict[str, Any]]) -> None:
+        """Settles the charge with the call's stats: a cancelled call still pays for its wasted tokens,
+        a failed one is refunded."""
+        stats = stats or {}
+        if stats.get('cancelled'):
+            actual = stats.get('wasted_tokens')
+        else:
+            actual = None if stats.get('error') else stats.get('total_tokens')
+        self.limiter.reconcile(self.charged_tokens, actual)
+
+
+class RateLimiter:
+    """Registry of per-target limiters built from the environment on first use."""
+
+    def __init__(self):
+        self._targets: Dict[Target, TargetLimiter] = {}
+        self._lock = threading.Lock()
+
+    def for_target(self, target: Target) -> TargetLimiter:
+        with self._lock:
+            limiter = self._targets.get(target)
+            if limiter is None:
+                limiter = TargetLimiter(target, _limit("RPM", target[1]), _limit("TPM", target[1]))
+                self._targets[target] = limiter
+            return limiter
+
+    def acquire(self, target: Target, messages: List[Dict[str, Any]],
+                usage_type: Optional[str] = None) -> Reservation:
+        limiter = self.for_target(target)
+        if limiter.unlimited:
+            return Reservation(limiter, 0)
+        estimate = (sum(estimate_message_tokens(m) for m in messages)
+                    + int(os.environ.get("NEXUS_RATE_LIMIT_OUTPUT_ESTIMATE", "300")))
+        if usage_type in BACKGROUND_USAGE_TYPES:
+            reserve = float(os.environ.get("NEXUS_RATE_LIMIT_BACKGROUND_RESERVE", "0.2"))
+            max_wait = float(os.environ.get("NEXUS_RATE_LIMIT_BACKGROUND_MAX_WAIT", "30"))
+        else:
+            reserve, max_wait = 0.0, float(os.environ.get("NEXUS_RATE_LIMIT_MAX_WAIT", "2"))
+        return Reservation(limiter, limiter.acquire(estimate, reserve, max_wait))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            limiters = [l for l in self._targets.values() if not l.unlimited]
+        return {f"{l.target[0]}:{l.target[1]}": l.snapshot() for l in limiters}
+
+
+_global_limiter: Optional[RateLimiter] = None
+_global_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    """Get or create the process-wide rate limiter"""
+    global _global_limiter
+    with _global_limiter_lock:
+        if _global_limiter is None:
+            _global_limiter = RateLimiter()
+        return _global_limiter
+
+
+def reset_rate_limiter() -> None:
+    """Drops all limiter state (limits are re-read from the environment)"""
+    global _global_limiter
+    with _global_limiter_lock:
+        _global_limiter = None
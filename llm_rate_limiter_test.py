@@ -0,0 +1,112 @@
+import time
+
+import pytest
+
+import llm_hedging
+import llm_resilience
+import llm_wrapper as lw
+from llm_hedging import HedgeBudget
+from llm_rate_limiter import RateLimitExceeded, RateLimiter, Reservation, TargetLimiter
+
+TARGET = ("openrouter", "test/model")
+MESSAGES = [{"role": "user", "content": "x" * 350}]  # ~100 tokens + overhead
+
+
+def test_background_callers_are_deferred_before_interactive_ones(monkeypatch):
+    monkeypatch.setenv("NEXUS_RATE_LIMIT_RPM_TEST_MODEL", "10")
+    monkeypatch.setenv("NEXUS_RATE_LIMIT_MAX_WAIT", "0")
+    monkeypatch.setenv("NEXUS_RATE_LIMIT_BACKGROUND_MAX_WAIT", "0")
+    monkeypatch.setenv("NEXUS_RATE_LIMIT_BACKGROUND_RESERVE", "0.2")
+    limiter = RateLimiter()
+
+    for _ in range(8):
+        limiter.acquire(TARGET, MESSAGES, usage_type="profile")
+    with pytest.raises(RateLimitExceeded):  # the last 20% is reserved for interactive callers
+        limiter.acquire(TARGET, MESSAGES, usage_type="profile")
+
+    limiter.acquire(TARGET, MESSAGES, usage_type="dialogue")
+    limiter.acquire(TARGET, MESSAGES, usage_type="dialogue")
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        limiter.acquire(TARGET, MESSAGES, usage_type="dialogue")
+    assert exc_info.value.retry_after > 0
+    assert limiter.stats()["openrouter:test/model"]["rejections"] == 2
+
+
+def test_large_background_calls_are_admitted_on_a_full_bucket():
+    limiter = TargetLimiter(TARGET, rpm=1, tpm=1000)
+    assert limiter.acquire(870, reserve=0.2, max_wait=0) == 870  # more than the unreserved 800
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        limiter.acquire(870, reserve=0.2, max_wait=0)
+    assert exc_info.value.retry_after <= 60  # a wait that can actually be met
+
+
+def test_token_charge_is_reconciled_with_reported_usage():
+    limiter = TargetLimiter(TARGET, rpm=0, tpm=1000)
+    charged = limiter.acquire(400, reserve=0.0, max_wait=0)
+    assert charged == 400
+    limiter.reconcile(charged, 100)  # the call turned out cheaper
+    assert limiter.tpm.level == pytest.approx(900, abs=1)
+    limiter.reconcile(limiter.acquire(600, 0.0, 0), 900)  # ...and this one more expensive
+    assert limiter.tpm.level == pytest.approx(0, abs=1)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(10, 0.0, 0)
+
+
+def test_models_without_limits_are_not_throttled(monkeypatch):
+    monkeypatch.delenv("NEXUS_RATE_LIMIT_RPM", raising=False)
+    limiter = RateLimiter()
+    for _ in range(100):
+        limiter.acquire(TARGET, MESSAGES)
+    assert limiter.stats() == {}
+    assert limiter.for_target(("openrouter", "some/model:free")).rpm.capacity == 20
+
+
+def test_cancelled_calls_pay_for_their_wasted_tokens_and_failures_are_refunded():
+    limiter = TargetLimiter(TARGET, rpm=0, tpm=1000)
+    Reservation(limiter, limiter.acquire(400, 0.0, 0)).reconcile(
+        {"error": "Cancelled", "cancelled": True, "wasted_tokens": 250})
+    assert limiter.tpm.level == pytest.approx(750, abs=1)
+    Reservation(limiter, limiter.acquire(400, 0.0, 0)).reconcile({"error": "HTTP 500"})
+    assert limiter.tpm.level == pytest.approx(750, abs=1)
+
+
+def test_both_legs_of_a_hedged_call_settle_their_own_reservation(monkeypatch):
+    llm_resilience.reset_breakers()
+    monkeypatch.setenv("NEXUS_HEDGE_MODEL", "hedge/model")
+    monkeypatch.setattr(llm_hedging, "get_hedge_budget", lambda: HedgeBudget(max_per_minute=5))
+    settled = []
+    monkeypatch.setattr(TargetLimiter, "reconcile", lambda self, charged, actual: settled.append((self.target[1], actual)))
+
+    def fake_openrouter(messages, model_name, formatting_function, stream, width, **kwargs):
+        if model_name == "primary/model":
+            time.sleep(0.2)  # loses the race, finishes in the background
+            return "lento", {"model": model_name, "total_tokens": 500, "total_time": 0.2}
+        return "Salve", {"model": model_name, "total_tokens": 200, "total_time": 0.0}
+
+    monkeypatch.setattr(lw, "_call_openrouter", fake_openrouter)
+    target = ("openrouter", "primary/model")
+    reservation = RateLimiter().acquire(target, MESSAGES, "dialogue")
+    (text, _), served_by = lw._hedged_call_target(target, reservation, MESSAGES, None, False, None, 0.01, "dialogue")
+    assert (text, served_by) == ("Salve", ("openrouter", "hedge/model"))
+
+    deadline = time.time() + 2
+    while len(settled) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert sorted(settled) == [("hedge/model", 200), ("primary/model", 500)]  # the loser is not refunded
+
+
+def test_chain_without_capacity_returns_a_retry_later_instead_of_an_error_reply(monkeypatch):
+    llm_resilience.reset_breakers()
+    monkeypatch.setenv("NEXUS_FALLBACK_DIALOGUE", "paid/model")
+    waits = {"free/model": 12.0, "paid/model": 4.5}
+
+    class NoCapacity:
+        def acquire(self, target, messages, usage_type=None):
+            raise RateLimitExceeded(target, waits[target[1]])
+
+    monkeypatch.setattr(lw, "get_rate_limiter", lambda: NoCapacity())
+    monkeypatch.setattr(lw, "_call_openrouter", lambda *args, **kwargs: pytest.fail("network call without capacity"))
+    text, stats = lw.llm_wrapper(MESSAGES, model_name="free/model", stream=False, usage_type="dialogue")
+
+    assert text == ""
+    assert stats["rate_limited"] and stats["retry_after"] == 4.5
@@ -0,0 +1,168 @@
+# llm_resilience.py
+# Fallback chains, per-target circuit breakers and jittered backoff for llm_wrapper.
+#
+# A "target" is a (provider, model) pair. For each usage type (dialogue,
+# command_interpretation, profile, guide_selection, ...) the chain is the requested
+# model followed by NEXUS_FALLBACK_<USAGE_TYPE> (comma separated model ids; the
+# special id "claude-haiku-4.5" routes to the Anthropic API, everything else to
+# OpenRouter). Targets whose breaker is open are skipped without a network call.
+#
+# Breaker settings:
+#   NEXUS_BREAKER_WINDOW        (20)   outcomes kept per target
+#   NEXUS_BREAKER_MIN_CALLS     (5)    outcomes needed before the breaker can trip
+#   NEXUS_BREAKER_ERROR_RATE    (0.5)  failure ratio that trips the breaker
+#   NEXUS_BREAKER_SLOW_SECONDS  (30)   calls slower than this count as failures
+#   NEXUS_BREAKER_COOLDOWN      (30)   seconds open before one probe call is let through
+# Retries on the same target: NEXUS_LLM_RETRIES (1), backoff base/cap
+# NEXUS_LLM_BACKOFF_BASE (0.5s) / NEXUS_LLM_BACKOFF_MAX (8s), full jitter.
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from llm_stats_tracker import get_global_stats_tracker
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_ANTHROPIC = 'anthropic'
+PROVIDER_OPENROUTER = 'openrouter'
+
+ANTHROPIC_DIRECT_MODEL = 'claude-haiku-4.5'
+
+# Preserves the historical behaviour: direct Haiku 4.5 falls back to Haiku 3.5 on OpenRouter
+_BUILTIN_FALLBACKS = {
+    ANTHROPIC_DIRECT_MODEL: ['anthropic/claude-3.5-haiku'],
+}
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+Target = Tuple[str, str]
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def target_for_model(model_name: str) -> Target:
+    provider = PROVIDER_ANTHROPIC if model_name == ANTHROPIC_DIRECT_MODEL else PROVIDER_OPENROUTER
+    return provider, model_name
+
+
+def build_fallback_chain(model_name: str, usage_type: Optional[str] = None) -> List[Target]:
+    """Ordered, de-duplicated targets to try for `model_name` under `usage_type`."""
+    models = [model_name] + _BUILTIN_FALLBACKS.get(model_name, [])
+    if usage_type:
+        configured = os.environ.get(f'NEXUS_FALLBACK_{usage_type.upper()}', '')
+        models += [m.strip() for m in configured.split(',') if m.strip()]
+    chain: List[Target] = []
+    for model in models:
+        target = target_for_model(model)
+        if target not in chain:
+            chain.append(target)
+    return chain
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for retry number `attempt` (0-based)."""
+    base = _env_float('NEXUS_LLM_BACKOFF_BASE', 0.5)
+    cap = _env_float('NEXUS_LLM_BACKOFF_MAX', 8.0)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def is_retryable(http_status: Optional[int]) -> bool:
+    """Transport failures (no status), timeouts, rate limits and server errors are worth retrying."""
+    return http_status is None or http_status in (408, 425, 429) or http_status >= 500
+
+
+class CircuitBreaker:
+    """Rolling-window breaker that trips on failure ratio (errors plus slow calls)."""
+
+    def __init__(self, target: Target, window: Optional[int] = None, min_calls: Optional[int] = None,
+                 error_rate: Optional[float] = None, slow_seconds: Optional[float] = None,
+                 cooldown: Optional[float] = None):
+        self.target = target
+        self.window = window or int(os.environ.get('NEXUS_BREAKER_WINDOW', '20'))
+        self.min_calls = min_calls or int(os.environ.get('NEXUS_BREAKER_MIN_CALLS', '5'))
+        self.error_rate = error_rate if error_rate is not None else _env_float('NEXUS_BREAKER_ERROR_RATE', 0.5)
+        self.slow_seconds = slow_seconds if slow_seconds is not None else _env_float('NEXUS_BREAKER_SLOW_SECONDS', 30)
+        self.cooldown = cooldown if cooldown is not None else _env_float('NEXUS_BREAKER_COOLDOWN', 30)
+        self.state = STATE_CLOSED
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self._outcomes: deque = deque(maxlen=self.window)  # True = failure
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go to this target now. Half-open admits a single probe."""
+        with self._lock:
+            if self.state == STATE_OPEN:
+                if time.time() - self.opened_at < self.cooldown:
+                    return False
+                self._set_state(STATE_HALF_OPEN)
+            if self.state == STATE_HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def release(self) -> None:
+        """Gives back a half-open probe whose call ended without an outcome for this target."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, success: bool, latency: float) -> None:
+        failed = (not success) or latency > self.slow_seconds
+        with self._lock:
+            if self.state == STATE_HALF_OPEN:
+                self._probe_in_flight = False
+                if failed:
+                    self._trip()
+                else:
+                    self._outcomes.clear()
+                    self._set_state(STATE_CLOSED)
+                return
+            self._outcomes.append(failed)
+            if self.state == STATE_CLOSED and len(self._outcomes) >= self.min_calls:
+                if sum(self._outcomes) / len(self._outcomes) >= self.error_rate:
+                    self._trip()
+
+    def _trip(self) -> None:
+        self.trips += 1
+        self.opened_at = time.time()
+        self._set_state(STATE_OPEN)
+        logger.warning(f"[BREAKER] {self.target[0]}:{self.target[1]} opened for {self.cooldown:.0f}s")
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        get_global_stats_tracker().record_breaker_state(f"{self.target[0]}:{self.target[1]}", self.snapshot())
+
+    def snapshot(self) -> Dict[str, object]:
+        failures = sum(self._outcomes)
+        return {
+            'state': self.state,
+            'trips': self.trips,
+            'recent_calls': len(self._outcomes),
+            'recent_failures': failures,
+            'opened_at': self.opened_at,
+        }
+
+
+_breakers: Dict[Target, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(target: Target) -> CircuitBreaker:
+    with _breakers_lock:
+        if target not in _breakers:
+            _breakers[target] = CircuitBreaker(target)
+        return _breakers[target]
+
+def reset_breakers() -> None:
+    with _breakers_lock:
+        _breakers.clear()
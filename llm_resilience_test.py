@@ -0,0 +1,136 @@
+from unittest.mock import patch
+
+import pytest
+
+import llm_resilience
+from llm_resilience import CircuitBreaker, build_fallback_chain, STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN
+from llm_stats_tracker import get_global_stats_tracker, reset_global_stats_tracker
+
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    llm_resilience.reset_breakers()
+    reset_global_stats_tracker()
+    yield
+    llm_resilience.reset_breakers()
+
+
+def test_fallback_chain_includes_builtin_and_configured_models():
+    with patch.dict('os.environ', {'NEXUS_FALLBACK_DIALOGUE': 'google/gemini-2.5-flash, anthropic/claude-3.5-haiku'}):
+        chain = build_fallback_chain('claude-haiku-4.5', 'dialogue')
+    assert chain == [('anthropic', 'claude-haiku-4.5'),
+                     ('openrouter', 'anthropic/claude-3.5-haiku'),
+                     ('openrouter', 'google/gemini-2.5-flash')]
+
+
+def test_breaker_trips_on_errors_and_slow_calls_then_probes():
+    breaker = CircuitBreaker(('openrouter', 'm'), window=4, min_calls=4, error_rate=0.5,
+                             slow_seconds=1.0, cooldown=0.0)
+    breaker.record(True, 0.1)
+    breaker.record(True, 0.2)
+    breaker.record(False, 0.1)
+    assert breaker.state == STATE_CLOSED
+    breaker.record(True, 5.0)  # too slow: counts as a failure
+    assert breaker.state == STATE_OPEN
+    assert get_global_stats_tracker().get_breaker_states()['openrouter:m']['state'] == STATE_OPEN
+
+    assert breaker.allow()          # cooldown elapsed: one probe
+    assert breaker.state == STATE_HALF_OPEN
+    assert not breaker.allow()      # second caller waits for the probe
+    breaker.record(True, 0.1)
+    assert breaker.state == STATE_CLOSED
+
+
+def test_llm_wrapper_retries_then_falls_back_and_skips_open_targets():
+    import llm_wrapper as lw
+    calls = []
+
+    def fake_openrouter(messages, model_name, formatting_function, stream, width):
+        calls.append(model_name)
+        if model_name == 'free/model':
+            return "[Errore API]", {"model": model_name, "error": "429 Too Many Requests", "http_status": 429,
+                                    "total_time": 0.01, "time_to_first_token": None}
+        return "Salve", {"model": model_name, "total_time": 0.02, "input_tokens": 3, "output_tokens": 1}
+
+    messages = [{"role": "user", "content": "ciao"}]
+    env = {'NEXUS_FALLBACK_DIALOGUE': 'paid/model', 'NEXUS_LLM_RETRIES': '1'}
+    with patch.dict('os.environ', env), patch.object(lw, '_call_openrouter', fake_openrouter), \
+            patch.object(llm_resilience, 'backoff_delay', return_value=0):
+        text, stats = lw.llm_wrapper(messages, model_name='free/model', stream=False,
+                                     collect_stats=True, usage_type='dialogue')
+        assert (text, stats['model'], stats['fallback_from']) == ("Salve", 'paid/model', 'free/model')
+        assert calls == ['free/model', 'free/model', 'paid/model']
+
+        llm_resilience.get_breaker(('openrouter', 'free/model'))._trip()
+        calls.clear()
+        lw.llm_wrapper(messages, model_name='free/model', stream=False, usage_type='dialogue')
+        assert calls == ['paid/model']
+    assert get_global_stats_tracker().fallback_count == 2
+
+
+def _half_open(target):
+    breaker = llm_resilience.get_breaker(target)
+    breaker.cooldown = 0.0
+    breaker._trip()
+    return breaker  # the next allow() claims the probe
+
+
+def test_probe_lost_to_a_hedge_on_another_model_is_given_back(monkeypatch):
+    import time
+    import llm_hedging
+    import llm_wrapper as lw
+
+    monkeypatch.setenv('NEXUS_HEDGE_DIALOGUE', '1')
+    monkeypatch.setenv('NEXUS_HEDGE_MIN_SAMPLES', '1')
+    monkeypatch.setenv('NEXUS_HEDGE_MODEL', 'hedge/model')
+    monkeypatch.setattr(llm_hedging, 'get_hedge_budget', lambda: llm_hedging.HedgeBudget(max_per_minute=5))
+    get_global_stats_tracker().record_call('slow/model', 'dialogue', {'total_time': 0.02})
+
+    def fake_openrouter(messages, model_name, formatting_function, stream, width, **kwargs):
+        if model_name == 'slow/model':
+            time.sleep(0.3)
+        return "Salve", {"model": model_name, "total_time": 0.01, "total_tokens": 5}
+
+    monkeypatch.setattr(lw, '_call_openrouter', fake_openrouter)
+    breaker = _half_open(('openrouter', 'slow/model'))
+    text, stats = lw.llm_wrapper([{"role": "user", "content": "ciao"}], model_name='slow/model',
+                                 stream=False, collect_stats=True, usage_type='dialogue')
+
+    assert (text, stats['hedge_winner']) == ("Salve", 'hedge')
+    assert breaker.state == STATE_HALF_OPEN and breaker.allow()
+
+
+def test_rate_limit_skip_does_not_keep_the_half_open_probe(monkeypatch):
+    import llm_wrapper as lw
+    from llm_rate_limiter import RateLimitExceeded
+
+    class NoCapacity:
+        def acquire(self, target, messages, usage_type=None):
+            raise RateLimitExceeded(target, 5.0)
+
+    monkeypatch.setattr(lw, 'get_rate_limiter', lambda: NoCapacity())
+    breaker = _half_open(('openrouter', 'busy/model'))
+    text, stats = lw.llm_wrapper([{"role": "user", "content": "ciao"}], model_name='busy/model',
+                                 stream=False, usage_type='dialogue')
+
+    assert stats['rate_limited']
+    assert breaker.state == STATE_HALF_OPEN and breaker.allow()
+
+
+def test_cancelled_half_open_probe_lets_the_target_be_probed_again(monkeypatch):
+    import llm_wrapper as lw
+    from llm_cancellation import CancellationToken
+
+    token = CancellationToken()
+
+    def fake_openrouter(messages, model_name, formatting_function, stream, width, **kwargs):
+        token.cancel("speculation lost")
+        return lw._cancelled_result(model_name, messages, "", 0.0)
+
+    monkeypatch.setattr(lw, '_call_openrouter', fake_openrouter)
+    breaker = _half_open(('openrouter', 'probe/model'))
+    text, stats = lw.llm_wrapper([{"role": "user", "content": "ciao"}], model_name='probe/model',
+                                 stream=False, usage_type='dialogue', cancel_token=token)
+
+    assert (text, stats['cancelled']) == ("", True)
+    assert breaker.state == STATE_HALF_OPEN and breaker.allow()
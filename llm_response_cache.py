@@ -0,0 +1,106 @@
+# llm_response_cache.py
+# Content-addressed cache for deterministic utility LLM calls.
+#
+# Entries are keyed by a SHA-256 of (model, messages, sampling params) and held in an
+# in-memory LRU with a TTL. When NEXUS_LLM_CACHE_PATH points to a file, entries are
+# also written to a SQLite store there so they survive restarts.
+#
+# Settings:
+#   NEXUS_LLM_CACHE        ("1")   global kill switch for call sites that opted in
+#   NEXUS_LLM_CACHE_SIZE   (1000)  in-memory entries
+#   NEXUS_LLM_CACHE_TTL    (3600)  seconds an entry stays valid
+#   NEXUS_LLM_CACHE_PATH   (unset) SQLite file for the persistent store
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model_name: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+    canonical = json.dumps({'model': model_name, 'messages': messages, 'params': params},
+                           sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """LRU + TTL cache of response texts, optionally backed by SQLite."""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None,
+                 disk_path: Optional[str] = None):
+        self.max_entries = max_entries or int(os.environ.get('NEXUS_LLM_CACHE_SIZE', '1000'))
+        self.ttl = ttl if ttl is not None else float(os.environ.get('NEXUS_LLM_CACHE_TTL', '3600'))
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()  # key -> (expires_at, text)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if disk_path:
+            try:
+                self._db = sqlite3.connect(disk_path, check_same_thread=False)
+                self._db.execute("CREATE TABLE IF NOT EXISTS llm_cache "
+                                 "(cache_key TEXT PRIMARY KEY, expires_at REAL, response TEXT)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"[LLM-CACHE] Disk store at {disk_path} unavailable, using memory only: {e}")
+                self._db = None
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+            if self._db is None:
+                return None
+            row = self._db.execute("SELECT expires_at, response FROM llm_cache WHERE cache_key = ?",
+                                   (key,)).fetchone()
+            if row is None or row[0] <= now:
+                return None
+            self._store_locked(key, row[0], row[1])
+            return row[1]
+
+    def put(self, key: str, text: str) -> None:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store_locked(key, expires_at, text)
+            if self._db is not None:
+                try:
+                    self._db.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)", (key, expires_at, text))
+                    self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"[LLM-CACHE] Could not persist cache entry: {e}")
+
+    def _store_locked(self, key: str, expires_at: float, text: str) -> None:
+        self._entries[key] = (expires_at, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def cache_enabled() -> bool:
+    return os.environ.get('NEXUS_LLM_CACHE', '1') != '0'
+
+
+_global_cache: Optional[ResponseCache] = None
+_global_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    """Get or create the process-wide response cache"""
+    global _global_cache
+    with _global_cache_lock:
+        if _global_cache is None:
+            _global_cache = ResponseCache(disk_path=os.environ.get('NEXUS_LLM_CACHE_PATH'))
+        return _global_cache
@@ -0,0 +1,75 @@
+import time
+from unittest.mock import patch
+
+from llm_response_cache import ResponseCache, make_cache_key
+
+
+def test_key_depends_on_model_messages_and_params():
+    messages = [{"role": "user", "content": "Condense: Salve viandante"}]
+    key = make_cache_key("m", messages, {"temperature": 0.7})
+    assert key == make_cache_key("m", [dict(messages[0])], {"temperature": 0.7})
+    assert key != make_cache_key("other", messages, {"temperature": 0.7})
+    assert key != make_cache_key("m", messages, {"temperature": 0.2})
+
+
+def test_lru_eviction_ttl_and_disk_persistence(tmp_path):
+    db_path = str(tmp_path / "llm_cache.sqlite")
+    cache = ResponseCache(max_entries=2, ttl=60, disk_path=db_path)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    cache.get("a")
+    cache.put("c", "C")  # evicts "b" from memory, the least recently used
+    assert len(cache) == 2
+
+    restarted = ResponseCache(max_entries=2, ttl=60, disk_path=db_path)
+    assert (restarted.get("a"), restarted.get("b"), restarted.get("c")) == ("A", "B", "C")
+
+    short_lived = ResponseCache(max_entries=2, ttl=0.01)
+    short_lived.put("a", "A")
+    time.sleep(0.02)
+    assert short_lived.get("a") is None
+
+
+def test_llm_wrapper_serves_repeated_opted_in_calls_from_cache():
+    import llm_response_cache
+    import llm_wrapper as lw
+    from llm_stats_tracker import get_global_stats_tracker, reset_global_stats_tracker
+
+    reset_global_stats_tracker()
+    calls = []
+    fake = lambda messages, model_name, *args: calls.append(model_name) or \
+        ("Lyra", {"model": model_name, "total_time": 0.5})
+    messages = [{"role": "user", "content": "Who is the wise guide?"}]
+    with patch.object(lw, '_call_openrouter', fake), \
+            patch.object(llm_response_cache, '_global_cache', ResponseCache(max_entries=10, ttl=60)):
+        first = lw.llm_wrapper(messages, "guide/model", stream=False, collect_stats=True, cache=True)
+        second = lw.llm_wrapper(messages, "guide/model", stream=False, collect_stats=True, cache=True)
+        lw.llm_wrapper(messages, "guide/model", stream=False)  # not opted in
+
+    assert first[0] == second[0] == "Lyra"
+    assert second[1]["cached"] is True
+    assert len(calls) == 2
+    tracker = get_global_stats_tracker()
+    assert (tracker.cache_hits, tracker.cache_misses) == (1, 1)
+
+
+def test_fallback_replies_are_not_cached_under_the_primary_key(monkeypatch):
+    import llm_response_cache
+    import llm_wrapper as lw
+
+    monkeypatch.setenv("NEXUS_LLM_RETRIES", "0")
+    monkeypatch.setenv("NEXUS_FALLBACK_GUIDE_SELECTION", "backup/cache-model")
+
+    def fake(messages, model_name, *args):
+        if model_name == "primary/cache-model":
+            return "", {"model": model_name, "error": "HTTP 400", "http_status": 400}
+        return "Syra", {"model": model_name, "total_time": 0.5}
+
+    cache = ResponseCache(max_entries=10, ttl=60)
+    messages = [{"role": "user", "content": "Who is the wise guide?"}]
+    with patch.object(lw, '_call_openrouter', fake), patch.object(llm_response_cache, '_global_cache', cache):
+        text, stats = lw.llm_wrapper(messages, "primary/cache-model", stream=False, collect_stats=True,
+                                     usage_type="guide_selection", cache=True)
+
+    assert text == "Syra" and stats["fallback_from"] == "primary/cache-model"
+    assert len(cache) == 0
@@ -0,0 +1,150 @@
+# llm_scheduler.py
+# Central, bounded execution lanes for outbound LLM work.
+#
+# Lanes:
+#   turns       - whole chat turns (admission control for /api/chat; a turn mostly waits
+#                 on the LLM lanes below, so it must not occupy one of their workers)
+#   interactive - player-facing LLM calls made by a turn (speculative dialogue)
+#   nlp         - natural-language command interpretation
+#   background  - profile analysis and other work nobody is waiting on
+# Each lane has a fixed number of workers and a bounded priority queue (lower
+# priority value runs first). When a lane's queue is full, submit() raises
+# LaneSaturatedError carrying a Retry-After hint instead of queueing unboundedly.
+
+import itertools
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LANE_TURNS = 'turns'
+LANE_INTERACTIVE = 'interactive'
+LANE_NLP = 'nlp'
+LANE_BACKGROUND = 'background'
+
+# Priorities within a lane (lower runs first)
+PRIORITY_SPECULATIVE = 0   # work a running turn is already waiting on
+PRIORITY_TURN = 10
+PRIORITY_BACKGROUND = 20
+
+_DEFAULT_LANE_CONFIG = {
+    LANE_TURNS: {'workers': 16, 'max_queue': 32},
+    LANE_INTERACTIVE: {'workers': 16, 'max_queue': 32},
+    LANE_NLP: {'workers': 8, 'max_queue': 32},
+    LANE_BACKGROUND: {'workers': 4, 'max_queue': 64},
+}
+
+
+class LaneSaturatedError(RuntimeError):
+    """Raised when a lane's queue is full. `retry_after` is a hint in whole seconds."""
+    def __init__(self, lane: str, retry_after: int):
+        super().__init__(f"LLM lane '{lane}' is saturated, retry after {retry_after}s")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class _Lane:
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._queued = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.avg_task_time = 1.0  # EWMA seconds, seeds the Retry-After estimate
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"llm-{name}-{i}", daemon=True).start()
+
+    def submit(self, func: Callable, args, kwargs, priority: int) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if self._queued >= self.max_queue and self.active >= self.workers:
+                self.rejected += 1
+                raise LaneSaturatedError(self.name, self.retry_after())
+            self._queued += 1
+        self._queue.put((priority, next(self._seq), future, func, args, kwargs))
+        return future
+
+    def retry_after(self) -> int:
+        backlog = self._queued + self.active
+        return int(min(30, max(1, math.ceil(self.avg_task_time * backlog / self.workers))))
+
+    def _worker(self):
+        while True:
+            _, _, future, func, args, kwargs = self._queue.get()
+            with self._lock:
+                self._queued -= 1
+            if not future.set_running_or_notify_cancel():
+                continue  # cancelled while queued
+            with self._lock:
+                self.active += 1
+            start_time = time.time()
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                elapsed = time.time() - start_time
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+                    self.avg_task_time = 0.8 * self.avg_task_time + 0.2 * elapsed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'active': self.active,
+                'queued': self._queued,
+                'max_queue': self.max_queue,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'avg_task_ms': int(self.avg_task_time * 1000),
+            }
+
+
+class LLMScheduler:
+    """Bounded lanes for LLM work. Lane sizes come from NEXUS_LLM_<LANE>_WORKERS / _QUEUE."""
+
+    def __init__(self, lane_config: Optional[Dict[str, Dict[str, int]]] = None):
+        config = lane_config or {
+            name: {
+                'workers': int(os.environ.get(f'NEXUS_LLM_{name.upper()}_WORKERS', defaults['workers'])),
+                'max_queue': int(os.environ.get(f'NEXUS_LLM_{name.upper()}_QUEUE', defaults['max_queue'])),
+            }
+            for name, defaults in _DEFAULT_LANE_CONFIG.items()
+        }
+        self._lanes = {name: _Lane(name, cfg['workers'], cfg['max_queue']) for name, cfg in config.items()}
+
+    def submit(self, lane: str, func: Callable, *args, priority: int = PRIORITY_TURN, **kwargs) -> Future:
+        """Queues func(*args, **kwargs) on `lane`. Raises LaneSaturatedError when the lane is full."""
+        return self._lanes[lane].submit(func, args, kwargs, priority)
+
+    def run(self, lane: str, func: Callable, *args, priority: int = PRIORITY_TURN, **kwargs) -> Any:
+        """Sync facade: submits and waits for the result."""
+        return self.submit(lane, func, *args, priority=priority, **kwargs).result()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: lane.stats() for name, lane in self._lanes.items()}
+
+
+_global_scheduler: Optional[LLMScheduler] = None
+_global_scheduler_lock = threading.Lock()
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Get or create the process-wide scheduler"""
+    global _global_scheduler
+    with _global_scheduler_lock:
+        if _global_scheduler is None:
+            _global_scheduler = LLMScheduler()
+        return _global_scheduler
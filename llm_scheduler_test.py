@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+from llm_scheduler import (LLMScheduler, LaneSaturatedError, LANE_INTERACTIVE, LANE_TURNS, PRIORITY_BACKGROUND,
+                           PRIORITY_SPECULATIVE)
+
+
+def _single_worker_scheduler(max_queue):
+    return LLMScheduler({'interactive': {'workers': 1, 'max_queue': max_queue}})
+
+
+def test_queued_work_runs_in_priority_order():
+    scheduler = _single_worker_scheduler(max_queue=4)
+    gate = threading.Event()
+    order = []
+
+    blocker = scheduler.submit('interactive', gate.wait)
+    low = scheduler.submit('interactive', order.append, 'background', priority=PRIORITY_BACKGROUND)
+    high = scheduler.submit('interactive', order.append, 'speculative', priority=PRIORITY_SPECULATIVE)
+    gate.set()
+    for future in (blocker, low, high):
+        future.result(timeout=2)
+
+    assert order == ['speculative', 'background']
+    assert scheduler.run('interactive', lambda x: x * 2, 21) == 42
+
+
+def test_full_lane_rejects_with_retry_after():
+    scheduler = _single_worker_scheduler(max_queue=1)
+    gate = threading.Event()
+    started = threading.Event()
+
+    running = scheduler.submit('interactive', lambda: (started.set(), gate.wait()))
+    assert started.wait(timeout=2)
+    queued = scheduler.submit('interactive', lambda: 'queued')
+
+    with pytest.raises(LaneSaturatedError) as excinfo:
+        scheduler.submit('interactive', lambda: 'rejected')
+    assert excinfo.value.lane == 'interactive'
+    assert 1 <= excinfo.value.retry_after <= 30
+
+    gate.set()
+    assert queued.result(timeout=2) == 'queued'
+    running.result(timeout=2)
+    assert scheduler.stats()['interactive']['rejected'] == 1
+
+
+def test_turns_do_not_hold_the_workers_their_dialogue_needs():
+    scheduler = LLMScheduler({LANE_TURNS: {'workers': 2, 'max_queue': 0},
+                              LANE_INTERACTIVE: {'workers': 1, 'max_queue': 2}})
+    both_started = threading.Barrier(2)
+
+    def turn(tag):
+        both_started.wait(timeout=2)  # every turn worker is busy before any dialogue is queued
+        return scheduler.submit(LANE_INTERACTIVE, lambda: f"dialogue {tag}",
+                                priority=PRIORITY_SPECULATIVE).result(timeout=2)
+
+    turns = [scheduler.submit(LANE_TURNS, turn, tag) for tag in ('a', 'b')]
+    assert [t.result(timeout=5) for t in turns] == ['dialogue a', 'dialogue b']
+    assert scheduler.stats()[LANE_INTERACTIVE]['completed'] == 2
@@ -1,11 +1,17 @@
 # llm_stats_tracker.py
 # Unified LLM statistics tracking across multiple model types
 
+import os
+import threading
 import time
-from typing import Dict, List, Optional, Any
+from collections import deque
+from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, field
 from terminal_formatter import TerminalFormatter
 
+# Successful provider calls kept per (model type, model) latency series
+LATENCY_WINDOW = int(os.environ.get('NEXUS_LATENCY_WINDOW', '100'))
+
 @dataclass
 class LLMCallStats:
     """Statistics for a single LLM call"""
@@ -17,6 +23,9 @@ class LLMCallStats:
     output_tokens: int
     total_tokens: int
     error: Optional[str] = None
+    history_tokens_trimmed: int = 0  # conversation tokens left out of the prompt by the token budget
+    cached_tokens: int = 0  # input tokens served from the provider's prompt cache
+    cached: bool = False  # served from the local response cache, no provider call
     timestamp: float = field(default_factory=time.time)
 
 @dataclass
@@ -55,13 +64,43 @@ class LLMTypeStats:
     def avg_throughput(self) -> float:
         return self.total_output_tokens / self.total_time if self.total_time > 0 else 0.0
 
+@dataclass
+class PromptCacheStats:
+    """Provider prompt cache usage for one NPC on one model"""
+    calls: int = 0
+    cache_hits: int = 0  # calls with at least one cached input token
+    input_tokens: int = 0
+    cached_tokens: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.cache_hits / self.calls if self.calls > 0 else 0.0
+
+    @property
+    def cached_token_ratio(self) -> float:
+        return self.cached_tokens / self.input_tokens if self.input_tokens > 0 else 0.0
+
 class LLMStatsTracker:
     """Unified tracker for all LLM model usage"""
     
     def __init__(self):
+        self._lock = threading.Lock()  # turns record and read stats from several threads
         self.session_start_time = time.time()
         self.type_stats: Dict[str, LLMTypeStats] = {}
         self.all_calls: List[LLMCallStats] = []
+        self.breaker_states: Dict[str, Dict[str, Any]] = {}  # "provider:model" -> breaker snapshot
+        self.fallback_count = 0
+        self.hedge_count = 0
+        self.hedge_wins = 0  # hedges that beat the primary call
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.prompt_cache: Dict[Tuple[str, str], PromptCacheStats] = {}  # (npc, model) -> usage
+        self.cancelled_calls: Dict[str, int] = {}  # usage type -> calls aborted by a CancellationToken
+        self.wasted_tokens: Dict[str, int] = {}  # usage type -> tokens paid for and thrown away
+        self.speculation_turns: List[Dict[str, Any]] = []  # per-turn branch timings (speculation.py)
+        # (model type, model) and (model type, None) -> recent (total_time, time_to_first_token)
+        # of successful provider calls, newest last
+        self._latencies: Dict[Tuple[str, Optional[str]], deque] = {}
         
     def record_call(self, model_name: str, model_type: str, stats_dict: Dict[str, Any]) -> LLMCallStats:
         """Record statistics from an LLM call"""
@@ -73,18 +112,158 @@ class LLMStatsTracker:
             input_tokens=stats_dict.get('input_tokens', 0),
             output_tokens=stats_dict.get('output_tokens', 0),
             total_tokens=stats_dict.get('total_tokens', stats_dict.get('input_tokens', 0) + stats_dict.get('output_tokens', 0)),
-            error=stats_dict.get('error')
+            error=stats_dict.get('error'),
+            history_tokens_trimmed=stats_dict.get('history_tokens_trimmed', 0),
+            cached_tokens=stats_dict.get('cached_tokens') or 0,
+            cached=bool(stats_dict.get('cached'))
         )
         
-        self.all_calls.append(call_stats)
-        
-        # Update type-specific stats
-        if model_type not in self.type_stats:
-            self.type_stats[model_type] = LLMTypeStats(model_type=model_type)
-        
-        self.type_stats[model_type].add_call_stats(call_stats)
+        with self._lock:
+            self.all_calls.append(call_stats)
+
+            # Update type-specific stats
+            if model_type not in self.type_stats:
+                self.type_stats[model_type] = LLMTypeStats(model_type=model_type)
+
+            self.type_stats[model_type].add_call_stats(call_stats)
+
+            if not call_stats.error and not call_stats.cached:
+                sample = (call_stats.total_time, call_stats.time_to_first_token)
+                for key in ((model_type, model_name), (model_type, None)):
+                    series = self._latencies.get(key)
+                    if series is None:
+                        series = self._latencies[key] = deque(maxlen=LATENCY_WINDOW)
+                    series.append(sample)
         return call_stats
     
+    def record_breaker_state(self, target: str, snapshot: Dict[str, Any]):
+        """Record the latest circuit breaker state for a provider:model target"""
+        with self._lock:
+            self.breaker_states[target] = dict(snapshot, updated_at=time.time())
+
+    def record_fallback(self):
+        """Count a call that was served by a later target in its fallback chain"""
+        with self._lock:
+            self.fallback_count += 1
+
+    def record_hedge(self, won: bool):
+        """Count an issued hedge request and whether it beat the primary"""
+        with self._lock:
+            self.hedge_count += 1
+            if won:
+                self.hedge_wins += 1
+
+    def record_cache_lookup(self, hit: bool):
+        """Count a response cache lookup"""
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def record_cancellation(self, usage_type: Optional[str], wasted_tokens: int, aborted: bool = True):
+        """Count tokens spent on work whose result was discarded, and whether the call was aborted in flight"""
+        key = usage_type or 'unknown'
+        with self._lock:
+            if aborted:
+                self.cancelled_calls[key] = self.cancelled_calls.get(key, 0) + 1
+            self.wasted_tokens[key] = self.wasted_tokens.get(key, 0) + wasted_tokens
+
+    def get_cancellation_stats(self) -> Dict[str, Dict[str, int]]:
+        """Cancelled calls and wasted tokens per usage type"""
+        with self._lock:
+            return {
+                usage_type: {'cancelled': self.cancelled_calls.get(usage_type, 0),
+                             'wasted_tokens': self.wasted_tokens.get(usage_type, 0)}
+                for usage_type in set(self.cancelled_calls) | set(self.wasted_tokens)
+            }
+
+    def record_speculation(self, timings: Dict[str, Any], window: int = 200):
+        """Record the branch timings of one speculative turn (most recent `window` turns are kept)"""
+        with self._lock:
+            self.speculation_turns.append(timings)
+            del self.speculation_turns[:-window]
+
+    def get_speculation_stats(self) -> Dict[str, Any]:
+        """Outcome and path counts and average NLP decision / dialogue start times of recent speculative turns"""
+        with self._lock:
+            turns = list(self.speculation_turns)
+        outcomes: Dict[str, int] = {}
+        for turn in turns:
+            outcomes[turn['outcome']] = outcomes.get(turn['outcome'], 0) + 1
+
+        def average(values: List[int]) -> Optional[int]:
+            return int(sum(values) / len(values)) if values else None
+
+        paths: Dict[str, int] = {}
+        for turn in turns:
+            if 'path' in turn:
+                paths[turn['path']] = paths.get(turn['path'], 0) + 1
+        return {
+            'turns': len(turns),
+            'outcomes': outcomes,
+            'paths': paths,
+            'local_decisions': sum(1 for t in turns if t.get('nlp', {}).get('source') == 'local'),
+            'avg_decision_ms': average([t['decision_ms'] for t in turns if 'decision_ms' in t]),
+            'avg_dialogue_start_ms': average([t['dialogue']['start_ms'] for t in turns if 'dialogue' in t]),
+        }
+
+    def record_prompt_cache(self, npc_name: str, model_name: str, stats_dict: Dict[str, Any]):
+        """Aggregate cached input tokens of a successful call per NPC and model"""
+        if stats_dict.get('error'):
+            return
+        cached = stats_dict.get('cached_tokens') or 0
+        with self._lock:
+            entry = self.prompt_cache.setdefault((npc_name, model_name), PromptCacheStats())
+            entry.calls += 1
+            entry.input_tokens += stats_dict.get('input_tokens', 0)
+            entry.cached_tokens += cached
+            if cached > 0:
+                entry.cache_hits += 1
+
+    def get_prompt_cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Prompt cache usage keyed by "npc|model" """
+        with self._lock:
+            entries = list(self.prompt_cache.items())
+        return {
+            f"{npc}|{model}": {
+                'calls': entry.calls,
+                'cache_hits': entry.cache_hits,
+                'hit_rate': round(entry.hit_rate, 3),
+                'input_tokens': entry.input_tokens,
+                'cached_tokens': entry.cached_tokens,
+                'cached_token_ratio': round(entry.cached_token_ratio, 3),
+            }
+            for (npc, model), entry in entries
+        }
+
+    def latency_percentile(self, model_type: str, percentile: float, window: int = 100,
+                           min_samples: int = 1, model_name: Optional[str] = None,
+                           total_time: bool = False) -> Optional[float]:
+        """
+        Percentile of recent successful call latency for a model type (optionally one model):
+        time to first token when the call streamed, total time otherwise or when total_time
+        is set. Response cache hits are not provider latency and are skipped. Reads the newest
+        `window` samples (at most LATENCY_WINDOW) of the series kept by record_call. None when
+        there are too few samples.
+        """
+        with self._lock:
+            series = list(self._latencies.get((model_type, model_name or None), ()))
+        samples = [
+            call_time if total_time or first_token is None else first_token
+            for call_time, first_token in series[-window:]
+        ] if window > 0 else []
+        if len(samples) < max(1, min_samples):
+            return None
+        samples.sort()
+        index = min(len(samples) - 1, int(round(percentile / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def get_breaker_states(self) -> Dict[str, Dict[str, Any]]:
+        """Get the latest known state of every circuit breaker"""
+        with self._lock:
+            return dict(self.breaker_states)
+    
     def get_last_stats_by_type(self, model_type: str) -> Optional[LLMCallStats]:
         """Get the last call stats for a specific model type"""
         if model_type in self.type_stats:
@@ -150,6 +329,17 @@ class LLMStatsTracker:
                     emoji = self._get_type_emoji(model_type)
                     model_short = stats.current_model.split('/')[-1] if stats.current_model and '/' in stats.current_model else (stats.current_model or 'N/A')
                     lines.append(f"{TerminalFormatter.DIM}  {emoji} {model_type.title()}: {stats.total_calls} chiamate, {stats.total_tokens} tokens ({model_short}){TerminalFormatter.RESET}")
+
+            open_breakers = [target for target, state in self.breaker_states.items() if state.get('state') != 'closed']
+            prompt_calls = sum(entry.calls for entry in self.prompt_cache.values())
+            if prompt_calls:
+                prompt_input = sum(entry.input_tokens for entry in self.prompt_cache.values())
+                prompt_cached = sum(entry.cached_tokens for entry in self.prompt_cache.values())
+                lines.append(f"{TerminalFormatter.DIM}- Prompt Cache: {prompt_cached} / {prompt_input} tokens input in cache ({prompt_cached / prompt_input * 100 if prompt_input else 0:.1f}%){TerminalFormatter.RESET}")
+            if self.cache_hits or self.cache_misses:
+                lines.append(f"{TerminalFormatter.DIM}- Cache Risposte (Hit/Miss): {self.cache_hits} / {self.cache_misses}{TerminalFormatter.RESET}")
+            if open_breakers or self.fallback_count:
+                lines.append(f"{TerminalFormatter.DIM}- Fallback Usati: {self.fallback_count} • Circuit Breaker Aperti: {', '.join(open_breakers) or 'nessuno'}{TerminalFormatter.RESET}")
         
         return "\n".join(lines)
     
@@ -5,7 +5,17 @@ import os
 import requests # Dependency: pip install requests
 import json
 import logging
-from typing import List, Dict, Optional, Tuple, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import output_channel
+from llm_client import get_llm_client
+import llm_resilience
+import llm_hedging
+import llm_response_cache
+from llm_rate_limiter import get_rate_limiter, RateLimitExceeded, Reservation
+from llm_cancellation import CancellationToken, LLMCancelled
+from llm_stats_tracker import get_global_stats_tracker
+from token_budget import estimate_message_tokens, estimate_tokens
 
 from dotenv import load_dotenv
 
@@ -24,12 +34,31 @@ def get_request_session():
         adapter = requests.adapters.HTTPAdapter(
             pool_connections=5,
             pool_maxsize=10,
-            max_retries=1
+            max_retries=0  # Retries and fallbacks are handled by llm_wrapper's fallback chain
         )
         _request_session.mount('http://', adapter)
         _request_session.mount('https://', adapter)
     return _request_session
 
+def _post_llm_request(provider: str, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                      stream: bool, timeout: float, cancel_token: Optional[CancellationToken] = None):
+    """
+    POSTs through the pooled async client when enabled, else the shared requests session.
+    Raises LLMCancelled when `cancel_token` is cancelled before or during the request.
+    """
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+    client = get_llm_client()
+    if client is not None:
+        return client.post(provider, url, headers, payload, stream=stream, timeout=timeout,
+                           cancel_token=cancel_token)
+    response = get_request_session().post(url, headers=headers, json=payload, stream=stream, timeout=timeout)
+    if cancel_token is not None:
+        if stream:
+            cancel_token.on_cancel(response.close)  # Unblocks iter_lines()
+        cancel_token.raise_if_cancelled()
+    return response
+
 # Configure basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s')
 
@@ -55,62 +84,79 @@ TF = TerminalFormatter # Alias for convenience if needed within this file direct
 
 
 # --- process_direct_streaming_output ---
+class StreamCollector:
+    """
+    Accumulates streamed text chunks in a list (joined once at the end), hands each
+    chunk to an optional token callback, and keeps the provider's final usage block.
+    """
+    __slots__ = ("chunks", "on_token", "first_token_time", "usage")
+
+    def __init__(self, on_token: Optional[Callable[[str], None]] = None,
+                 first_token_time: Optional[float] = None):
+        self.chunks: List[str] = []
+        self.on_token = on_token
+        self.first_token_time = first_token_time
+        self.usage: Optional[Dict[str, Any]] = None
+
+    def add(self, token: str) -> None:
+        if self.first_token_time is None:
+            self.first_token_time = time.time()
+        self.chunks.append(token)
+        if self.on_token is not None:
+            self.on_token(token)
+
+    def merge_usage(self, usage: Dict[str, Any]) -> None:
+        self.usage = dict(self.usage or {}, **usage)
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+
 def process_direct_streaming_output(response: requests.Response,
                                     formatting_function: callable,
                                     width: int,
-                                    first_token_time: Optional[float]) -> Tuple[str, Optional[float]]:
-    output_text = ""
-    buffer = ""
-    start_marker = "data: " # For Server-Sent Events (SSE)
-    stop_marker = "[DONE]"  # Common SSE stop signal from OpenAI-like APIs
-
+                                    first_token_time: Optional[float],
+                                    on_token: Optional[Callable[[str], None]] = None,
+                                    collector: Optional[StreamCollector] = None) -> Tuple[str, Optional[float]]:
+    """
+    Consumes an OpenAI-style SSE stream without printing: tokens go to `on_token` (or the
+    collector's callback) and the trailing usage chunk, if any, is kept on the collector.
+    """
+    if collector is None:
+        collector = StreamCollector(on_token, first_token_time)
     try:
-        for line in response.iter_lines(): # Iterates over lines in the response
-            if line:
-                decoded_line = line.decode('utf-8')
-                if decoded_line.startswith(start_marker):
-                    if stop_marker in decoded_line: # Check for stop signal
-                        break
-                    json_str = decoded_line[len(start_marker):].strip()
-                    if not json_str: continue # Skip empty data lines
-
-                    try:
-                        chunk_data = json.loads(json_str)
-                        delta = chunk_data.get("choices", [{}])[0].get("delta", {})
-                        token = delta.get("content", "")
-
-                        if token:
-                            if first_token_time is None:
-                                first_token_time = time.time()
-                            output_text += token
-                            # Streaming print logic (token by token, line by line)
-                            # This part needs to be careful about how it prints to avoid breaking terminal flow
-                            # The original printing logic from your file is complex;
-                            # a simpler approach for direct printing here:
-                            print(token, end='', flush=True) # Print token immediately
-                            # If you want line-based formatting during streaming, that adds more complexity.
-                            # The previous buffer logic was an attempt at this.
-                            # For simplicity and robustness, direct token printing is often safer.
-
-                    except json.JSONDecodeError:
-                        logging.warning(f"Failed to decode JSON from SSE line: {decoded_line}")
-                    except Exception as e: # Catch other errors during chunk processing
-                        logging.exception(f"Error processing SSE chunk: {decoded_line}")
-
-        # After the loop, if any content was streamed, ensure a newline for the next prompt
-        if output_text:
-            print("", flush=True) # Moves to the next line
-
+        for line in response.iter_lines():
+            if not line.startswith(b"data: "):
+                continue
+            payload = line[6:].strip()
+            if payload == b"[DONE]":
+                break
+            if not payload:
+                continue
+            try:
+                chunk_data = json.loads(payload)
+            except json.JSONDecodeError:
+                logging.warning(f"Failed to decode JSON from SSE line: {line[:200]!r}")
+                continue
+            choices = chunk_data.get("choices")
+            if choices:
+                token = (choices[0].get("delta") or {}).get("content")
+                if token:
+                    collector.add(token)
+            usage = chunk_data.get("usage")
+            if usage:
+                collector.merge_usage(usage)
+    except LLMCancelled:
+        raise  # Aborted on purpose (cancelled or a lost hedge race): not a stream error
     except requests.exceptions.RequestException as req_e:
         logging.exception("Error reading streaming response.")
-        # print(f"\n{TF.RED}Errore durante lo streaming della risposta: {req_e}{TF.RESET}") # User-facing if needed
-        output_text += f"\n[Errore streaming request: {req_e}]" # Append to internal text
+        collector.chunks.append(f"\n[Errore streaming request: {req_e}]")
     except Exception as stream_e:
         logging.exception("Error during streaming output processing.")
-        # print(f"\n{TF.RED}Errore durante lo streaming: {stream_e}{TF.RESET}")
-        output_text += f"\n[Errore streaming processing: {stream_e}]"
+        collector.chunks.append(f"\n[Errore streaming processing: {stream_e}]")
 
-    return output_text, first_token_time
+    return collector.text, collector.first_token_time
 # --- End process_direct_streaming_output ---
 
 
@@ -233,7 +279,9 @@ def _try_anthropic_api(messages: List[Dict[str, str]],
                        formatting_function: Optional[callable],
                        stream: bool,
                        width: Optional[int],
-                       collect_stats: bool) -> Tuple[str, Optional[Dict[str, Any]]]:
+                       collect_stats: bool,
+                       cancel_token: Optional[CancellationToken] = None,
+                       request_options: Optional[Dict[str, Any]] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
     """
     Try to use Anthropic API directly for claude-haiku-4.5.
     Returns (text, stats) tuple. If fails, stats will contain error.
@@ -246,7 +294,7 @@ def _try_anthropic_api(messages: List[Dict[str, str]],
         logging.warning("ANTHROPIC_API_KEY not set, skipping Anthropic API")
         return "", {"error": "ANTHROPIC_API_KEY not set"}
 
-    api_base = "https://api.anthropic.com/v1"
+    api_base = os.environ.get("ANTHROPIC_API_BASE", "https://api.anthropic.com/v1").rstrip("/")
     headers = {
         "x-api-key": api_key,
         "anthropic-version": "2023-06-01",
@@ -269,12 +317,19 @@ def _try_anthropic_api(messages: List[Dict[str, str]],
         else:
             user_messages.append(msg)
 
+    request_options = request_options or {}
     payload = {
         "model": anthropic_model,
-        "max_tokens": 2048,  # Increased from 512 to allow notecard generation
+        "max_tokens": request_options.get("max_tokens") or 2048,  # 2048 allows notecard generation
         "messages": user_messages,
         "stream": stream,
     }
+    schema = request_options.get("response_schema")
+    if schema and not stream:
+        # Structured output through a forced tool call: the tool input is the JSON object
+        payload["tools"] = [{"name": schema["name"], "description": schema.get("description", schema["name"]),
+                             "input_schema": schema["schema"]}]
+        payload["tool_choice"] = {"type": "tool", "name": schema["name"]}
 
     # Add system message if present
     if system_message:
@@ -285,81 +340,95 @@ def _try_anthropic_api(messages: List[Dict[str, str]],
     output_text = ""
 
     try:
-        session = get_request_session()
-        response = session.post(
-            f"{api_base}/messages",
-            headers=headers,
-            json=payload,
-            stream=stream,
-            timeout=60
-        )
+        response = _post_llm_request("anthropic", f"{api_base}/messages", headers, payload, stream, timeout=60,
+                                     cancel_token=cancel_token)
 
         if response.status_code != 200:
             logging.error(f"Anthropic API failed with status {response.status_code}: {response.text}")
-            return "", {"error": f"Anthropic API error {response.status_code}"}
+            return "", {"error": f"Anthropic API error {response.status_code}", "http_status": response.status_code}
 
         if stream:
             # Handle streaming from Anthropic
-            output_text, first_token_time = _process_anthropic_stream(response, formatting_function, width, first_token_time)
+            collector = StreamCollector(output_channel.current_token_listener(), first_token_time)
+            output_text, first_token_time = _process_anthropic_stream(
+                response, formatting_function, width, first_token_time, collector=collector)
+            usage = collector.usage
         else:
             # Handle non-streaming
             response_data = response.json()
             content = response_data.get("content", [])
-            if content and isinstance(content[0], dict):
+            tool_use = next((block for block in content
+                             if isinstance(block, dict) and block.get("type") == "tool_use"), None)
+            if tool_use is not None:
+                output_text = json.dumps(tool_use.get("input", {}), ensure_ascii=False)
+            elif content and isinstance(content[0], dict):
                 output_text = content[0].get("text", "")
+            usage = response_data.get("usage")
+
+        if cancel_token is not None and cancel_token.cancelled:
+            return _cancelled_result(anthropic_model, messages, output_text, start_time)
 
         if collect_stats:
             stats = {
                 "model": anthropic_model,
                 "total_time": time.time() - start_time,
                 "time_to_first_token": first_token_time - start_time if first_token_time else None,
-                "input_tokens": 0,  # Would need to parse from response
-                "output_tokens": 0,
-                "total_tokens": 0,
             }
+            stats.update(_anthropic_usage_stats(usage))
             return output_text, stats
 
         return output_text, None
 
+    except LLMCancelled:
+        return _cancelled_result(anthropic_model, messages, output_text, start_time)
     except Exception as e:
         logging.exception(f"Anthropic API call failed: {e}")
         return "", {"error": f"Anthropic API error: {str(e)}"}
 
 
-def _process_anthropic_stream(response, formatting_function, width, first_token_time):
-    """Process Anthropic API streaming response"""
-    output_text = ""
+def _process_anthropic_stream(response, formatting_function, width, first_token_time,
+                              on_token: Optional[Callable[[str], None]] = None,
+                              collector: Optional[StreamCollector] = None):
+    """Process Anthropic API streaming response (no printing; usage from message_start/message_delta)"""
+    if collector is None:
+        collector = StreamCollector(on_token, first_token_time)
     try:
         for line in response.iter_lines():
-            if line:
-                decoded = line.decode('utf-8').strip()
-                if not decoded.startswith("data:"):
-                    continue
-
-                json_str = decoded[5:].strip()
-                if not json_str:
-                    continue
-
-                try:
-                    chunk = json.loads(json_str)
-                    if chunk.get("type") == "content_block_delta":
-                        delta = chunk.get("delta", {})
-                        if delta.get("type") == "text_delta":
-                            token = delta.get("text", "")
-                            if token:
-                                if first_token_time is None:
-                                    first_token_time = time.time()
-                                output_text += token
-                                print(token, end='', flush=True)
-                except json.JSONDecodeError:
-                    pass
-
-        if output_text:
-            print("", flush=True)
+            if not line.startswith(b"data:"):
+                continue
+            payload = line[5:].strip()
+            if not payload:
+                continue
+            try:
+                chunk = json.loads(payload)
+            except json.JSONDecodeError:
+                continue
+            chunk_type = chunk.get("type")
+            if chunk_type == "content_block_delta":
+                delta = chunk.get("delta", {})
+                if delta.get("type") == "text_delta" and delta.get("text"):
+                    collector.add(delta["text"])
+            elif chunk_type == "message_start":
+                collector.merge_usage(chunk.get("message", {}).get("usage") or {})
+            elif chunk_type == "message_delta" and chunk.get("usage"):
+                collector.merge_usage(chunk["usage"])
+    except LLMCancelled:
+        raise
     except Exception as e:
         logging.exception(f"Error processing Anthropic stream: {e}")
 
-    return output_text, first_token_time
+    return collector.text, collector.first_token_time
+
+
+def _anthropic_usage_stats(usage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Maps Anthropic usage (input split into uncached / cache read / cache write) onto our stats keys"""
+    usage = usage or {}
+    cached = int(usage.get("cache_read_input_tokens") or 0)
+    input_tokens = int(usage.get("input_tokens") or 0) + cached + int(usage.get("cache_creation_input_tokens") or 0)
+    output_tokens = int(usage.get("output_tokens") or 0)
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "cached_tokens": cached, "cache_hit": cached > 0}
 
 
 def llm_wrapper(messages: List[Dict[str, str]],
@@ -367,36 +436,40 @@ def llm_wrapper(messages: List[Dict[str, str]],
                 formatting_function: Optional[callable] = None,
                 stream: bool = True,
                 width: Optional[int] = None,
-                collect_stats: bool = False) -> Tuple[str, Optional[Dict[str, Any]]]:
-    if not messages:
-        logging.error("llm_wrapper: Called with empty messages list.")
-        return "[Errore: Nessun messaggio]", {"error": "No messages provided"}
+                collect_stats: bool = False,
+                usage_type: Optional[str] = None,
+                cache: bool = False,
+                on_token: Optional[Callable[[str], None]] = None,
+                cancel_token: Optional[CancellationToken] = None,
+                response_schema: Optional[Dict[str, Any]] = None,
+                max_tokens: Optional[int] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Calls the LLM, walking the fallback chain for `usage_type` (see llm_resilience).
+    Targets with an open circuit breaker are skipped; retryable failures (timeouts, 429, 5xx)
+    are retried with jittered backoff before moving to the next target. Stats are returned
+    when collect_stats is set, and always when the call failed.
 
-    # DUAL-PROVIDER SUPPORT: Try Anthropic API first for Haiku 4.5, fallback to OpenRouter
-    if model_name and model_name == "claude-haiku-4.5":
-        result = _try_anthropic_api(messages, model_name, formatting_function, stream, width, collect_stats)
-        if result[1] is None or "error" not in result[1]:  # Success or no error
-            return result
-        # If Anthropic API fails, log and fall through to OpenRouter fallback
-        logging.warning(f"Anthropic API failed for {model_name}, falling back to OpenRouter with claude-3.5-haiku")
-        model_name = "anthropic/claude-3.5-haiku"  # Fallback
+    cache=True opts a non-streaming call into the content-addressed response cache
+    (llm_response_cache); only use it where the answer is a function of the prompt.
 
-    # DEFAULT: Use OpenRouter
-    api_key = os.environ.get("OPENROUTER_API_KEY")
-    api_base = "https://openrouter.ai/api/v1"
-    site_url = os.environ.get("OPENROUTER_APP_URL", "http://localhost")
-    app_title = os.environ.get("OPENROUTER_APP_TITLE", "MyNexusClient") # Or your app's name
+    Streamed tokens go to `on_token`, else to the token listener bound in the current
+    context (output_channel), else they are echoed to stdout for the terminal client.
 
-    if not api_key:
-        logging.error("OPENROUTER_API_KEY environment variable not set.")
-        return "[Errore: Chiave API OpenRouter mancante]", {"error": "OPENROUTER_API_KEY not set"}
+    Cancelling `cancel_token` aborts the in-flight request; the call then returns ""
+    with stats carrying cancelled=True and an estimate of the wasted tokens.
+
+    response_schema ({"name": ..., "schema": <JSON schema>}) asks the provider for
+    structured output: OpenRouter's json_schema response_format, a forced tool call on
+    the Anthropic API (non-streaming only). The reply text is then the JSON object.
+    max_tokens overrides the default output budget (ignored for reasoning models).
+    """
+    if not messages:
+        logging.error("llm_wrapper: Called with empty messages list.")
+        return "[Errore: Nessun messaggio]", {"error": "No messages provided"}
 
     if model_name is None:
         model_name = os.environ.get("OPENROUTER_DEFAULT_MODEL", "google/gemini-2.0-flash-exp:free") # Default model
 
-    if formatting_function is None: formatting_function = TerminalFormatter.format_terminal_text
-    if width is None: width = TerminalFormatter.get_terminal_width()
-
     # --- MODIFIED Check for Last Message Role ---
     # This check allows system-only prompts if they are for specific utility tasks.
     is_utility_call_with_system_prompt_only = False
@@ -433,26 +506,246 @@ def llm_wrapper(messages: List[Dict[str, str]],
         return output_text, stats
     # --- End MODIFIED Check ---
 
+    request_options = {key: value for key, value in
+                       (("response_schema", response_schema), ("max_tokens", max_tokens)) if value is not None}
+
+    cache_key = None
+    if cache and not stream and llm_response_cache.cache_enabled():
+        cache_key = llm_response_cache.make_cache_key(
+            model_name, messages, dict(_sampling_params(model_name, max_tokens), **request_options))
+        cached_text = llm_response_cache.get_response_cache().get(cache_key)
+        get_global_stats_tracker().record_cache_lookup(hit=cached_text is not None)
+        if cached_text is not None:
+            stats = {"model": model_name, "total_time": 0.0, "time_to_first_token": None,
+                     "input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "cached": True}
+            return cached_text, stats if collect_stats else None
+
+    on_token = on_token or output_channel.current_token_listener()
+    echo = stream and on_token is None
+    with output_channel.token_listener(_echo_token if echo else on_token):
+        output_text, stats = _call_chain(messages, model_name, formatting_function, stream, width,
+                                         usage_type, cache_key, cancel_token, request_options)
+    if echo and (stats or {}).get("time_to_first_token") is not None:
+        print("", flush=True)  # Moves the terminal to the next line after the streamed reply
+    return output_text, stats if collect_stats or (stats or {}).get("error") else None
+
+
+def _echo_token(text: str) -> None:
+    print(text, end='', flush=True)
+
+
+def _call_chain(messages: List[Dict[str, str]], model_name: str, formatting_function: Optional[callable],
+                stream: bool, width: Optional[int], usage_type: Optional[str],
+                cache_key: Optional[str], cancel_token: Optional[CancellationToken] = None,
+                request_options: Optional[Dict[str, Any]] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Walks the fallback chain for one llm_wrapper call; always returns stats."""
+    max_retries = int(os.environ.get("NEXUS_LLM_RETRIES", "1"))
+    chain = llm_resilience.build_fallback_chain(model_name, usage_type)
+    output_text, stats = "", None
+    retry_afters = []  # one per target skipped for lack of rate-limit capacity
+
+    hedge_delay = None
+    if llm_hedging.hedging_enabled(usage_type):
+        hedge_delay = get_global_stats_tracker().latency_percentile(
+            usage_type, float(os.environ.get("NEXUS_HEDGE_PERCENTILE", "95")),
+            min_samples=int(os.environ.get("NEXUS_HEDGE_MIN_SAMPLES", "20")))
+
+    for index, target in enumerate(chain):
+        provider, target_model = target
+        breaker = llm_resilience.get_breaker(target)
+        for attempt in range(max_retries + 1):
+            if cancel_token is not None and cancel_token.cancelled:
+                return "", {"model": target_model, "error": "Cancelled", "cancelled": True, "wasted_tokens": 0}
+            if not breaker.allow():
+                logging.warning(f"[BREAKER] Skipping {provider}:{target_model}, circuit open")
+                stats = {"model": target_model, "error": f"Circuit open for {provider}:{target_model}"}
+                break
+            try:
+                reservation = get_rate_limiter().acquire(target, messages, usage_type)
+            except RateLimitExceeded as e:
+                breaker.release()  # No call was made: a claimed half-open probe goes back
+                logging.warning(f"[RATE-LIMIT] Skipping {provider}:{target_model}: {e}")
+                stats = {"model": target_model, "error": str(e), "rate_limited": True, "retry_after": e.retry_after}
+                retry_afters.append(e.retry_after)
+                break
+
+            if index == 0 and attempt == 0 and hedge_delay is not None:
+                (output_text, stats), served_by = _hedged_call_target(
+                    target, reservation, messages, formatting_function, stream, width, hedge_delay, usage_type,
+                    cancel_token, request_options)
+            else:
+                output_text, stats = _reserved_call(target, reservation, messages, formatting_function, stream,
+                                                    width, cancel_token, request_options)
+                served_by = target
+            if (stats or {}).get("http_status") == 429:
+                get_rate_limiter().for_target(target).note_rate_limited()
+            if (stats or {}).get("cancelled"):
+                breaker.release()  # Cancelled by us, not a provider failure: the probe goes back
+                logging.info(f"[CANCEL] {provider}:{target_model} call cancelled ({cancel_token.reason}), "
+                             f"~{stats['wasted_tokens']} tokens wasted")
+                get_global_stats_tracker().record_cancellation(usage_type, stats["wasted_tokens"])
+                return "", stats
+            if served_by != target:
+                # The hedge won on a different model: its breaker gets the outcome, ours gets its probe back
+                breaker.release()
+                llm_resilience.get_breaker(served_by).record(not (stats or {}).get("error"), (stats or {}).get("total_time") or 0.0)
+                if not stats.get("error"):
+                    return output_text, stats
+
+            error = stats.get("error") if stats else None
+            if not error:
+                breaker.record(True, stats.get("total_time", 0.0))
+                if cache_key is not None and index == 0:
+                    # The key names the requested model: a fallback model's reply is not cached under it
+                    llm_response_cache.get_response_cache().put(cache_key, output_text)
+                if index > 0:
+                    stats["fallback_from"] = model_name
+                    get_global_stats_tracker().record_fallback()
+                return output_text, stats
+            if "API_KEY not set" in error:
+                breaker.record(True, 0.0)  # Configuration problem, not a provider failure
+                break
+
+            retryable = llm_resilience.is_retryable(stats.get("http_status"))
+            breaker.record(not retryable, stats.get("total_time") or 0.0)
+            if stats.get("time_to_first_token") is not None:
+                # Tokens already reached the player; retrying would repeat them
+                return output_text, stats
+            if not retryable or attempt == max_retries:
+                break
+            delay = llm_resilience.backoff_delay(attempt)
+            logging.warning(f"[RETRY] {provider}:{target_model} failed ({error}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+        if index + 1 < len(chain):
+            next_provider, next_model = chain[index + 1]
+            logging.warning(f"[FALLBACK] {provider}:{target_model} unavailable, falling back to {next_provider}:{next_model}")
+
+    if retry_afters and len(retry_afters) == len(chain):
+        # No target had capacity: an empty reply the caller treats as "retry later", not NPC text
+        return "", dict(stats, retry_after=min(retry_afters))
+    if not output_text:
+        output_text = "[Errore: Nessun modello disponibile]"
+    return output_text, stats
+
+
+def _sampling_params(model_name: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """Sampling parameters sent to OpenRouter for `model_name` (also part of the response cache key)."""
+    params = {"max_tokens": 2048, "temperature": 0.7, "top_p": 0.9}  # 2048 allows notecard generation
+    if model_name and model_name.startswith("openai/gpt-5"):
+        # GPT-5 is a reasoning model - the token budget covers reasoning + content
+        params["reasoning_effort"] = "low"  # Enable reasoning: low/medium/high
+    elif max_tokens:
+        params["max_tokens"] = max_tokens
+    return params
+
+
+def _call_target(target: Tuple[str, str], messages: List[Dict[str, str]],
+                 formatting_function: Optional[callable], stream: bool,
+                 width: Optional[int], cancel_token: Optional[CancellationToken] = None,
+                 request_options: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, Any]]:
+    provider, target_model = target
+    extra = {"cancel_token": cancel_token} if cancel_token is not None else {}
+    if request_options:
+        extra["request_options"] = request_options
+    if provider == llm_resilience.PROVIDER_ANTHROPIC:
+        return _try_anthropic_api(messages, target_model, formatting_function, stream, width, True, **extra)
+    return _call_openrouter(messages, target_model, formatting_function, stream, width, **extra)
+
+
+def _reserved_call(target: Tuple[str, str], reservation: Reservation, messages: List[Dict[str, str]],
+                   formatting_function: Optional[callable], stream: bool, width: Optional[int],
+                   cancel_token: Optional[CancellationToken] = None,
+                   request_options: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, Any]]:
+    """_call_target settling `reservation` with the call's own stats, also when it loses a hedge race."""
+    output_text, stats = _call_target(target, messages, formatting_function, stream, width, cancel_token,
+                                      request_options)
+    reservation.reconcile(stats)
+    return output_text, stats
+
+
+def _cancelled_result(model_name: str, messages: List[Dict[str, Any]], partial_text: str,
+                      start_time: float) -> Tuple[str, Dict[str, Any]]:
+    """Result of a call aborted through its CancellationToken; the prompt and any streamed text count as wasted."""
+    wasted = sum(estimate_message_tokens(m) for m in messages) + estimate_tokens(partial_text or "")
+    return "", {"model": model_name, "error": "Cancelled", "cancelled": True, "wasted_tokens": wasted,
+                "total_time": time.time() - start_time, "time_to_first_token": None}
+
+
+def _hedged_call_target(target: Tuple[str, str], reservation: Reservation, messages: List[Dict[str, str]],
+                        formatting_function: Optional[callable], stream: bool, width: Optional[int],
+                        delay: float, usage_type: Optional[str] = None,
+                        cancel_token: Optional[CancellationToken] = None,
+                        request_options: Optional[Dict[str, Any]] = None
+                        ) -> Tuple[Tuple[str, Dict[str, Any]], Tuple[str, str]]:
+    """
+    Calls `target` (charged to `reservation`), hedging with NEXUS_HEDGE_MODEL (default: same model)
+    after `delay`. The hedge takes its own rate-limit reservation; each leg settles its own, so the
+    loser is charged for what it used. Returns (result, served_by).
+    """
+    hedge_target = llm_resilience.target_for_model(os.environ.get("NEXUS_HEDGE_MODEL") or target[1])
+    if hedge_target != target and llm_resilience.get_breaker(hedge_target).state == llm_resilience.STATE_OPEN:
+        return _reserved_call(target, reservation, messages, formatting_function, stream, width, cancel_token,
+                              request_options), target
+
+    def hedge_leg(leg_token: CancellationToken) -> Tuple[str, Dict[str, Any]]:
+        try:
+            hedge_reservation = get_rate_limiter().acquire(hedge_target, messages, usage_type)
+        except RateLimitExceeded as e:
+            logging.warning(f"[RATE-LIMIT] Not hedging on {hedge_target[0]}:{hedge_target[1]}: {e}")
+            return "", {"model": hedge_target[1], "error": str(e), "rate_limited": True, "retry_after": e.retry_after}
+        return _reserved_call(hedge_target, hedge_reservation, messages, formatting_function, stream, width,
+                              leg_token, request_options)
+
+    (output_text, stats), summary = llm_hedging.hedged_call(
+        lambda leg_token: _reserved_call(target, reservation, messages, formatting_function, stream, width,
+                                         leg_token, request_options),
+        hedge_leg, delay, stream, llm_hedging.get_hedge_budget(), cancel_token)
+    hedge_won = summary['winner'] == llm_hedging.HEDGE
+    if summary['hedged']:
+        get_global_stats_tracker().record_hedge(won=hedge_won)
+        stats = dict(stats or {}, hedged=True, hedge_winner=summary['winner'])
+    return (output_text, stats), (hedge_target if hedge_won else target)
+
+
+def _call_openrouter(messages: List[Dict[str, str]],
+                     model_name: str,
+                     formatting_function: Optional[callable],
+                     stream: bool,
+                     width: Optional[int],
+                     cancel_token: Optional[CancellationToken] = None,
+                     request_options: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, Any]]:
+    """Single OpenRouter call. Always returns stats; failures carry 'error' and, for HTTP errors, 'http_status'."""
+    collect_stats = True
+    api_key = os.environ.get("OPENROUTER_API_KEY")
+    api_base = os.environ.get("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1").rstrip("/")
+    site_url = os.environ.get("OPENROUTER_APP_URL", "http://localhost")
+    app_title = os.environ.get("OPENROUTER_APP_TITLE", "MyNexusClient") # Or your app's name
+
+    if not api_key:
+        logging.error("OPENROUTER_API_KEY environment variable not set.")
+        return "[Errore: Chiave API OpenRouter mancante]", {"error": "OPENROUTER_API_KEY not set"}
+
+    if formatting_function is None: formatting_function = TerminalFormatter.format_terminal_text
+    if width is None: width = TerminalFormatter.get_terminal_width()
+
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
         "HTTP-Referer": site_url,
         "X-Title": app_title,
     }
-    # Special handling for GPT-5 models
-    if model_name and model_name.startswith("openai/gpt-5"):
-        # GPT-5 is a reasoning model - increase max_tokens to allow for reasoning + content
-        payload = { "model": model_name, "messages": messages, "stream": stream }
-        payload["max_tokens"] = 2048  # Higher limit for reasoning models
-        payload["temperature"] = 0.7
-        payload["top_p"] = 0.9
-        payload["reasoning_effort"] = "low"  # Enable reasoning: low/medium/high
+    payload = { "model": model_name, "messages": messages, "stream": stream }
+    request_options = request_options or {}
+    payload.update(_sampling_params(model_name, request_options.get("max_tokens")))
+    if request_options.get("response_schema"):
+        schema = request_options["response_schema"]
+        payload["response_format"] = {"type": "json_schema",
+                                      "json_schema": {"name": schema["name"], "strict": True, "schema": schema["schema"]}}
+    if stream:
+        payload["usage"] = {"include": True}  # OpenRouter appends a final chunk with real token usage
+    if "reasoning_effort" in payload:
         logging.info(f"GPT-5 reasoning enabled with effort=low")
-    else:
-        payload = { "model": model_name, "messages": messages, "stream": stream }
-        payload["max_tokens"] = 2048  # Increased from 512 to allow notecard generation
-        payload["temperature"] = 0.7
-        payload["top_p"] = 0.9
 
     start_time = time.time()
     first_token_time = None
@@ -470,14 +763,8 @@ def llm_wrapper(messages: List[Dict[str, str]],
         else:
             timeout = 60   # Even shorter for non-streaming requests
         
-        session = get_request_session()
-        response = session.post(
-            f"{api_base}/chat/completions",
-            headers=headers,
-            json=payload,
-            stream=stream,
-            timeout=timeout
-        )
+        response = _post_llm_request("openrouter", f"{api_base}/chat/completions", headers, payload, stream, timeout,
+                                     cancel_token)
 
         if stream:
             if response.status_code != 200:
@@ -488,13 +775,13 @@ def llm_wrapper(messages: List[Dict[str, str]],
                 logging.error(f"Streaming API call failed with status {response.status_code}. Response text: {error_content}")
                 response.raise_for_status() # This will then raise an HTTPError
 
-            # process_direct_streaming_output handles its own printing of tokens
+            # Tokens go to the listener bound by llm_wrapper; the final usage chunk lands on the collector
+            collector = StreamCollector(output_channel.current_token_listener(), first_token_time)
             output_text, first_token_time = process_direct_streaming_output(
-                response, formatting_function, width, first_token_time
+                response, formatting_function, width, first_token_time, collector=collector
             )
-            # For streaming, OpenRouter doesn't typically send usage stats in chunks.
-            # If the API sends a final JSON with usage in the stream, process_direct_streaming_output would need to capture it.
-            # Assuming no separate stats payload in stream for now.
+            if collector.usage:
+                response_data_for_stats = {"usage": collector.usage}
         else: # Non-streaming
             if response.status_code != 200:
                 logging.error(f"Non-streaming API call failed with status {response.status_code}. Response: {response.text}")
@@ -507,12 +794,17 @@ def llm_wrapper(messages: List[Dict[str, str]],
                 response_data_for_stats, formatting_function, width
             )
 
+        if cancel_token is not None and cancel_token.cancelled:
+            return _cancelled_result(model_name, messages, output_text, start_time)
+
         # Collect stats after successful call (or attempt)
         if collect_stats:
             stats = collect_direct_api_statistics(
                 model_name, messages, output_text, start_time, first_token_time, response_data_for_stats
             )
 
+    except LLMCancelled:
+        return _cancelled_result(model_name, messages, output_text, start_time)
     except requests.exceptions.Timeout:
         logging.exception(f"API call to {model_name} timed out.")
         output_text = "[Errore: Timeout API]"
@@ -534,6 +826,7 @@ def llm_wrapper(messages: List[Dict[str, str]],
         if collect_stats:
             stats = collect_direct_api_statistics(model_name, messages, output_text, start_time, None, response_data_for_stats)
             if not stats.get("error"): stats["error"] = str(e) # Ensure error is captured
+            if response_from_error is not None: stats["http_status"] = response_from_error.status_code
     except Exception as e:
         logging.exception(f"An unexpected error occurred during API interaction with {model_name}: {e}")
         # print(f"\n{TF.RED}❌ Errore inatteso ({model_name}): {type(e).__name__} - {e}{TF.RESET}")
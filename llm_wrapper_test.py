@@ -9,6 +9,7 @@ from llm_wrapper import (
     process_direct_non_streaming_output,
     collect_direct_api_statistics,
     llm_wrapper,
+    StreamCollector,
     TerminalFormatter
 )
 
@@ -58,7 +59,7 @@ def mock_non_streaming_response():
 
 def test_process_direct_streaming_output(mock_streaming_response):
     """Test processing of streaming API output"""
-    # Mock the print function instead of verifying formatter calls
+    tokens = []
     with patch('builtins.print') as mock_print:
         # Test processing streaming output
         output_text, first_token_time = process_direct_streaming_output(
@@ -66,7 +67,8 @@ def test_process_direct_streaming_output(mock_streaming_response):
             # Use simple identity formatter that doesn't require mocking
             lambda x, width: x,
             80,
-            None  # first_token_time starts as None
+            None,  # first_token_time starts as None
+            on_token=tokens.append
         )
 
         # Verify the output text includes all content
@@ -75,8 +77,29 @@ def test_process_direct_streaming_output(mock_streaming_response):
         # Verify first_token_time gets set (not None anymore)
         assert first_token_time is not None
 
-        # Verify print was called - each content chunk is printed
-        assert mock_print.call_count >= 3
+        # Each content chunk goes to the token callback; the parser itself never prints
+        assert tokens == ["Hello", " world", "!"]
+        mock_print.assert_not_called()
+
+def test_process_direct_streaming_output_captures_usage_chunk(mock_response):
+    """The final usage chunk is kept so stats report real token counts"""
+    mock_response.iter_lines.return_value = [
+        b'data: {"choices":[{"delta":{"content":"Ciao"}}]}',
+        b'',
+        b': OPENROUTER PROCESSING',
+        b'data: {not json',
+        b'data: {"choices":[],"usage":{"prompt_tokens":120,"completion_tokens":7,"total_tokens":127,'
+        b'"prompt_tokens_details":{"cached_tokens":100}}}',
+        b'data: [DONE]'
+    ]
+    collector = StreamCollector()
+    output_text, _ = process_direct_streaming_output(mock_response, lambda x, width: x, 80, None,
+                                                     collector=collector)
+    assert output_text == "Ciao"
+
+    stats = collect_direct_api_statistics("test/model", [{"role": "user", "content": "hi"}], output_text,
+                                          time.time(), None, {"usage": collector.usage})
+    assert (stats["input_tokens"], stats["output_tokens"], stats["cached_tokens"]) == (120, 7, 100)
 
 def test_process_direct_non_streaming_output(mock_non_streaming_response):
     """Test processing of non-streaming API output"""
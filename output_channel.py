@@ -0,0 +1,152 @@
+# output_channel.py
+# Per-request output sink for the API server.
+#
+# Handlers and command_processor historically report to the player via print().
+# Instead of swapping the process-wide sys.stdout for every request (which mixes
+# output between concurrent players), sys.stdout is wrapped once by a router that
+# forwards writes to the sink bound to the current context, or to the real
+# stdout when no request is active.
+
+import contextvars
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional
+
+_current_sink: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar(
+    'nexus_output_sink', default=None
+)
+_current_token_listener: contextvars.ContextVar[Optional[Callable[[str], None]]] = contextvars.ContextVar(
+    'nexus_token_listener', default=None
+)
+_install_lock = threading.Lock()
+
+
+class _RoutingStdout:
+    """sys.stdout replacement that routes writes to the active request sink."""
+
+    def __init__(self, fallback):
+        self._fallback = fallback
+
+    def write(self, s):
+        sink = _current_sink.get()
+        if sink is not None:
+            sink.append(s)
+            return len(s)
+        return self._fallback.write(s)
+
+    def flush(self):
+        if _current_sink.get() is None:
+            self._fallback.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._fallback, name)
+
+
+def install() -> None:
+    """Wraps sys.stdout with the routing proxy (idempotent)."""
+    with _install_lock:
+        if not isinstance(sys.stdout, _RoutingStdout):
+            sys.stdout = _RoutingStdout(sys.stdout)
+
+
+def bind_sink(buffer: List[str]) -> contextvars.Token:
+    """Binds `buffer` as the output sink for the current context; pair with release_sink."""
+    install()
+    return _current_sink.set(buffer)
+
+
+def release_sink(token: contextvars.Token) -> None:
+    _current_sink.reset(token)
+
+
+@contextmanager
+def capture_output(buffer: List[str]):
+    """Context-manager form of bind_sink/release_sink."""
+    token = bind_sink(buffer)
+    try:
+        yield buffer
+    finally:
+        release_sink(token)
+
+
+def emit(text: Any = "") -> None:
+    """Writes a line to the current request sink, or prints it when none is bound."""
+    sink = _current_sink.get()
+    if sink is not None:
+        sink.append(str(text))
+    else:
+        print(text)
+
+
+@contextmanager
+def token_listener(callback: Optional[Callable[[str], None]]):
+    """Routes streamed LLM tokens produced in this context to `callback` instead of stdout."""
+    token = _current_token_listener.set(callback)
+    try:
+        yield callback
+    finally:
+        _current_token_listener.reset(token)
+
+
+def current_token_listener() -> Optional[Callable[[str], None]]:
+    return _current_token_listener.get()
+
+
+def publish_token(text: str) -> bool:
+    """Hands a streamed token to the bound listener. Returns False when nobody is listening."""
+    listener = _current_token_listener.get()
+    if listener is None:
+        return False
+    listener(text)
+    return True
+
+
+class GatedTokenRelay:
+    """
+    Token listener for speculative generation: tokens are held back until open()
+    (then flushed in order and relayed live), or dropped for good after discard().
+    """
+
+    def __init__(self, downstream: Callable[[str], None]):
+        self._downstream = downstream
+        self._lock = threading.Lock()
+        self._held: List[str] = []
+        self._state = 'held'
+
+    def __call__(self, text: str) -> None:
+        with self._lock:
+            if self._state == 'held':
+                self._held.append(text)
+            elif self._state == 'open':
+                self._downstream(text)
+
+    @property
+    def is_open(self) -> bool:
+        return self._state == 'open'
+
+    def open(self) -> None:
+        with self._lock:
+            if self._state != 'held':
+                return
+            self._state = 'open'
+            for text in self._held:
+                self._downstream(text)
+            self._held = []
+
+    def discard(self) -> None:
+        with self._lock:
+            if self._state == 'held':
+                self._state = 'discarded'
+                self._held = []
+
+
+def bind_current_context(func: Callable) -> Callable:
+    """
+    Returns a callable running `func` in a copy of the caller's context, so worker
+    threads spawned during a request keep writing to that request's sink.
+    """
+    ctx = contextvars.copy_context()
+    def _run(*args, **kwargs):
+        return ctx.run(func, *args, **kwargs)
+    return _run
@@ -0,0 +1,67 @@
+import threading
+
+import output_channel
+from output_channel import bind_current_context, capture_output, emit
+
+
+def test_concurrent_requests_capture_only_their_own_output():
+    buffers = {}
+    barrier = threading.Barrier(4)
+
+    def request(name):
+        buf = []
+        with capture_output(buf):
+            barrier.wait()
+            for i in range(20):
+                print(f"{name}-{i}")
+                emit(f"{name}-emit-{i}")
+        buffers[name] = buf
+
+    threads = [threading.Thread(target=request, args=(f"p{n}",)) for n in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    for name, buf in buffers.items():
+        lines = [chunk.strip() for chunk in buf if chunk.strip()]
+        assert len(lines) == 40
+        assert all(line.startswith(f"{name}-") for line in lines)
+
+
+def test_worker_threads_inherit_request_sink():
+    buf = []
+    with capture_output(buf):
+        worker = threading.Thread(target=bind_current_context(lambda: emit("from worker")))
+        worker.start()
+        worker.join()
+    assert buf == ["from worker"]
+
+
+def test_emit_without_sink_prints(capsys):
+    emit("plain output")
+    assert "plain output" in capsys.readouterr().out
+
+
+def test_gated_relay_holds_tokens_until_opened():
+    received = []
+    relay = output_channel.GatedTokenRelay(received.append)
+    relay("Hel")
+    relay("lo")
+    assert received == []
+    relay.open()
+    relay(" world")
+    assert received == ["Hel", "lo", " world"]
+
+
+def test_discarded_relay_drops_tokens_and_publish_routes_to_listener():
+    received = []
+    relay = output_channel.GatedTokenRelay(received.append)
+    relay("speculative")
+    relay.discard()
+    relay.open()
+    relay("late")
+    assert received == []
+
+    assert output_channel.publish_token("x") is False
+    with output_channel.token_listener(received.append):
+        assert output_channel.publish_token("streamed") is True
+    assert received == ["streamed"]
@@ -13,7 +13,7 @@ try:
     from llm_stats_tracker import get_global_stats_tracker
 except ImportError:
     print("WARNING (player_profile_manager): llm_wrapper or terminal_formatter not found. Profile features WILL BE SEVERELY limited.")
-    def llm_wrapper(messages, model_name, stream, collect_stats, formatting_function=None, width=None):
+    def llm_wrapper(messages, model_name, stream, collect_stats, formatting_function=None, width=None, **kwargs):
         print("Fallback llm_wrapper: LLM calls from player_profile_manager will not work.")
         return json.dumps({"analysis_notes": "LLM not available, no profile changes suggested."}), {"error": "llm_wrapper missing"}
     class TerminalFormatter:
@@ -89,7 +89,8 @@ def get_distilled_profile_insights_for_npc(
     ]
     try:
         insights_text, stats = llm_wrapper_func(
-            messages=prompt_messages, model_name=model_name, stream=False, collect_stats=False
+            messages=prompt_messages, model_name=model_name, stream=False, collect_stats=False,
+            usage_type="profile", cache=True
         )
         if stats and stats.get("error"):
             return ""
@@ -150,7 +151,8 @@ Ensure there are no trailing commas.
             messages=messages,
             model_name=model_name,
             stream=False, # Profile analysis should be non-streamed
-            collect_stats=True
+            collect_stats=True,
+            usage_type="profile"
         )
         
         # Record stats for profile analysis
@@ -0,0 +1,32 @@
+# prompt_segments.py
+# Static/dynamic layout of NPC system prompts for provider prompt caching.
+#
+# build_system_prompt puts everything that only depends on the NPC (antefatto,
+# PREFIX file, character sheet, game rules) first, then DYNAMIC_SECTION_MARKER,
+# then the per-turn player state (credits, inventory, profile insights, previous
+# conversation). The system message is sent as two content blocks: the static one
+# carries cache_control, so a change in the player state no longer invalidates the
+# cached prefix.
+
+from typing import Any, Dict, Tuple
+
+DYNAMIC_SECTION_MARKER = "=== STATO ATTUALE DEL CERCASTORIE (aggiornato ad ogni turno) ==="
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def split_system_prompt(prompt: str) -> Tuple[str, str]:
+    """Returns (static, dynamic). Prompts without the marker are all static."""
+    index = prompt.find(DYNAMIC_SECTION_MARKER)
+    if index < 0:
+        return prompt, ""
+    return prompt[:index].rstrip(), prompt[index:].strip()
+
+
+def system_message(prompt: str) -> Dict[str, Any]:
+    """System message with the static segment as a cached block and the dynamic tail uncached."""
+    static, dynamic = split_system_prompt(prompt)
+    blocks = [{"type": "text", "text": static, "cache_control": dict(CACHE_CONTROL)}]
+    if dynamic:
+        blocks.append({"type": "text", "text": dynamic})
+    return {"role": "system", "content": blocks}
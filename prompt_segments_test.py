@@ -0,0 +1,43 @@
+from chat_manager import ChatSession
+from llm_stats_tracker import LLMStatsTracker
+from prompt_segments import DYNAMIC_SECTION_MARKER, split_system_prompt
+
+
+def _prompt(credits):
+    return f"Sei Jorin, il locandiere.\nREGOLE DEL GIOCO\n\n{DYNAMIC_SECTION_MARKER}\n💰 Crediti: {credits}"
+
+
+def test_history_sends_static_segment_as_cached_block_and_player_state_uncached():
+    session = ChatSession(model_name="test/model")
+    session.set_system_prompt(_prompt(100))
+    session.add_message("user", "Ciao")
+
+    system = session.get_history()[0]
+    static_block, dynamic_block = system["content"]
+    assert static_block == {"type": "text", "text": "Sei Jorin, il locandiere.\nREGOLE DEL GIOCO",
+                            "cache_control": {"type": "ephemeral"}}
+    assert dynamic_block == {"type": "text", "text": f"{DYNAMIC_SECTION_MARKER}\n💰 Crediti: 100"}
+
+    # A change in the player state leaves the cached block byte-identical
+    session.set_system_prompt(_prompt(50))
+    assert session.get_history()[0]["content"][0] == static_block
+
+
+def test_prompt_without_marker_stays_one_cached_block():
+    assert split_system_prompt("Sei Jorin.") == ("Sei Jorin.", "")
+    session = ChatSession(model_name="test/model")
+    session.set_system_prompt("Sei Jorin.")
+    assert len(session.get_history()[0]["content"]) == 1
+
+
+def test_cached_tokens_are_aggregated_per_npc_and_model():
+    tracker = LLMStatsTracker()
+    tracker.record_prompt_cache("Jorin", "m1", {"input_tokens": 1000, "cached_tokens": 0})
+    tracker.record_prompt_cache("Jorin", "m1", {"input_tokens": 1000, "cached_tokens": 800})
+    tracker.record_prompt_cache("Jorin", "m1", {"input_tokens": 1000, "error": "Timeout"})
+    tracker.record_prompt_cache("Mara", "m1", {"input_tokens": 500, "cached_tokens": 400})
+
+    stats = tracker.get_prompt_cache_stats()
+    assert stats["Jorin|m1"] == {"calls": 2, "cache_hits": 1, "hit_rate": 0.5, "input_tokens": 2000,
+                                 "cached_tokens": 800, "cached_token_ratio": 0.4}
+    assert stats["Mara|m1"]["cached_token_ratio"] == 0.8
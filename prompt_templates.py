@@ -0,0 +1,107 @@
+# prompt_templates.py
+# Per-NPC precompiled static section of the system prompt.
+#
+# Everything build_system_prompt puts before DYNAMIC_SECTION_MARKER (antefatto, narrative
+# framework, notecard feature, PREFIX file, roleplay lock, character sheet, greetings and
+# conditional responses, brief-mode rules, teleport and game rules) depends only on the
+# NPC, not on the player. It is compiled once into a PromptTemplate keyed by
+# (NPC code, brief_mode, regular-vs-guide) and shared by every player; each call only
+# renders the dynamic tail (inventory, credits, previous conversation, profile insights)
+# and appends it to the cached static text. The static block is byte-identical across
+# calls, which is what provider prompt caches key on (see prompt_segments).
+#
+# Each entry keeps the fingerprint of the inputs it was compiled from (NPC fields, story,
+# content files); a different fingerprint recompiles the entry. clear() is called by the
+# reload/reset admin endpoints so the teleport NPC list is rebuilt too.
+#
+# Settings:
+#   NEXUS_PROMPT_TEMPLATES            ("1")  0 builds the whole prompt on every call
+#   NEXUS_PROMPT_TEMPLATE_CACHE_SIZE  (256)  compiled templates kept (LRU)
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """Compiled static section of an NPC system prompt"""
+    static_lines: Tuple[str, ...]
+    static_text: str
+    story_context: str
+
+    def render(self, dynamic_lines: Sequence[str]) -> str:
+        """Same text as "\\n".join(static_lines + dynamic_lines), without re-joining the static part"""
+        if not dynamic_lines:
+            return self.static_text
+        return self.static_text + "\n" + "\n".join(dynamic_lines)
+
+
+def compile_template(static_lines: Sequence[str], story_context: str) -> PromptTemplate:
+    return PromptTemplate(tuple(static_lines), "\n".join(static_lines), story_context)
+
+
+class PromptTemplateCache:
+    """LRU of compiled templates, each validated against the fingerprint of its inputs"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or int(os.environ.get('NEXUS_PROMPT_TEMPLATE_CACHE_SIZE', '256'))
+        self._entries: "OrderedDict[Hashable, Tuple[Any, PromptTemplate]]" = OrderedDict()  # key -> (fingerprint, template)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.compiles = 0
+        self.recompiles = 0
+
+    def get(self, key: Hashable, fingerprint: Any, compile: Callable[[], PromptTemplate]) -> PromptTemplate:
+        if not prompt_templates_enabled():
+            return compile()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            stale = entry is not None
+
+        # Compiled outside the lock (it may query the DB); a concurrent duplicate compile is harmless
+        template = compile()
+        with self._lock:
+            self.compiles += 1
+            if stale:
+                self.recompiles += 1
+                logger.info(f"[PROMPT-TEMPLATE] Inputs of {key} changed, recompiled")
+            self._entries[key] = (fingerprint, template)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return template
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'templates': len(self._entries), 'hits': self.hits, 'compiles': self.compiles,
+                    'recompiles': self.recompiles}
+
+
+def prompt_templates_enabled() -> bool:
+    return os.environ.get('NEXUS_PROMPT_TEMPLATES', '1') != '0'
+
+
+_global_template_cache: Optional[PromptTemplateCache] = None
+_global_template_cache_lock = threading.Lock()
+
+def get_prompt_template_cache() -> PromptTemplateCache:
+    """Get or create the process-wide template cache"""
+    global _global_template_cache
+    with _global_template_cache_lock:
+        if _global_template_cache is None:
+            _global_template_cache = PromptTemplateCache()
+        return _global_template_cache
@@ -0,0 +1,60 @@
+from unittest.mock import patch
+
+import pytest
+
+import session_utils
+from prompt_segments import split_system_prompt
+from prompt_templates import PromptTemplateCache
+
+JORIN = {'code': 'jorin', 'name': 'Jorin', 'role': 'Oste', 'area': 'Tavern', 'motivation': 'Proteggere la taverna',
+         'goal': 'Ritrovare la Ciotola', 'default_greeting': 'Benvenuto alla Taverna!', 'notecard_feature': 'NOTECARD'}
+STORY = "Il Velo si indebolisce e il Cercastorie deve ritrovare i frammenti della memoria di Eldoria."
+
+
+def _state(**overrides):
+    state = {'player_id': 'p1', 'player_inventory': [], 'player_credits_cache': 0, 'brief_mode': False,
+             'wise_guide_npc_name': 'Lyra', 'db': None}
+    state.update(overrides)
+    return state
+
+
+@pytest.fixture
+def cache():
+    cache = PromptTemplateCache()
+    with patch.object(session_utils, 'get_prompt_template_cache', return_value=cache):
+        yield cache
+
+
+def test_players_share_the_static_section_and_only_the_tail_differs(cache):
+    first = session_utils.build_system_prompt(JORIN, STORY, None, _state())
+    with patch.object(session_utils, '_compile_static_prompt', side_effect=AssertionError("recompiled")):
+        second = session_utils.build_system_prompt(
+            dict(JORIN), STORY, None, _state(player_id='p2', player_inventory=['Lanterna Spenta'], player_credits_cache=50))
+
+    assert cache.stats() == {'templates': 1, 'hits': 1, 'compiles': 1, 'recompiles': 0}
+    assert split_system_prompt(first)[0] == split_system_prompt(second)[0]
+    assert "Lanterna Spenta" not in first and "Lanterna Spenta" in split_system_prompt(second)[1]
+
+
+def test_rendered_prompt_matches_an_uncached_build(cache, monkeypatch):
+    state = _state(player_inventory=['Seme della Foresta'], player_credits_cache=20, brief_mode=True,
+                   last_npc_conversation_history=[{'role': 'user', 'content': 'dove trovo la missione?'}] * 3)
+    cached = session_utils.build_system_prompt(JORIN, STORY, None, state)
+
+    monkeypatch.setenv("NEXUS_PROMPT_TEMPLATES", "0")
+    assert session_utils.build_system_prompt(JORIN, STORY, None, state) == cached
+    assert cache.compiles == 1  # disabled builds bypass the cache
+
+
+def test_brief_mode_guide_role_and_changed_npc_data_use_their_own_template(cache):
+    session_utils.build_system_prompt(JORIN, STORY, None, _state())
+    session_utils.build_system_prompt(JORIN, STORY, None, _state(brief_mode=True))
+    session_utils.build_system_prompt(JORIN, STORY, None, _state(wise_guide_npc_name='Jorin'))
+    assert cache.stats()['templates'] == 3
+
+    updated = session_utils.build_system_prompt(dict(JORIN, default_greeting='Salute, viandante!'), STORY, None, _state())
+    assert cache.recompiles == 1 and 'Salute, viandante!' in split_system_prompt(updated)[0]
+
+    cache.clear()
+    session_utils.build_system_prompt(JORIN, STORY, None, _state())
+    assert cache.stats()['templates'] == 1
@@ -0,0 +1,86 @@
+# request_coalescer.py
+# Idempotent execution of API turns: duplicates of an in-flight request wait for the
+# original, and completed results are replayed for a short time instead of recomputed.
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_EXECUTED = 'executed'
+OUTCOME_COALESCED = 'coalesced'  # waited on an identical in-flight request
+OUTCOME_REPLAYED = 'replayed'    # served from the result cache
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class RequestCoalescer:
+    """
+    Keyed single-flight executor with a short-lived result cache.
+    Results are cached only when `cacheable(result)` is true (by default everything);
+    exceptions are propagated to every waiter and never cached.
+    """
+
+    def __init__(self, default_ttl: float = 60.0, max_entries: int = 2000,
+                 cacheable: Optional[Callable[[Any], bool]] = None):
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.cacheable = cacheable or (lambda result: True)
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, _InFlight] = {}
+        self._results: Dict[Hashable, Tuple[float, Any]] = {}  # key -> (expires_at, result)
+
+    def run(self, key: Optional[Hashable], func: Callable[[], Any],
+            ttl: Optional[float] = None) -> Tuple[Any, str]:
+        """Returns (result, outcome). A None key disables coalescing for this call."""
+        if key is None:
+            return func(), OUTCOME_EXECUTED
+
+        with self._lock:
+            self._purge_expired_locked()
+            cached = self._results.get(key)
+            if cached is not None:
+                return cached[1], OUTCOME_REPLAYED
+            flight = self._in_flight.get(key)
+            owner = flight is None
+            if owner:
+                flight = _InFlight()
+                self._in_flight[key] = flight
+
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, OUTCOME_COALESCED
+
+        try:
+            flight.result = func()
+            return flight.result, OUTCOME_EXECUTED
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+                if flight.error is None and self.cacheable(flight.result):
+                    if len(self._results) >= self.max_entries:
+                        self._results.pop(next(iter(self._results)))
+                    self._results[key] = (time.time() + (ttl if ttl is not None else self.default_ttl),
+                                          flight.result)
+            flight.done.set()
+
+    def _purge_expired_locked(self) -> None:
+        now = time.time()
+        for key in [k for k, (expires_at, _) in self._results.items() if expires_at <= now]:
+            del self._results[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'in_flight': len(self._in_flight), 'cached_results': len(self._results)}
@@ -0,0 +1,40 @@
+import threading
+import time
+
+import pytest
+
+from request_coalescer import RequestCoalescer, OUTCOME_COALESCED, OUTCOME_EXECUTED, OUTCOME_REPLAYED
+
+
+def test_duplicates_wait_for_in_flight_request_then_replay():
+    coalescer = RequestCoalescer(default_ttl=60)
+    calls = []
+
+    def turn():
+        calls.append(1)
+        time.sleep(0.1)
+        return {'npc_response': 'Salve'}, 200
+
+    outcomes = []
+    threads = [threading.Thread(target=lambda: outcomes.append(coalescer.run(('chat', 'p1', 'ciao'), turn)[1]))
+               for _ in range(3)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    assert len(calls) == 1
+    assert sorted(outcomes) == sorted([OUTCOME_EXECUTED, OUTCOME_COALESCED, OUTCOME_COALESCED])
+    assert coalescer.run(('chat', 'p1', 'ciao'), turn)[1] == OUTCOME_REPLAYED
+    assert len(calls) == 1
+
+
+def test_errors_and_uncacheable_results_are_not_replayed():
+    coalescer = RequestCoalescer(default_ttl=60, cacheable=lambda result: result[1] < 500)
+
+    def failing():
+        raise RuntimeError("LLM down")
+
+    with pytest.raises(RuntimeError):
+        coalescer.run('k', failing)
+    assert coalescer.run('k', lambda: ({'error': 'x'}, 500))[1] == OUTCOME_EXECUTED
+    assert coalescer.run('k', lambda: ({}, 200))[1] == OUTCOME_EXECUTED
+    assert coalescer.run('k', lambda: ({}, 200), ttl=0)[1] == OUTCOME_REPLAYED
@@ -4,6 +4,10 @@ import traceback
 import hashlib
 from typing import Dict, List, Any, Optional, Tuple, Callable
 
+from content_cache import get_content_cache
+from prompt_segments import DYNAMIC_SECTION_MARKER
+from prompt_templates import PromptTemplate, compile_template, get_prompt_template_cache
+
 try:
   from eldoria_narrative_framework import get_narrative_framework, validate_narrative_against_framework
   NARRATIVE_FRAMEWORK_AVAILABLE = True
@@ -96,73 +100,82 @@ def _format_storyboard_for_prompt(story_text: str, max_length: int = 300) -> str
   return story_text
 
 
-def _load_sysprompt_config() -> Dict[str, str]:
-  """
-  Load story-specific system prompt configuration from SYSPROMPT.toml.
-  Returns dict with flattened keys for backward compatibility.
-  Falls back to Eldoria defaults if file missing.
-  """
-  import tomllib
+_SYSPROMPT_DEFAULTS = {
+  "WORLD_NAME": "Eldoria",
+  "WORLD_NAME_IT": "mondo di Eldoria",
+  "LOCATION_DESCRIPTION": "YOUR LOCATION: {area} in the fantasy world of Eldoria",
+  "LOCATION_DESCRIPTION_IT": "Sei {name}, un/una {role} nell'area di {area} nel mondo di Eldoria.",
+  "WORLD_CONTEXT_LABEL": "Contesto Globale del Mondo (Eldoria)",
+  "LORE_REFERENCE": "Reference Eldoria lore (the Veil, Tessitori, magic, ancient history)",
+  "CHARACTER_BACKGROUND_LABEL": "Collegamento al Velo (Tuo Background Segreto Importante)",
+  "BRIEF_EXAMPLE_1": "Cercastorie... Velo indebolito...",
+  "BRIEF_EXAMPLE_2": "Cristallo rovine.",
+  "CENTRAL_CONFLICT": "sei un alleato che vuole aiutare a salvare il Velo"
+}
 
-  # Default Eldoria config
-  defaults = {
-    "WORLD_NAME": "Eldoria",
-    "WORLD_NAME_IT": "mondo di Eldoria",
-    "LOCATION_DESCRIPTION": "YOUR LOCATION: {area} in the fantasy world of Eldoria",
-    "LOCATION_DESCRIPTION_IT": "Sei {name}, un/una {role} nell'area di {area} nel mondo di Eldoria.",
-    "WORLD_CONTEXT_LABEL": "Contesto Globale del Mondo (Eldoria)",
-    "LORE_REFERENCE": "Reference Eldoria lore (the Veil, Tessitori, magic, ancient history)",
-    "CHARACTER_BACKGROUND_LABEL": "Collegamento al Velo (Tuo Background Segreto Importante)",
-    "BRIEF_EXAMPLE_1": "Cercastorie... Velo indebolito...",
-    "BRIEF_EXAMPLE_2": "Cristallo rovine.",
-    "CENTRAL_CONFLICT": "sei un alleato che vuole aiutare a salvare il Velo"
-  }
 
-  # Try SYSPROMPT.toml first (new format)
-  toml_path = os.path.join(os.path.dirname(__file__), "SYSPROMPT.toml")
+def _parse_sysprompt_toml(toml_path: str) -> Optional[Dict[str, str]]:
+  """Flattened SYSPROMPT.toml, defaults if it cannot be parsed, None if missing."""
+  import tomllib
+
+  defaults = _SYSPROMPT_DEFAULTS
   try:
     with open(toml_path, 'rb') as f:
       toml_config = tomllib.load(f)
-      # Flatten TOML structure to flat keys for backward compatibility
-      config = {
-        "WORLD_NAME": toml_config.get("world", {}).get("name", defaults["WORLD_NAME"]),
-        "WORLD_NAME_IT": toml_config.get("world", {}).get("name_it", defaults["WORLD_NAME_IT"]),
-        "LOCATION_DESCRIPTION": toml_config.get("location", {}).get("description_en", defaults["LOCATION_DESCRIPTION"]),
-        "LOCATION_DESCRIPTION_IT": toml_config.get("location", {}).get("description_it", defaults["LOCATION_DESCRIPTION_IT"]),
-        "WORLD_CONTEXT_LABEL": toml_config.get("world", {}).get("context_label", defaults["WORLD_CONTEXT_LABEL"]),
-        "LORE_REFERENCE": toml_config.get("lore", {}).get("reference", defaults["LORE_REFERENCE"]),
-        "CHARACTER_BACKGROUND_LABEL": toml_config.get("lore", {}).get("character_background_label", defaults["CHARACTER_BACKGROUND_LABEL"]),
-        "BRIEF_EXAMPLE_1": toml_config.get("brief_examples", {}).get("example_1", defaults["BRIEF_EXAMPLE_1"]),
-        "BRIEF_EXAMPLE_2": toml_config.get("brief_examples", {}).get("example_2", defaults["BRIEF_EXAMPLE_2"]),
-        "CENTRAL_CONFLICT": toml_config.get("lore", {}).get("central_conflict", defaults["CENTRAL_CONFLICT"])
-      }
-      return config
   except FileNotFoundError:
-    pass  # Fall back to legacy format or defaults
+    return None  # Fall back to legacy format or defaults
   except Exception as e:
     print(f"Warning: Error loading SYSPROMPT.toml: {e}. Using defaults.")
-    return defaults
+    return dict(defaults)
+
+  # Flatten TOML structure to flat keys for backward compatibility
+  return {
+    "WORLD_NAME": toml_config.get("world", {}).get("name", defaults["WORLD_NAME"]),
+    "WORLD_NAME_IT": toml_config.get("world", {}).get("name_it", defaults["WORLD_NAME_IT"]),
+    "LOCATION_DESCRIPTION": toml_config.get("location", {}).get("description_en", defaults["LOCATION_DESCRIPTION"]),
+    "LOCATION_DESCRIPTION_IT": toml_config.get("location", {}).get("description_it", defaults["LOCATION_DESCRIPTION_IT"]),
+    "WORLD_CONTEXT_LABEL": toml_config.get("world", {}).get("context_label", defaults["WORLD_CONTEXT_LABEL"]),
+    "LORE_REFERENCE": toml_config.get("lore", {}).get("reference", defaults["LORE_REFERENCE"]),
+    "CHARACTER_BACKGROUND_LABEL": toml_config.get("lore", {}).get("character_background_label", defaults["CHARACTER_BACKGROUND_LABEL"]),
+    "BRIEF_EXAMPLE_1": toml_config.get("brief_examples", {}).get("example_1", defaults["BRIEF_EXAMPLE_1"]),
+    "BRIEF_EXAMPLE_2": toml_config.get("brief_examples", {}).get("example_2", defaults["BRIEF_EXAMPLE_2"]),
+    "CENTRAL_CONFLICT": toml_config.get("lore", {}).get("central_conflict", defaults["CENTRAL_CONFLICT"])
+  }
 
-  # Fall back to legacy SYSPROMPT.txt if TOML doesn't exist
-  txt_path = os.path.join(os.path.dirname(__file__), "SYSPROMPT.txt")
+
+def _parse_sysprompt_txt(txt_path: str) -> Dict[str, str]:
+  """Legacy KEY=value SYSPROMPT.txt merged over the defaults (defaults alone if missing)."""
+  config = dict(_SYSPROMPT_DEFAULTS)
   try:
     with open(txt_path, 'r', encoding='utf-8') as f:
       for line in f:
         line = line.strip()
         if '=' in line and not line.startswith('#'):
           key, value = line.split('=', 1)
-          defaults[key.strip()] = value.strip()
-    return defaults
+          config[key.strip()] = value.strip()
   except FileNotFoundError:
-    return defaults
+    pass
+  return config
 
 
-def _load_narrative_framework() -> str:
+def _load_sysprompt_config() -> Dict[str, str]:
   """
-  Load narrative framework constraints from NARRATIVE_FRAMEWORK.txt.
-  Falls back to empty string if file missing (will use eldoria_narrative_framework module as fallback).
+  Load story-specific system prompt configuration from SYSPROMPT.toml.
+  Returns dict with flattened keys for backward compatibility.
+  Falls back to Eldoria defaults if file missing.
+  Parsed files are kept in the content cache until their mtime changes.
   """
-  framework_path = os.path.join(os.path.dirname(__file__), "NARRATIVE_FRAMEWORK.txt")
+  cache = get_content_cache()
+  toml_path = os.path.join(os.path.dirname(__file__), "SYSPROMPT.toml")
+  config = cache.get(toml_path, _parse_sysprompt_toml)
+  if config is None:
+    # Fall back to legacy SYSPROMPT.txt if TOML doesn't exist
+    txt_path = os.path.join(os.path.dirname(__file__), "SYSPROMPT.txt")
+    config = cache.get(txt_path, _parse_sysprompt_txt)
+  return dict(config)  # Callers get their own copy of the shared entry
+
+
+def _read_narrative_framework(framework_path: str) -> str:
   try:
     with open(framework_path, 'r', encoding='utf-8') as f:
       return f.read().strip()
@@ -175,12 +188,39 @@ def _load_narrative_framework() -> str:
       return ""
 
 
+def _load_narrative_framework() -> str:
+  """
+  Load narrative framework constraints from NARRATIVE_FRAMEWORK.txt (cached).
+  Falls back to empty string if file missing (will use eldoria_narrative_framework module as fallback).
+  """
+  framework_path = os.path.join(os.path.dirname(__file__), "NARRATIVE_FRAMEWORK.txt")
+  return get_content_cache().get(framework_path, _read_narrative_framework)
+
+
+def _condense_antefatto_text(condensed: str, target_chars: int) -> str:
+  # Truncate to target if needed
+  if len(condensed) > target_chars:
+    condensed = condensed[:target_chars].rsplit('\n', 1)[0]
+    if not condensed.endswith('.'):
+      condensed += "."
+  return condensed
+
+
+def _read_condensed_antefatto(antefatto_path: str, target_chars: int) -> Optional[str]:
+  try:
+    with open(antefatto_path, 'r', encoding='utf-8') as f:
+      return _condense_antefatto_text(f.read().strip(), target_chars)
+  except FileNotFoundError:
+    return None
+
+
 def _condense_antefatto_for_npc(story_text: str, target_chars: int = 800) -> str:
   """
   Condense ilpercorsodelcercastorie narrative to ~800 chars for regular NPCs.
   Preserves key narrative points: 9 stages, main NPCs, central conflict.
 
-  Loads content from ANTEFATTO.txt file (externalized for easier story changes).
+  Loads content from ANTEFATTO.txt file (externalized for easier story changes);
+  the condensed text is cached per target_chars until the file changes.
 
   Args:
     story_text: Full storyboard text (unused, kept for compatibility)
@@ -191,23 +231,15 @@ def _condense_antefatto_for_npc(story_text: str, target_chars: int = 800) -> str
   """
   # Try to load from ANTEFATTO.txt (externalized story summary)
   antefatto_path = os.path.join(os.path.dirname(__file__), "ANTEFATTO.txt")
-  try:
-    with open(antefatto_path, 'r', encoding='utf-8') as f:
-      condensed = f.read().strip()
-  except FileNotFoundError:
-    # Fallback if file missing: use story_text or default message
-    if isinstance(story_text, str) and story_text.strip():
-      condensed = story_text[:target_chars]
-    else:
-      return "[Antefatto: La memoria della narrazione è ancora frammentaria.]"
+  condensed = get_content_cache().get(
+    antefatto_path, lambda path: _read_condensed_antefatto(path, target_chars), variant=target_chars)
+  if condensed is not None:
+    return condensed
 
-  # Truncate to target if needed
-  if len(condensed) > target_chars:
-    condensed = condensed[:target_chars].rsplit('\n', 1)[0]
-    if not condensed.endswith('.'):
-      condensed += "."
-
-  return condensed
+  # Fallback if file missing: use story_text or default message
+  if isinstance(story_text, str) and story_text.strip():
+    return story_text[:target_chars]
+  return "[Antefatto: La memoria della narrazione è ancora frammentaria.]"
 
 
 def _distill_previous_conversation(chat_history: List[Dict[str, str]], target_chars: int = 500) -> str:
@@ -309,6 +341,16 @@ def _enforce_system_prompt_size_limit(prompt_lines: List[str], max_chars: int =
 
   return full_prompt
 
+def _read_npc_prefix_file(prefix_filename: str) -> str:
+  try:
+    with open(prefix_filename, 'r', encoding='utf-8') as f:
+      return f.read()
+  except FileNotFoundError:
+    return ""
+  except Exception as e:
+    print(f"Warning: Error loading NPC prefix {prefix_filename}: {e}")
+    return ""
+
 def _load_npc_narrative_prefix(npc_area: str, npc_name: str) -> str:
   """Load NPC-specific narrative context prefix.
 
@@ -318,6 +360,7 @@ def _load_npc_narrative_prefix(npc_area: str, npc_name: str) -> str:
 
   Returns:
       str: Personalized narrative context for this NPC, or empty string if not found
+      (files, including absent ones, are remembered in the content cache)
   """
   # Normalize: lowercase, replace spaces/camelCase with lowercase
   # Format: NPC_PREFIX.{area}.{name}.txt
@@ -336,57 +379,44 @@ def _load_npc_narrative_prefix(npc_area: str, npc_name: str) -> str:
     f"NPC_PREFIX.{npc_area.lower()}.{npc_name.lower()}.txt",
   ]
 
+  cache = get_content_cache()
   for prefix_filename in possible_filenames:
     if debug_prefix_search:
       print(f"[DEBUG PREFIX] Trying: {prefix_filename}")
-    try:
-      with open(prefix_filename, 'r', encoding='utf-8') as f:
-        content = f.read()
-        if content.strip():  # Only return if file has content
-          if debug_prefix_search:
-            print(f"[DEBUG PREFIX] ✓ FOUND: {prefix_filename} ({len(content)} chars)")
-          return content
-    except FileNotFoundError:
+    content = cache.get(prefix_filename, _read_npc_prefix_file)
+    if content.strip():  # Only return if file has content
       if debug_prefix_search:
-        print(f"[DEBUG PREFIX] ✗ Not found: {prefix_filename}")
-      continue
-    except Exception as e:
-      print(f"Warning: Error loading NPC prefix {prefix_filename}: {e}")
-      continue
+        print(f"[DEBUG PREFIX] ✓ FOUND: {prefix_filename} ({len(content)} chars)")
+      return content
+    if debug_prefix_search:
+      print(f"[DEBUG PREFIX] ✗ Not found or empty: {prefix_filename}")
 
   # No personalized prefix found for this NPC
   if debug_prefix_search:
     print(f"[DEBUG PREFIX] ✗ No PREFIX found for {npc_name}")
   return ""
 
-def build_system_prompt(
+_STATIC_NPC_FIELDS = (
+  'code', 'name', 'role', 'area', 'motivation', 'goal', 'playerhint', 'dialogue_hooks', 'veil_connection',
+  'default_greeting', 'repeat_greeting', 'conditional_responses', 'ai_behavior_notes', 'notecard_feature',
+  'teleport',
+)
+
+
+def _compile_static_prompt(
     npc: Dict[str, Any],
     story: str,
-    TF: type,
-    game_session_state: Dict[str, Any], # MODIFIED: Pass full game state
-    conversation_summary_for_guide_context: Optional[str] = None, # MODIFIED: Renamed
-    llm_wrapper_func_for_distill: Optional[Callable] = None # MODIFIED: Renamed for clarity
-) -> str:
-    # IMPORTANT: Narrative context (~70KB) should ONLY be added for wise guide during /hint mode
-    # Regular NPCs should use their own character files without this massive context
-    # This prevents the narrative journey from changing NPC behavior
-
+    sysprompt_config: Dict[str, str],
+    npc_narrative_prefix: str,
+    condensed_antefatto: Optional[str],
+    narrative_framework: Optional[str],
+    is_regular_npc: bool,
+    brief_mode: bool,
+    db
+) -> PromptTemplate:
+    """Builds everything before DYNAMIC_SECTION_MARKER, which depends on the NPC and the story only."""
     import logging
     logger = logging.getLogger(__name__)
-    logger.info(f"[BUILD_PROMPT] NPC dict keys: {list(npc.keys())}")
-    if 'notecard_feature' in npc and npc['notecard_feature'] is not None:
-        logger.info(f"[BUILD_PROMPT] ✓ notecard_feature EXISTS, length={len(npc['notecard_feature'])} chars")
-        logger.info(f"[BUILD_PROMPT] notecard_feature preview: {npc['notecard_feature'][:100]}")
-    else:
-        logger.warning(f"[BUILD_PROMPT] ✗ notecard_feature MISSING or NULL in NPC dict")
-
-    # Load story-specific system prompt config
-    sysprompt_config = _load_sysprompt_config()
-
-    player_id = game_session_state['player_id']
-    player_profile = game_session_state.get('player_profile_cache')
-    model_name_for_distill = game_session_state.get('profile_analysis_model_name') or game_session_state.get('model_name')
-    wise_guide_npc_name_from_state = game_session_state.get('wise_guide_npc_name')
 
     story_context = _format_storyboard_for_prompt(story)
     name = npc.get('name', 'Unknown NPC')
@@ -404,26 +434,11 @@ def build_system_prompt(
     conditional_responses = npc.get('conditional_responses', '')
     ai_behavior_notes = npc.get('ai_behavior_notes', '')
     notecard_feature = npc.get('notecard_feature', '')
-
-    import logging
-    logger = logging.getLogger(__name__)
     logger.info(f"[EXTRACT] notecard_feature type={type(notecard_feature)}, len={len(notecard_feature) if notecard_feature else 0}, bool={bool(notecard_feature)}")
 
-    # TEMP DEBUG: Write notecard_feature to file
-    if npc.get('name') == 'Elira':
-        with open('/tmp/elira_notecard_debug.txt', 'w') as f:
-            f.write(f"notecard_feature value:\n{notecard_feature}\n\nType: {type(notecard_feature)}\nLen: {len(notecard_feature) if notecard_feature else 0}\nBool: {bool(notecard_feature)}\n")
-
-    # Get Second Life command options
-    emotes = npc.get('emotes', '')
-    animations = npc.get('animations', '')
-    lookup_objects = npc.get('lookup', '')
-    llsettext_capability = npc.get('llsettext', '')
+    # Second Life teleport capability
     teleport_locations = npc.get('teleport', '')
 
-    # Load NPC-specific narrative context FIRST (if available)
-    npc_narrative_prefix = _load_npc_narrative_prefix(area, name)
-
     # DEBUG: Log if PREFIX was loaded
     debug_system_prompt = os.environ.get('DEBUG_SYSTEM_PROMPT', 'false').lower() == 'true'
     if debug_system_prompt:
@@ -435,20 +450,16 @@ def build_system_prompt(
     prompt_lines = []
 
     # For REGULAR NPCs: Add condensed antefatto FIRST (before PREFIX) to ensure it's never trimmed
-    is_regular_npc = name.lower() != (wise_guide_npc_name_from_state or "").lower()
-
     if is_regular_npc:
         # Add condensed antefatto at the very TOP so it survives trimming
         # With 8KB budget, we can expand antefatto from 700 to 1200 chars for richer story context
         prompt_lines.append("="*80)
         prompt_lines.append("ANTEFATTO - IL TUO CONTESTO NARRATIVO")
         prompt_lines.append("="*80)
-        condensed_antefatto = _condense_antefatto_for_npc(story, target_chars=1200)
         prompt_lines.append(f"\n{condensed_antefatto}\n")
         prompt_lines.append("="*80 + "\n")
 
-        # Load and add Narrative Framework constraints (externalized to NARRATIVE_FRAMEWORK.txt)
-        narrative_framework = _load_narrative_framework()
+        # Add Narrative Framework constraints (externalized to NARRATIVE_FRAMEWORK.txt)
         if narrative_framework:
             prompt_lines.append("🔸 VINCOLI NARRATIVI (MANTIENI COERENZA IDEOLOGICA)")
             prompt_lines.append("-" * 80)
@@ -549,8 +560,6 @@ def build_system_prompt(
         # NOTECARD_FEATURE now added earlier (after character core info) to avoid trimming
 
     # Brief mode - concise responses
-    brief_mode = game_session_state.get('brief_mode', False)
-    
     if brief_mode:
         prompt_lines.append("")
         prompt_lines.append("=" * 80)
@@ -621,7 +630,7 @@ def build_system_prompt(
             "- To another NPC: Add [TELEPORT_TO:npc_name] at the END (e.g., [TELEPORT_TO:Lyra])",
             "",
             "KNOWN NPCs you can teleport to:",
-            _build_known_npcs_for_teleport(game_session_state.get('db')),
+            _build_known_npcs_for_teleport(db),
             "",
             "Examples:",
             "- Player asks 'portami da te': 'Certo, vieni! [OFFER_TELEPORT]'",
@@ -744,12 +753,74 @@ def build_system_prompt(
         "NPC Dialogo: Hmm, non ti conosco abbastanza per fidarmi. Forse se mi portassi qualcosa che dimostra le tue intenzioni..."
     ])
 
+    return compile_template(prompt_lines, story_context)
+
+
+def _static_prompt_template(npc: Dict[str, Any], story: str, is_regular_npc: bool, brief_mode: bool, db) -> PromptTemplate:
+    """Compiled static section for this NPC, shared by all players until one of its inputs changes."""
+    # Load story-specific system prompt config and NPC-specific narrative context (content cache)
+    sysprompt_config = _load_sysprompt_config()
+    name = npc.get('name', 'Unknown NPC')
+    area = npc.get('area', 'Unknown Area')
+    npc_narrative_prefix = _load_npc_narrative_prefix(area, name)
+    condensed_antefatto = _condense_antefatto_for_npc(story, target_chars=1200) if is_regular_npc else None
+    narrative_framework = _load_narrative_framework() if is_regular_npc else None
+
+    key = (npc.get('code') or f"{area}.{name}", bool(brief_mode), is_regular_npc)
+    fingerprint = (tuple(npc.get(field) for field in _STATIC_NPC_FIELDS), story, sysprompt_config,
+                   npc_narrative_prefix, condensed_antefatto, narrative_framework)
+    return get_prompt_template_cache().get(key, fingerprint, lambda: _compile_static_prompt(
+        npc, story, sysprompt_config, npc_narrative_prefix, condensed_antefatto, narrative_framework,
+        is_regular_npc, brief_mode, db
+    ))
+
+
+def build_system_prompt(
+    npc: Dict[str, Any],
+    story: str,
+    TF: type,
+    game_session_state: Dict[str, Any], # MODIFIED: Pass full game state
+    conversation_summary_for_guide_context: Optional[str] = None, # MODIFIED: Renamed
+    llm_wrapper_func_for_distill: Optional[Callable] = None # MODIFIED: Renamed for clarity
+) -> str:
+    # IMPORTANT: Narrative context (~70KB) should ONLY be added for wise guide during /hint mode
+    # Regular NPCs should use their own character files without this massive context
+    # This prevents the narrative journey from changing NPC behavior
+
+    import logging
+    logger = logging.getLogger(__name__)
+    logger.info(f"[BUILD_PROMPT] NPC dict keys: {list(npc.keys())}")
+    if 'notecard_feature' in npc and npc['notecard_feature'] is not None:
+        logger.info(f"[BUILD_PROMPT] ✓ notecard_feature EXISTS, length={len(npc['notecard_feature'])} chars")
+        logger.info(f"[BUILD_PROMPT] notecard_feature preview: {npc['notecard_feature'][:100]}")
+    else:
+        logger.warning(f"[BUILD_PROMPT] ✗ notecard_feature MISSING or NULL in NPC dict")
+
+    player_id = game_session_state['player_id']
+    player_profile = game_session_state.get('player_profile_cache')
+    model_name_for_distill = game_session_state.get('profile_analysis_model_name') or game_session_state.get('model_name')
+    wise_guide_npc_name_from_state = game_session_state.get('wise_guide_npc_name')
+    name = npc.get('name', 'Unknown NPC')
+    is_regular_npc = name.lower() != (wise_guide_npc_name_from_state or "").lower()
+    brief_mode = game_session_state.get('brief_mode', False)
+    debug_system_prompt = os.environ.get('DEBUG_SYSTEM_PROMPT', 'false').lower() == 'true'
+
+    # Static section (antefatto, PREFIX, character sheet, rules) is compiled once per NPC
+    template = _static_prompt_template(npc, story, is_regular_npc, brief_mode, game_session_state.get('db'))
+    story_context = template.story_context
+
+    prompt_lines = []  # Dynamic tail only, rendered per call
+
     # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
     # DYNAMIC CONTENT SECTION - Added at END for optimal caching
     # Everything above this line is STATIC and can be cached by the LLM
     # Everything below this line is DYNAMIC and changes per request
     # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
+    # Marks where ChatSession splits the cached static block from the per-turn state (prompt_segments)
+    prompt_lines.append("")
+    prompt_lines.append(DYNAMIC_SECTION_MARKER)
+
     # Add player inventory information so NPC can see what player has
     player_inventory = game_session_state.get('player_inventory', [])
     player_credits = game_session_state.get('player_credits_cache', 0)
@@ -783,6 +854,9 @@ def build_system_prompt(
                 game_session_state.get('last_npc_conversation_history', []),
                 target_chars=800
             )
+            rolling_summary = game_session_state.get('last_npc_conversation_summary')
+            if rolling_summary:
+                prompt_lines.append(f"\n{rolling_summary[:800]}\n")
             if prev_conv_summary:
                 prompt_lines.append(f"\n{prev_conv_summary}\n")
             prompt_lines.append("="*80 + "\n")
@@ -867,26 +941,19 @@ def build_system_prompt(
     # For wise guides: allow more (no strict limit during /hint mode)
     max_prompt_size = 16000 if is_regular_npc else 20000
 
-    final_prompt = _enforce_system_prompt_size_limit(
-        prompt_lines,
-        max_chars=max_prompt_size,
-        preserve_sections=["OBBLIGATORIE", "CRITICHE", "REGOLE LINGUISTICHE", "LINGUA OBBLIGATORIA", "COMPORTAMENTO", "ISTRUZIONI IMPORTANTI", "NOTECARD"]
-    )
+    final_prompt = template.render(prompt_lines)
+    if len(final_prompt) > max_prompt_size:
+        final_prompt = _enforce_system_prompt_size_limit(
+            list(template.static_lines) + prompt_lines,
+            max_chars=max_prompt_size,
+            preserve_sections=["OBBLIGATORIE", "CRITICHE", "REGOLE LINGUISTICHE", "LINGUA OBBLIGATORIA", "COMPORTAMENTO", "ISTRUZIONI IMPORTANTI", "NOTECARD"]
+        )
 
     # Debug: Log prompt size if enabled
     if debug_system_prompt:
         npc_type = "WISE_GUIDE" if not is_regular_npc else "REGULAR_NPC"
         print(f"[DEBUG PROMPT] {npc_type} {name}: {len(final_prompt)} chars (max: {max_prompt_size})")
 
-    # TEMP DEBUG: Save Elira's full prompt to file
-    if name == 'Elira':
-        with open('/tmp/elira_full_prompt.txt', 'w') as f:
-            f.write(final_prompt)
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info(f"[PROMPT_DEBUG] Saved Elira's system prompt to /tmp/elira_full_prompt.txt ({len(final_prompt)} chars)")
-        logger.info(f"[PROMPT_DEBUG] Checking for NOTECARD in prompt: {'NOTECARD' in final_prompt}")
-
     return final_prompt
 
 
@@ -921,6 +988,8 @@ def load_and_prepare_conversation(
 
         chat_session = ChatSession_class(model_name=model_name, model_type=model_type)
         chat_session.set_system_prompt(system_prompt)
+        chat_session.npc_name = npc_data.get('name', npc_name)
+        chat_session.summary_persist = lambda summary, count: db.save_conversation_summary(player_id, npc_code, summary, count)
 
         player_hint_from_data = npc_data.get('playerhint')
         if not player_hint_from_data:
@@ -941,6 +1010,11 @@ def load_and_prepare_conversation(
                 if role and content is not None:
                     chat_session.add_message(role, content)
 
+            stored_summary = db.load_conversation_summary(player_id, npc_code)
+            if isinstance(stored_summary, dict) and stored_summary.get("summarized_count", 0) <= len(chat_session.messages):
+                chat_session.rolling_summary = stored_summary.get("summary")
+                chat_session.summarized_count = stored_summary.get("summarized_count", 0)
+
             # Handle conversation resumption
             if chat_session.messages:
                 last_loaded_message = chat_session.messages[-1]
@@ -995,6 +1069,7 @@ def save_current_conversation(db, player_id: str, current_npc: Optional[Dict[str
             # MODIFIED: Store conversation history in game_session_state for next NPC to reference
             # This allows the next NPC to be aware of what the player just did
             game_session_state['last_npc_conversation_history'] = chat_session.messages
+            game_session_state['last_npc_conversation_summary'] = getattr(chat_session, 'rolling_summary', None)
             game_session_state['last_npc_name'] = current_npc.get('name', 'Unknown')
 
         # else:
@@ -0,0 +1,406 @@
+# speculation.py
+# Speculative parallel processing of one natural-language turn (see process_input_revised).
+#
+# A SpeculativeTurn races two branches on the shared llm_scheduler lanes:
+#   nlp       - command interpretation (decided at once by intent_classifier when the
+#               input is clear-cut, otherwise interpret_user_intent on the nlp lane)
+#   dialogue  - the NPC reply, generated on a throwaway copy of the chat session
+# The race policy lives in one place:
+#   - the NLP result is the decisive one. A confident command wins: the dialogue branch is
+#     aborted (or never started). Anything else starts the dialogue branch from the NLP
+#     future's completion callback, with its tokens released to the client at once.
+#   - if NLP has not resolved after head_start seconds the dialogue branch starts anyway,
+#     its tokens held by a GatedTokenRelay until NLP rules it in or out.
+#   - if NLP is still unresolved after nlp_grace more seconds it is aborted and the turn
+#     is treated as dialogue.
+# Each turn's branch timings (queue wait, run time, time to decision), the timeouts used
+# and the path taken are logged as [SPECULATION] and aggregated by the stats tracker
+# (record_speculation). Paths: command, speculative_hit (reply ready within dialogue_wait),
+# extended_wait (ready within dialogue_extended_wait), fallback (a second, non-speculative
+# call generates the reply).
+#
+# Timeouts adapt to recent latencies of the turn's models in LLMStatsTracker (per model,
+# else per usage type) once NEXUS_SPECULATION_MIN_SAMPLES (10) calls were seen; until then,
+# or with NEXUS_SPECULATION_ADAPTIVE=0, the static defaults below apply.
+#   head_start              p75 command_interpretation latency                 0.3 - 2.0 s
+#   nlp_grace               p95 command_interpretation latency - head_start    0.3 - 3.0 s
+#   dialogue_wait           p75 dialogue total time                            0.5 - 5.0 s
+#   dialogue_extended_wait  1.5 x p99 dialogue total time - dialogue_wait      1.0 - 20.0 s
+# Bounds can be overridden with NEXUS_SPECULATION_<TIMEOUT>_MIN / _MAX (e.g. ..._HEAD_START_MAX).
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, wait as futures_wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import output_channel
+from intent_classifier import classify_intent, local_intent_enabled
+from llm_cancellation import CancellationToken
+from llm_scheduler import get_llm_scheduler, LaneSaturatedError, LANE_INTERACTIVE, LANE_NLP, PRIORITY_SPECULATIVE
+from llm_stats_tracker import get_global_stats_tracker
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_COMMAND = 'command'    # NLP found a confident command: run it
+OUTCOME_DIALOGUE = 'dialogue'  # the speculative NPC reply is ready: use it
+OUTCOME_FALLBACK = 'fallback'  # neither branch settled the turn: generate the reply normally
+
+PATH_COMMAND = 'command'
+PATH_SPECULATIVE_HIT = 'speculative_hit'
+PATH_EXTENDED_WAIT = 'extended_wait'
+PATH_FALLBACK = 'fallback'
+
+# Static defaults (seconds), used until enough latency samples exist
+HEAD_START = 1.2              # NLP gets this long before dialogue starts unconfirmed
+NLP_GRACE = 1.5               # further wait for NLP before giving up on it
+DIALOGUE_WAIT = 1.5           # wait for a speculative reply that is not streaming yet
+DIALOGUE_EXTENDED_WAIT = 3.0  # second chance before falling back, avoids paying twice
+
+_BOUNDS = {
+    'head_start': (0.3, 2.0),
+    'nlp_grace': (0.3, 3.0),
+    'dialogue_wait': (0.5, 5.0),
+    'dialogue_extended_wait': (1.0, 20.0),
+}
+
+
+class Branch:
+    """One speculative branch: its future, shared result container and timing."""
+
+    def __init__(self, name: str, container: Dict[str, Any]):
+        self.name = name
+        self.container = container
+        self.future: Optional[Future] = None
+        self.submitted_at: Optional[float] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.container.get('completed', False)
+
+    @property
+    def started(self) -> bool:
+        return self.future is None or self.future.running() or self.future.done()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self.future is not None:
+            futures_wait([self.future], timeout=timeout)
+
+    def cancel(self, reason: str) -> None:
+        """Marks the branch as unwanted, drops it if still queued and aborts its in-flight LLM request."""
+        self.container['cancelled'] = True
+        if self.future is not None:
+            self.future.cancel()
+        cancel_token = self.container.get('cancel_token')
+        if cancel_token is not None:
+            cancel_token.cancel(reason)
+
+    def timing(self) -> Dict[str, Any]:
+        if self.submitted_at is None:
+            return {'source': 'local'}
+        timing: Dict[str, Any] = {'source': 'llm', 'completed': self.done}
+        if self.started_at is not None:
+            timing['queued_ms'] = int((self.started_at - self.submitted_at) * 1000)
+        if self.finished_at is not None:
+            timing['run_ms'] = int((self.finished_at - self.started_at) * 1000)
+        return timing
+
+
+@dataclass
+class SpeculationOutcome:
+    kind: str
+    intent_result: Optional[Dict[str, Any]] = None
+    dialogue_result: Optional[Dict[str, Any]] = None
+    timings: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class SpeculationTimeouts:
+    head_start: float
+    nlp_grace: float
+    dialogue_wait: float
+    dialogue_extended_wait: float
+    adaptive: bool = False
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {'head_start': round(self.head_start, 3), 'nlp_grace': round(self.nlp_grace, 3),
+                'dialogue_wait': round(self.dialogue_wait, 3),
+                'dialogue_extended_wait': round(self.dialogue_extended_wait, 3), 'adaptive': self.adaptive}
+
+
+def _bounded(name: str, value: float) -> float:
+    low, high = _BOUNDS[name]
+    low = float(os.environ.get(f"NEXUS_SPECULATION_{name.upper()}_MIN", low))
+    high = float(os.environ.get(f"NEXUS_SPECULATION_{name.upper()}_MAX", high))
+    return min(high, max(low, value))
+
+
+def _percentile(model_type: str, model_name: Optional[str], percentile: float, min_samples: int,
+                total_time: bool = False) -> Optional[float]:
+    tracker = get_global_stats_tracker()
+    value = None
+    if model_name:
+        value = tracker.latency_percentile(model_type, percentile, min_samples=min_samples,
+                                           model_name=model_name, total_time=total_time)
+    if value is None:
+        value = tracker.latency_percentile(model_type, percentile, min_samples=min_samples, total_time=total_time)
+    return value
+
+
+def compute_timeouts(nlp_model: Optional[str], dialogue_model: Optional[str]) -> SpeculationTimeouts:
+    """Speculation timeouts for one turn, from recent latencies of its NLP and dialogue models."""
+    timeouts = SpeculationTimeouts(HEAD_START, NLP_GRACE, DIALOGUE_WAIT, DIALOGUE_EXTENDED_WAIT)
+    if os.environ.get("NEXUS_SPECULATION_ADAPTIVE", "1").lower() in ("0", "false", "no"):
+        return timeouts
+    min_samples = int(os.environ.get("NEXUS_SPECULATION_MIN_SAMPLES", "10"))
+
+    nlp_p75 = _percentile('command_interpretation', nlp_model, 75, min_samples)
+    nlp_p95 = _percentile('command_interpretation', nlp_model, 95, min_samples)
+    if nlp_p75 is not None and nlp_p95 is not None:
+        timeouts.head_start = _bounded('head_start', nlp_p75)
+        timeouts.nlp_grace = _bounded('nlp_grace', nlp_p95 - timeouts.head_start)
+        timeouts.adaptive = True
+
+    dialogue_p75 = _percentile('dialogue', dialogue_model, 75, min_samples, total_time=True)
+    dialogue_p99 = _percentile('dialogue', dialogue_model, 99, min_samples, total_time=True)
+    if dialogue_p75 is not None and dialogue_p99 is not None:
+        timeouts.dialogue_wait = _bounded('dialogue_wait', dialogue_p75)
+        timeouts.dialogue_extended_wait = _bounded('dialogue_extended_wait',
+                                                   1.5 * dialogue_p99 - timeouts.dialogue_wait)
+        timeouts.adaptive = True
+    return timeouts
+
+
+def _local_intent_vocabulary(state: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """Area and NPC names for the local classifier, from the game system's context cache when available."""
+    game_system_instance = state.get('game_system_instance')
+    if game_system_instance and hasattr(game_system_instance, '_get_cached_npcs_list'):
+        try:
+            npcs = game_system_instance._get_cached_npcs_list() or []
+            return game_system_instance._get_cached_areas_list(), [npc['name'] for npc in npcs if npc.get('name')]
+        except Exception as e:
+            logger.warning(f"[NLP-LOCAL] Vocabulary cache unavailable: {e}")
+    return state.get('available_areas') or [], []
+
+
+class SpeculativeTurn:
+    """
+    Runs the NLP and dialogue branches of one turn and settles the race between them.
+    `interpret` and `generate` are called as func(user_input, state, container) on a lane
+    worker and report through the container ('completed', 'intent_result' / 'dialogue_result',
+    honouring 'cancelled' and 'cancel_token').
+    """
+
+    def __init__(self, user_input: str, state: Dict[str, Any], interpret: Callable, generate: Callable):
+        self.user_input = user_input
+        self.state = state
+        self._interpret = interpret
+        self._generate = generate
+        self.confidence_threshold = state.get('nlp_command_confidence_threshold', 0.7)
+        self.can_speak = bool(state.get('current_npc') and state.get('chat_session')
+                              and not state.get('in_hint_mode', False))
+        nlp_model = (state.get('nlp_command_model_name') or state.get('profile_analysis_model_name')
+                     or state.get('model_name'))
+        self.timeouts = compute_timeouts(nlp_model, getattr(state.get('chat_session'), 'model_name', None))
+        self.path: Optional[str] = None
+        # Lane workers and completion callbacks run outside the request context: capture it now
+        self._listener = output_channel.current_token_listener()
+        self._run_nlp = output_channel.bind_current_context(self._run)
+        self._run_dialogue = output_channel.bind_current_context(self._run)
+        self._lock = threading.Lock()
+        self._settled = False  # set by _finish: late callbacks must not start anything
+        self._intent_ready = threading.Event()
+        self._started_at = time.perf_counter()
+        self._decided_at: Optional[float] = None
+        self._dialogue_started_at: Optional[float] = None
+        self.nlp: Optional[Branch] = None
+        self.dialogue: Optional[Branch] = None
+
+    # --- branches -----------------------------------------------------------
+
+    def _run(self, branch: Branch, func: Callable) -> None:
+        branch.started_at = time.perf_counter()
+        try:
+            func(self.user_input, self.state, branch.container)
+        finally:
+            branch.finished_at = time.perf_counter()
+
+    def _submit(self, branch: Branch, lane: str, runner: Callable) -> bool:
+        func = self._interpret if branch.name == 'nlp' else self._generate
+        branch.submitted_at = time.perf_counter()
+        try:
+            branch.future = get_llm_scheduler().submit(lane, runner, branch, func, priority=PRIORITY_SPECULATIVE)
+        except LaneSaturatedError as e:
+            logger.warning(f"[SPECULATION] Skipping speculative {branch.name}: {e}")
+            branch.submitted_at = None
+            return False
+        return True
+
+    def start(self) -> 'SpeculativeTurn':
+        """Decides locally when possible, otherwise queues the NLP interpretation (skipped if its lane is saturated)."""
+        nlp = Branch('nlp', {'completed': False, 'intent_result': None, 'cancel_token': CancellationToken()})
+        if local_intent_enabled():
+            areas, npc_names = _local_intent_vocabulary(self.state)
+            intent_result = classify_intent(self.user_input, areas, npc_names,
+                                            (self.state.get('current_npc') or {}).get('name'))
+            if intent_result is not None:
+                logger.info(f"[NLP-LOCAL] Decided: is_command={intent_result['is_command']}, "
+                            f"cmd={intent_result.get('inferred_command')}")
+                nlp.container.update(intent_result=intent_result, completed=True)
+                self.nlp = nlp
+                self._on_intent()
+                return self
+        if self._submit(nlp, LANE_NLP, self._run_nlp):
+            self.nlp = nlp
+            nlp.future.add_done_callback(lambda _: self._on_intent())
+        return self
+
+    def _start_dialogue(self, release_tokens: bool) -> None:
+        with self._lock:
+            if self._settled:
+                return
+            if self.dialogue is not None:
+                if release_tokens:
+                    self._settle_relay(True)
+                return
+            container: Dict[str, Any] = {'completed': False, 'dialogue_result': None,
+                                         'cancel_token': CancellationToken()}
+            if self._listener:
+                relay = output_channel.GatedTokenRelay(self._listener)
+                if release_tokens:
+                    relay.open()
+                container['token_relay'] = relay
+            branch = Branch('dialogue', container)
+            if self._submit(branch, LANE_INTERACTIVE, self._run_dialogue):
+                self.dialogue = branch
+                self._dialogue_started_at = time.perf_counter()
+                logger.info(f"[SPECULATION] Started dialogue branch ({'released' if release_tokens else 'held'})")
+
+    def _settle_relay(self, use_result: bool) -> None:
+        relay = self.dialogue.container.get('token_relay') if self.dialogue else None
+        if relay:
+            relay.open() if use_result else relay.discard()
+
+    # --- race policy --------------------------------------------------------
+
+    def is_decisive_command(self, intent_result: Optional[Dict[str, Any]]) -> bool:
+        return bool(intent_result and intent_result.get('is_command') and intent_result.get('inferred_command')
+                    and intent_result.get('confidence', 0.0) >= self.confidence_threshold)
+
+    def _on_intent(self) -> None:
+        """Completion callback of the NLP branch: starts (or aborts) dialogue the moment the intent is known."""
+        with self._lock:
+            if self._settled:
+                return  # An NLP branch that outlived its grace: the turn went on without it
+        intent_result = self.nlp.container.get('intent_result') if self.nlp.done else None
+        if intent_result is not None:
+            self._decided_at = time.perf_counter()
+        if self.is_decisive_command(intent_result):
+            with self._lock:
+                dialogue = self.dialogue
+            if dialogue is not None and not dialogue.done:
+                logger.info("[SPECULATION] Aborting dialogue branch - NLP detected command")
+                dialogue.cancel("nlp detected command")
+        elif intent_result is not None and self.can_speak:
+            self._start_dialogue(release_tokens=True)
+        self._intent_ready.set()
+
+    def _dialogue_result(self) -> Optional[Dict[str, Any]]:
+        container = self.dialogue.container
+        if container['completed'] and container['dialogue_result'] and not container.get('cancelled', False):
+            return container['dialogue_result']
+        return None
+
+    def _join_dialogue(self, timeout: float) -> None:
+        relay = self.dialogue.container.get('token_relay')
+        streaming = bool(relay and relay.is_open)
+        if streaming and not self.dialogue.started:
+            # A released dialogue branch still queued on its lane is dropped, not waited for:
+            # the turn falls back to normal processing (cancel fails if a worker just picked it up)
+            self.dialogue.future.cancel()
+            streaming = not self.dialogue.future.cancelled()
+        if streaming:
+            # Tokens are already reaching the client: finish this generation rather than start another
+            self.dialogue.join()
+        else:
+            self.dialogue.join(timeout=timeout)
+
+    def _await_dialogue(self) -> Optional[Dict[str, Any]]:
+        """Releases the dialogue branch and waits for it; aborts it if it is not ready in time."""
+        self._settle_relay(True)
+        self._join_dialogue(self.timeouts.dialogue_wait)
+        result = self._dialogue_result()
+        self.path = PATH_SPECULATIVE_HIT
+        if result is None and self.dialogue.future is not None and not self.dialogue.future.done():
+            logger.info("[SPECULATION] Waiting for dialogue branch to complete...")
+            self.dialogue.join(timeout=self.timeouts.dialogue_extended_wait)
+            result = self._dialogue_result()
+            self.path = PATH_EXTENDED_WAIT
+        if result is None:
+            self.path = PATH_FALLBACK
+            logger.info("[SPECULATION] Dialogue not ready, falling back to normal processing")
+            self.dialogue.cancel("dialogue not ready")
+            self._settle_relay(False)
+        return result
+
+    def resolve(self) -> SpeculationOutcome:
+        """Blocks until the turn is settled and returns which branch won."""
+        if self.nlp is None:
+            return self._finish(SpeculationOutcome(OUTCOME_FALLBACK))
+
+        if not self._intent_ready.wait(timeout=self.timeouts.head_start) and self.can_speak:
+            logger.info("[SPECULATION] NLP head start expired, starting dialogue branch unconfirmed")
+            self._start_dialogue(release_tokens=False)
+        self._intent_ready.wait(timeout=self.timeouts.nlp_grace)
+
+        if not self.nlp.done:
+            # NLP didn't resolve - stop paying for it and treat the turn as dialogue
+            self.nlp.cancel("nlp timeout")
+            with self._lock:
+                dialogue = self.dialogue
+            result = self._await_dialogue() if dialogue else None
+            return self._finish(SpeculationOutcome(OUTCOME_DIALOGUE if result else OUTCOME_FALLBACK,
+                                                   dialogue_result=result))
+
+        intent_result = self.nlp.container['intent_result']
+        with self._lock:
+            dialogue = self.dialogue
+        if self.is_decisive_command(intent_result):
+            if dialogue is not None:
+                finished = dialogue.container.get('dialogue_result')
+                if finished and not dialogue.container.get('cancelled'):
+                    # Completed before the command was known: paid for and thrown away
+                    get_global_stats_tracker().record_cancellation(
+                        'dialogue', (finished.get('response_stats') or {}).get('total_tokens', 0), aborted=False)
+                dialogue.cancel("nlp detected command")
+                self._settle_relay(False)
+            return self._finish(SpeculationOutcome(OUTCOME_COMMAND, intent_result=intent_result))
+
+        result = self._await_dialogue() if dialogue else None
+        return self._finish(SpeculationOutcome(OUTCOME_DIALOGUE if result else OUTCOME_FALLBACK,
+                                               intent_result=intent_result, dialogue_result=result))
+
+    def _finish(self, outcome: SpeculationOutcome) -> SpeculationOutcome:
+        with self._lock:
+            self._settled = True
+        if outcome.kind == OUTCOME_COMMAND:
+            self.path = PATH_COMMAND
+        elif outcome.kind == OUTCOME_FALLBACK:
+            self.path = PATH_FALLBACK
+        timings: Dict[str, Any] = {'outcome': outcome.kind, 'path': self.path, 'timeouts': self.timeouts.as_dict()}
+        if self.nlp is not None:
+            timings['nlp'] = self.nlp.timing()
+        if self._decided_at is not None:
+            timings['decision_ms'] = int((self._decided_at - self._started_at) * 1000)
+        if self.dialogue is not None:
+            timings['dialogue'] = dict(self.dialogue.timing(),
+                                       start_ms=int((self._dialogue_started_at - self._started_at) * 1000))
+        timings['total_ms'] = int((time.perf_counter() - self._started_at) * 1000)
+        outcome.timings = timings
+        logger.info(f"[SPECULATION] Turn settled: {timings}")
+        get_global_stats_tracker().record_speculation(timings)
+        return outcome
@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+
+import speculation
+from llm_stats_tracker import get_global_stats_tracker, reset_global_stats_tracker
+from speculation import OUTCOME_COMMAND, OUTCOME_DIALOGUE, OUTCOME_FALLBACK, SpeculativeTurn, compute_timeouts
+
+STATE = {'current_npc': {'name': 'Jorin'}, 'chat_session': object()}
+
+
+@pytest.fixture(autouse=True)
+def llm_only(monkeypatch):
+    monkeypatch.setenv("NEXUS_LOCAL_INTENT", "0")
+    reset_global_stats_tracker()
+
+
+def _interpreter(intent, delay=0.0):
+    def interpret(user_input, state, container):
+        time.sleep(delay)
+        container.update(intent_result=dict(intent, original_input=user_input), completed=True)
+    return interpret
+
+
+def _generator(started, delay=0.0):
+    def generate(user_input, state, container):
+        started.set()
+        token = container['cancel_token']
+        deadline = time.time() + delay
+        while time.time() < deadline and not token.cancelled:
+            time.sleep(0.01)
+        if not token.cancelled:
+            container['dialogue_result'] = {'response_text': 'Salve', 'npc_name': 'Jorin'}
+        container['completed'] = True
+    return generate
+
+
+def test_dialogue_starts_from_the_nlp_completion_callback():
+    started = threading.Event()
+    turn = SpeculativeTurn("come stai?", STATE, _interpreter({'is_command': False, 'confidence': 0.9}),
+                           _generator(started)).start()
+    assert started.wait(1.0)  # nobody called resolve() yet
+
+    outcome = turn.resolve()
+    assert outcome.kind == OUTCOME_DIALOGUE and outcome.dialogue_result['response_text'] == 'Salve'
+    assert outcome.timings['nlp']['source'] == 'llm' and 'start_ms' in outcome.timings['dialogue']
+    assert outcome.timings['path'] == 'speculative_hit'
+    assert get_global_stats_tracker().get_speculation_stats()['outcomes'] == {'dialogue': 1}
+
+
+def test_confident_command_aborts_dialogue_started_after_head_start(monkeypatch):
+    monkeypatch.setattr(speculation, 'HEAD_START', 0.05)
+    started = threading.Event()
+    turn = SpeculativeTurn("vado in taverna", STATE,
+                           _interpreter({'is_command': True, 'inferred_command': '/go Tavern', 'confidence': 0.9}, 0.3),
+                           _generator(started, delay=5.0)).start()
+
+    outcome = turn.resolve()
+    assert outcome.kind == OUTCOME_COMMAND and outcome.intent_result['inferred_command'] == '/go Tavern'
+    assert started.is_set() and turn.dialogue.container['cancel_token'].cancelled
+
+
+def test_unresolved_nlp_is_aborted_and_the_turn_treated_as_dialogue(monkeypatch):
+    monkeypatch.setattr(speculation, 'HEAD_START', 0.05)
+    monkeypatch.setattr(speculation, 'NLP_GRACE', 0.05)
+    started = threading.Event()
+    turn = SpeculativeTurn("ciao", STATE, _interpreter({'is_command': False, 'confidence': 0.9}, 2.0),
+                           _generator(started, delay=0.1)).start()
+
+    outcome = turn.resolve()
+    assert outcome.kind == OUTCOME_DIALOGUE and outcome.intent_result is None
+    assert turn.nlp.container['cancel_token'].cancelled
+
+
+def test_late_nlp_result_does_not_start_dialogue_after_the_turn_settled(monkeypatch):
+    monkeypatch.setattr(speculation, 'HEAD_START', 0.05)
+    monkeypatch.setattr(speculation, 'NLP_GRACE', 0.05)
+    submit = SpeculativeTurn._submit
+    dialogue_submits = []
+
+    def saturated_dialogue_lane(self, branch, lane, runner):
+        if branch.name == 'dialogue':
+            dialogue_submits.append(self._settled)
+            return False
+        return submit(self, branch, lane, runner)
+
+    monkeypatch.setattr(SpeculativeTurn, '_submit', saturated_dialogue_lane)
+    started = threading.Event()
+    turn = SpeculativeTurn("ciao", STATE, _interpreter({'is_command': False, 'confidence': 0.9}, 0.3),
+                           _generator(started)).start()
+
+    assert turn.resolve().kind == OUTCOME_FALLBACK
+    turn.nlp.join(timeout=2.0)
+    time.sleep(0.05)  # the done-callback runs after the future resolves
+    assert dialogue_submits == [False]  # only the head-start attempt, before settling
+    assert turn.dialogue is None and not started.is_set()
+
+
+def test_timeouts_follow_recent_latencies_within_bounds(monkeypatch):
+    monkeypatch.delenv("NEXUS_SPECULATION_ADAPTIVE", raising=False)
+    monkeypatch.setenv("NEXUS_SPECULATION_DIALOGUE_EXTENDED_WAIT_MAX", "8")
+    tracker = get_global_stats_tracker()
+    assert compute_timeouts("nlp/model", "chat/model").adaptive is False  # no samples yet: static defaults
+
+    for _ in range(10):
+        tracker.record_call("nlp/model", "command_interpretation", {"total_time": 0.4})
+        tracker.record_call("chat/model", "dialogue", {"total_time": 2.0, "time_to_first_token": 0.3})
+    tracker.record_call("other/model", "command_interpretation", {"total_time": 9.0})
+
+    timeouts = compute_timeouts("nlp/model", "chat/model")
+    assert timeouts.adaptive
+    assert timeouts.head_start == pytest.approx(0.4)  # other models' latencies are ignored
+    assert timeouts.nlp_grace == pytest.approx(0.3)   # lower bound
+    assert timeouts.dialogue_wait == pytest.approx(2.0)  # total time, not time to first token
+    assert timeouts.dialogue_extended_wait == pytest.approx(1.0)
+    for _ in range(10):
+        tracker.record_call("chat/model", "dialogue", {"total_time": 30.0})
+    assert compute_timeouts("nlp/model", "chat/model").dialogue_extended_wait == 8.0
+
+
+def test_response_cache_hits_do_not_shrink_the_timeouts(monkeypatch):
+    monkeypatch.delenv("NEXUS_SPECULATION_ADAPTIVE", raising=False)
+    tracker = get_global_stats_tracker()
+    for _ in range(10):
+        tracker.record_call("nlp/model", "command_interpretation", {"total_time": 1.5})
+    for _ in range(40):
+        tracker.record_call("nlp/model", "command_interpretation", {"total_time": 0.0, "cached": True})
+
+    assert compute_timeouts("nlp/model", "chat/model").head_start == pytest.approx(1.5)
@@ -0,0 +1,83 @@
+# token_budget.py
+# Fast local token estimates and token-budgeted selection of the conversation window.
+#
+# Budget for the message window (system prompt excluded):
+#   NEXUS_HISTORY_TOKEN_BUDGET            (4000, 0 = unlimited)
+#   NEXUS_HISTORY_TOKEN_BUDGET_<MODEL>    per-model override, MODEL upper-cased with
+#                                         non-alphanumerics as "_" (e.g. GOOGLE_GEMINI_2_5_FLASH)
+
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+CHARS_PER_TOKEN = 3.5      # Italian/English prose average for BPE tokenizers
+MESSAGE_OVERHEAD_TOKENS = 4  # role and framing tokens per chat message
+
+BREAK_MARKER_PREFIX = "[CONVERSATION_BREAK:"
+RESUMED_MARKER_PREFIX = "[CONVERSATION_RESUMED:"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def estimate_message_tokens(message: Dict[str, Any]) -> int:
+    content = message.get("content", "")
+    if isinstance(content, list):  # content blocks (cache_control format)
+        content = "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return estimate_tokens(str(content)) + MESSAGE_OVERHEAD_TOKENS
+
+
+def history_token_budget(model_name: Optional[str]) -> Optional[int]:
+    """Token budget for the message window of `model_name`, or None for unlimited."""
+    budget = os.environ.get("NEXUS_HISTORY_TOKEN_BUDGET", "4000")
+    if model_name:
+        model_key = re.sub(r"[^A-Z0-9]+", "_", model_name.upper()).strip("_")
+        budget = os.environ.get(f"NEXUS_HISTORY_TOKEN_BUDGET_{model_key}", budget)
+    budget = int(budget)
+    return budget if budget > 0 else None
+
+
+def select_history_window(messages: List[Dict[str, Any]],
+                          budget: Optional[int]) -> Tuple[List[Dict[str, Any]], int, int]:
+    """
+    Picks the most recent messages that fit in `budget` tokens.
+    The latest message is always kept, the window never opens on an assistant reply, and
+    the most recent break/resume markers are carried over even when the turns around
+    them are trimmed. Returns (window, trimmed_tokens, trimmed_messages).
+    """
+    if budget is None or not messages:
+        return list(messages), 0, 0
+
+    costs = [estimate_message_tokens(m) for m in messages]
+    if sum(costs) <= budget:
+        return list(messages), 0, 0
+
+    # The latest BREAK and RESUMED markers tell the NPC the player came back; reserve room for them
+    preserved: List[int] = []
+    for prefix in (RESUMED_MARKER_PREFIX, BREAK_MARKER_PREFIX):
+        for i in range(len(messages) - 1, -1, -1):
+            content = messages[i].get("content")
+            if isinstance(content, str) and content.startswith(prefix):
+                preserved.append(i)
+                break
+    used = sum(costs[i] for i in preserved)
+
+    start = len(messages)
+    while start > 0:
+        i = start - 1
+        if i in preserved:
+            start = i
+            continue
+        if start < len(messages) and used + costs[i] > budget:
+            break
+        used += costs[i]
+        start = i
+    while start < len(messages) - 1 and messages[start].get("role") == "assistant":
+        start += 1
+
+    kept = sorted(set(i for i in preserved if i < start) | set(range(start, len(messages))))
+    window = [messages[i] for i in kept]
+    trimmed = set(range(len(messages))) - set(kept)
+    return window, sum(costs[i] for i in trimmed), len(trimmed)
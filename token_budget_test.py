@@ -0,0 +1,41 @@
+from unittest.mock import patch
+
+from token_budget import estimate_message_tokens, history_token_budget, select_history_window
+
+BREAK = "[CONVERSATION_BREAK: Player left the conversation]"
+RESUMED = "[CONVERSATION_RESUMED: Player returned after a break. Acknowledge the passage of time appropriately.]"
+
+
+def _turn(i):
+    return [{"role": "user", "content": f"domanda {i} " + "x" * 70},
+            {"role": "assistant", "content": f"risposta {i} " + "y" * 70}]
+
+
+def test_window_keeps_recent_turns_within_budget_and_reports_trimmed_tokens():
+    messages = [m for i in range(10) for m in _turn(i)]
+    per_message = estimate_message_tokens(messages[0])
+    window, trimmed_tokens, trimmed_messages = select_history_window(messages, budget=per_message * 5)
+
+    assert window == messages[-4:]  # 5 would fit, but the window may not open on an assistant reply
+    assert trimmed_messages == 16
+    assert trimmed_tokens == sum(estimate_message_tokens(m) for m in messages[:16])
+    assert select_history_window(messages, budget=None) == (messages, 0, 0)
+    assert select_history_window(messages[:1], budget=1)[0] == messages[:1]  # latest message always kept
+
+
+def test_latest_break_and_resume_markers_survive_trimming():
+    messages = ([m for i in range(5) for m in _turn(i)]
+                + [{"role": "user", "content": BREAK}, {"role": "user", "content": RESUMED}]
+                + [m for i in range(5, 10) for m in _turn(i)])
+    budget = sum(estimate_message_tokens(m) for m in messages[-2:] + messages[10:12])
+    window, _, _ = select_history_window(messages, budget)
+
+    assert [m["content"] for m in window[:2]] == [BREAK, RESUMED]
+    assert window[2:] == messages[-2:]
+
+
+def test_budget_has_per_model_override():
+    env = {"NEXUS_HISTORY_TOKEN_BUDGET": "3000", "NEXUS_HISTORY_TOKEN_BUDGET_GOOGLE_GEMINI_2_5_FLASH": "0"}
+    with patch.dict("os.environ", env):
+        assert history_token_budget("openai/gpt-4.1-nano") == 3000
+        assert history_token_budget("google/gemini-2.5-flash") is None
@@ -85,7 +85,9 @@ Reply ONLY with the exact NPC name from the list. If Erasmus is not available, r
             messages=prompt_messages,
             model_name=selector_model, # Use the determined selector model
             stream=False,
-            collect_stats=True
+            collect_stats=True,
+            usage_type="guide_selection",
+            cache=True  # Same story and NPC roster -> same guide on every start
         )
 
         if stats and stats.get("error"):